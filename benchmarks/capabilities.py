@@ -0,0 +1,123 @@
+"""
+Benchmark of GetCapabilities parsing: the incremental load_capabilities parser against the previous approach (a Pyoos
+IoosSweSos collector, building OWSLib's SensorObservationService from the full document tree), on GetCapabilities
+documents synthesized from the stub SOS fixtures (benchmarks/data).  Verifies both produce the same offerings, service
+identification and DescribeSensor URL, and reports the parse time and peak RSS of each (each parsed in a fresh
+process).
+
+Usage: python benchmarks/capabilities.py [--sizes 1000,10000]
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, '..'))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+PARSERS = ['owslib', 'streaming']
+
+URL = 'http://127.0.0.1:8765/{size}/sos?service=SOS&request=GetCapabilities&acceptVersions=1.0.0'
+
+
+def capabilities_document(size):
+    """
+    Returns a GetCapabilities document (bytes) with 'size' offerings.
+    """
+    import stub_sos
+    return stub_sos.StubSOS(inactive_rate=0.1).get_capabilities(URL.format(size=size).split('?')[0], size)
+
+
+def parse(parser, content):
+    """
+    Parses a GetCapabilities document with 'parser', returning the OWSLib SensorObservationService-like object.
+    """
+    url = URL.format(size=0)
+    if parser == 'owslib':
+        from pyoos.collectors.ioos.swe_sos import IoosSweSos
+        return IoosSweSos(url, xml=content).server
+    from sensorml2iso.capabilities import load_capabilities
+    return load_capabilities(url, content)
+
+
+def summary(sos):
+    """
+    Returns the values used from a parsed GetCapabilities document (JSON-serializable).
+    """
+    from sensorml2iso.fetch import describe_sensor_request
+    return {
+        'url': sos.url,
+        'describe_sensor': describe_sensor_request(sos, 'urn:ioos:station:bench:st0000000', 'text/xml'),
+        'identification': [sos.identification.title, sos.identification.abstract, sos.identification.keywords],
+        'contents': sorted(sos.contents),
+        'offerings': [[offering.id, offering.name, str(offering.begin_position), str(offering.end_position),
+                       offering.procedures, offering.observed_properties, offering.response_formats]
+                      for offering in sos.offerings]
+    }
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size (bytes) of the current process, or None if not available.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS:
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def run_parser(parser, size):
+    """
+    Parses a document of 'size' offerings in this process, printing the results (JSON).
+    """
+    # import the parser's dependencies before measuring:
+    parse(parser, capabilities_document(1))
+    content = capabilities_document(size)
+    baseline = peak_rss()
+    start = time.time()
+    sos = parse(parser, content)
+    elapsed = time.time() - start
+    print(json.dumps({'seconds': elapsed, 'peak_rss': peak_rss(), 'baseline_rss': baseline, 'summary': summary(sos)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--sizes', type=str, default='1000,10000',
+                        help='Comma-separated numbers of offerings of the documents to parse.  Default: 1000,10000.')
+    # internal: run a single parser in this process
+    parser.add_argument('--parser', type=str, help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.parser is not None:
+        run_parser(args.parser, args.size)
+        return 0
+
+    print("{parser:<12} {offerings:>9} {seconds:>9} {rss:>14} {growth:>16}".format(
+        parser='parser', offerings='offerings', seconds='seconds', rss='peak RSS (MB)', growth='RSS growth (MB)'))
+    for size in [int(size) for size in args.sizes.split(',')]:
+        results = {}
+        for name in PARSERS:
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--parser', name,
+                                              '--size', str(size)])
+            results[name] = json.load(io.StringIO(output.decode('utf-8')))
+            rss, baseline = results[name]['peak_rss'], results[name]['baseline_rss']
+            print("{parser:<12} {offerings:>9} {seconds:>9.2f} {rss:>14} {growth:>16}".format(
+                parser=name, offerings=size, seconds=results[name]['seconds'],
+                rss='{mb:.1f}'.format(mb=rss / 1048576.0) if rss else 'n/a',
+                growth='{mb:.1f}'.format(mb=(rss - baseline) / 1048576.0) if rss else 'n/a'))
+        if results['owslib']['summary'] != results['streaming']['summary']:
+            print("Mismatch: parsers disagree on the {size} offering document".format(size=size))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
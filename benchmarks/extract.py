@@ -0,0 +1,116 @@
+"""
+Benchmark of per-station SensorML parsing: the single-pass StationSensorML extractor against the previous approach
+(OWSLib's SensorML object, Pyoos' IoosDescribeSensor and nspath_eval lookups on the same tree).  Verifies both produce
+the same station fields.
+
+Usage: python benchmarks/extract.py [SensorML file] [-n iterations]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+from lxml import etree
+
+from owslib.namespaces import Namespaces
+from owslib.swe.sensor.sml import SensorML
+from owslib.util import nspath_eval, testXMLAttribute, testXMLValue
+from pyoos.parsers.ioos.describe_sensor import IoosDescribeSensor
+from pyoos.parsers.ioos.one.describe_sensor import ont
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from sensorml2iso.extract import StationSensorML  # noqa: E402
+
+DEFAULT_SENSORML = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'station_sensorml.xml')
+
+NAMESPACES = Namespaces().get_namespaces(["sml", "gml", "xlink", "swe"])
+
+
+def nsp(path):
+    return nspath_eval(path, NAMESPACES)
+
+
+def legacy_fields(root):
+    """
+    Station fields as extracted before StationSensorML.
+    """
+    sml = SensorML(root)
+    ds = IoosDescribeSensor(sml._root)
+    pos = testXMLValue(ds.system.location.find(nsp('gml:Point/gml:pos'))) \
+        if testXMLValue(ds.system.location.find(nsp('gml:Point/gml:pos'))) is not None \
+        else testXMLValue(ds.system.location.find(nsp('gml:Point/gml:coordinates')))
+    system_el = sml._root.findall(nsp('sml:member'))[0].find(nsp('sml:System'))
+    documents = system_el.findall(nsp('sml:documentation/sml:DocumentList/sml:member'))
+    contacts = system_el.findall(nsp('sml:contact/sml:ContactList/sml:member')) \
+        if system_el.findall(nsp('sml:contact/sml:ContactList/sml:member')) \
+        else system_el.findall(nsp('sml:contact'))
+    return {
+        'pos': pos,
+        'documents': [testXMLAttribute(d, 'name') for d in documents],
+        'contacts': [testXMLAttribute(c, nsp('xlink:role')) for c in contacts],
+        'output_quantities': [q.attrib['definition'] for q in system_el.findall(nsp('sml:outputs/sml:OutputList/sml:output/swe:Quantity'))],
+        'begin_position': testXMLValue(system_el.find(nsp('sml:validTime/gml:TimePeriod/gml:beginPosition'))),
+        'shortName': ds.shortName,
+        'longName': ds.longName,
+        'wmoID': ds.get_ioos_def('wmoID', 'identifier', ont),
+        'platformType': ds.platformType,
+        'parentNetwork': ds.get_ioos_def('parentNetwork', 'classifier', ont),
+        'sponsor': ds.get_ioos_def('sponsor', 'classifier', ont),
+        'starting': ds.starting,
+        'ending': ds.ending,
+        'variables': ds.variables
+    }
+
+
+def extractor_fields(root):
+    """
+    Station fields as extracted by StationSensorML.
+    """
+    ds = StationSensorML(root)
+    return {
+        'pos': ds.pos,
+        'documents': [testXMLAttribute(d, 'name') for d in ds.documents],
+        'contacts': [testXMLAttribute(c, nsp('xlink:role')) for c in ds.contacts],
+        'output_quantities': ds.output_quantities,
+        'begin_position': ds.begin_position,
+        'shortName': ds.shortName,
+        'longName': ds.longName,
+        'wmoID': ds.get_ioos_def('wmoID', 'identifier'),
+        'platformType': ds.platformType,
+        'parentNetwork': ds.get_ioos_def('parentNetwork', 'classifier'),
+        'sponsor': ds.get_ioos_def('sponsor', 'classifier'),
+        'starting': ds.starting,
+        'ending': ds.ending,
+        'variables': ds.variables
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('sensorml', nargs='?', default=DEFAULT_SENSORML,
+                        help='DescribeSensor response to parse.  Default: {path}'.format(path=DEFAULT_SENSORML))
+    parser.add_argument('-n', '--iterations', type=int, default=2000, help='Number of parses to time.  Default: 2000.')
+    args = parser.parse_args()
+
+    with open(args.sensorml, 'rb') as f:
+        root = etree.fromstring(f.read())
+
+    legacy = legacy_fields(root)
+    extracted = extractor_fields(root)
+    if legacy != extracted:
+        for key in sorted(legacy):
+            if legacy[key] != extracted[key]:
+                print("Mismatch: {key}: {legacy!r} != {extracted!r}".format(key=key, legacy=legacy[key], extracted=extracted[key]))
+        return 1
+
+    legacy_time = min(timeit.repeat(lambda: legacy_fields(root), number=args.iterations, repeat=3)) / args.iterations
+    extractor_time = min(timeit.repeat(lambda: extractor_fields(root), number=args.iterations, repeat=3)) / args.iterations
+    print("Per-station parse cost (fields identical):")
+    print("  OWSLib SensorML + IoosDescribeSensor: {t:8.1f} us".format(t=legacy_time * 1e6))
+    print("  StationSensorML:                      {t:8.1f} us".format(t=extractor_time * 1e6))
+    print("  Speedup: {speedup:.1f}x".format(speedup=legacy_time / extractor_time))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,307 @@
+"""
+Offline stub SOS serving recorded GetCapabilities and DescribeSensor fixtures (benchmarks/data), for benchmarking
+sensorml2iso without live IOOS/NDBC servers.
+
+Services of any size are synthesized from the fixtures: http://HOST:PORT/<N>/sos is a SOS with N stations
+(urn:ioos:station:bench:st0000000 ...).  Responses can be delayed (latency plus random jitter), a fraction of
+DescribeSensor requests can fail with an OWS 1.1 ExceptionReport (the same stations on every run), a fraction of all
+requests can fail transiently with '503 Service Unavailable', requests beyond '--capacity' concurrent requests fail
+with '503 Service Unavailable' as an overloaded server would, a fraction of stations can be inactive (observations
+ending years ago, in both their offering and SensorML), and '--ndbc' rejects the IOOS SOS profile outputFormat with an
+ExceptionReport as NDBC does.  XML responses are sent as 'text/xml;charset=UTF-8', as by real SOS servers, and are
+gzip-compressed for clients accepting it.  http://HOST:PORT/stats returns request counts and bytes sent as JSON.
+
+Usage: python benchmarks/stub_sos.py [--port 8765] [--latency 0.05] [--jitter 0.02] [--error_rate 0.01]
+                                     [--transient_rate 0.05] [--capacity 4] [--inactive_rate 0.3] [--ndbc]
+"""
+import argparse
+import gzip
+import io
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer  # Python 3
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer  # Python 2
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# the station the recorded DescribeSensor fixture describes (replaced with the requested station):
+FIXTURE_URN = 'urn:ioos:station:test:st0001'
+FIXTURE_ID = 'st0001'
+# the end of the fixture's observationTimeRange (replaced for inactive stations):
+FIXTURE_END = '2026-10-16T00:00:00Z'
+
+# the end of inactive stations' observations:
+INACTIVE_END = '2019-01-01T00:00:00Z'
+
+IOOS_PROFILE_FORMAT = 'profiles/ioos_sos'
+
+# the Content-Type of XML responses, charset-qualified as real SOS servers (eg. 52North) send it:
+XML_CONTENT_TYPE = 'text/xml;charset=UTF-8'
+
+EXCEPTION_REPORT = (
+    u'<?xml version="1.0" encoding="UTF-8"?>\n'
+    u'<ows:ExceptionReport xmlns:ows="http://www.opengis.net/ows/1.1" version="1.0.0">'
+    u'<ows:Exception exceptionCode="{code}" locator="{locator}"><ows:ExceptionText>{text}</ows:ExceptionText>'
+    u'</ows:Exception></ows:ExceptionReport>'
+)
+
+SERVICE_PATH = re.compile(r'^/(\d+)/sos/?$')
+
+
+def read_fixture(name):
+    """
+    """
+    with io.open(os.path.join(DATA_DIR, name), mode='rt', encoding='utf-8') as f:
+        return f.read()
+
+
+def station_urn(index):
+    """
+    Returns the URN of a synthesized station.
+    """
+    return 'urn:ioos:station:bench:st{index:07d}'.format(index=index)
+
+
+class StubSOS:
+    """
+    Generates the stub's responses from the fixtures.
+
+    Attributes
+    ----------
+    latency : float
+        Seconds each response is delayed by.
+    jitter : float
+        Maximum additional random delay (seconds) of each response.
+    error_rate : float
+        Fraction of stations whose DescribeSensor requests fail.
+    transient_rate : float
+        Fraction of requests (at random) failing with '503 Service Unavailable'.
+    capacity : int
+        Maximum number of concurrent requests served, beyond which requests fail with '503 Service Unavailable'
+        (unlimited if None).
+    inactive_rate : float
+        Fraction of stations whose observations ended years ago.
+    ndbc : bool
+        Reject the IOOS SOS profile DescribeSensor outputFormat (as NDBC does).
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, transient_rate=0.0, capacity=None, inactive_rate=0.0,
+                 ndbc=False):
+        """
+        """
+        self.capacity = capacity
+        self.inactive_rate = inactive_rate
+        self.in_flight = 0
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.transient_rate = transient_rate
+        self.ndbc = ndbc
+        self.capabilities_template = read_fixture('capabilities.xml')
+        self.offering_template = read_fixture('offering.xml')
+        self.sensorml_template = read_fixture('station_sensorml.xml')
+        self.capabilities = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def count(self, name, n=1):
+        """
+        """
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def enter(self):
+        """
+        Starts serving a request.  Returns False if the stub is over capacity.
+        """
+        with self.lock:
+            self.in_flight += 1
+            self.counts['max_in_flight'] = max(self.counts.get('max_in_flight', 0), self.in_flight)
+            return self.capacity is None or self.in_flight <= self.capacity
+
+    def exit(self):
+        """
+        """
+        with self.lock:
+            self.in_flight -= 1
+
+    def delay(self):
+        """
+        """
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def inactive(self, procedure):
+        """
+        Returns whether a station is inactive (the same stations on every run).
+        """
+        return random.Random('inactive:' + procedure).random() < self.inactive_rate
+
+    def get_capabilities(self, url, stations):
+        """
+        Returns the GetCapabilities document of the service with 'stations' stations (generated once per size).
+        """
+        with self.lock:
+            document = self.capabilities.get(stations)
+        if document is None:
+            # active stations have observations up to the present, so the active station filter keeps them:
+            end = (datetime.utcnow() + timedelta(days=1)).strftime('%Y-%m-%dT00:00:00Z')
+            offerings = u"".join(self.offering_template.format(id='o{index}'.format(index=index), urn=station_urn(index),
+                                                               end=INACTIVE_END if self.inactive(station_urn(index)) else end)
+                                 for index in range(stations))
+            document = self.capabilities_template.format(url=url, offerings=offerings).encode('utf-8')
+            with self.lock:
+                self.capabilities[stations] = document
+        return document
+
+    def describe_sensor(self, procedure, output_format):
+        """
+        Returns the DescribeSensor response for a station, or an ExceptionReport for failing stations and formats.
+        """
+        if self.ndbc and IOOS_PROFILE_FORMAT in output_format:
+            self.count('describe_sensor_format_errors')
+            return EXCEPTION_REPORT.format(code='InvalidParameterValue', locator='outputFormat',
+                                           text='Invalid outputFormat').encode('utf-8')
+        if random.Random(procedure).random() < self.error_rate:
+            self.count('describe_sensor_errors')
+            return EXCEPTION_REPORT.format(code='NoApplicableCode', locator='procedure',
+                                           text='Unable to describe sensor').encode('utf-8')
+        station_id = procedure.split(':')[-1]
+        sensorml = self.sensorml_template.replace(FIXTURE_URN, procedure).replace(FIXTURE_ID, station_id)
+        if self.inactive(procedure):
+            self.count('describe_sensor_inactive')
+            sensorml = sensorml.replace(FIXTURE_END, INACTIVE_END)
+        return sensorml.encode('utf-8')
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def compress(content):
+    """
+    Returns 'content' gzip-compressed.
+    """
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+        f.write(content)
+    return buf.getvalue()
+
+
+def make_handler(stub):
+    """
+    Returns the request handler class serving 'stub'.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, *args):
+            pass
+
+        def send(self, status, content, content_type=XML_CONTENT_TYPE):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                content = compress(content)
+                self.send_header('Content-Encoding', 'gzip')
+            stub.count('bytes_sent', len(content))
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/stats':
+                with stub.lock:
+                    counts = dict(stub.counts)
+                return self.send(200, json.dumps(counts, sort_keys=True).encode('utf-8'), 'application/json')
+
+            match = SERVICE_PATH.match(url.path)
+            if match is None:
+                return self.send(404, b'Not found', 'text/plain')
+
+            params = dict((key.lower(), values[0]) for key, values in parse_qs(url.query).items())
+            request = params.get('request', '').lower()
+            try:
+                over_capacity = not stub.enter()
+                stub.delay()
+            finally:
+                stub.exit()
+            if over_capacity:
+                stub.count('overload_errors')
+                return self.send(503, b'Service Unavailable', 'text/plain')
+            if random.random() < stub.transient_rate:
+                stub.count('transient_errors')
+                return self.send(503, b'Service Unavailable', 'text/plain')
+            if request == 'getcapabilities':
+                stub.count('get_capabilities')
+                service_url = 'http://{host}{path}'.format(host=self.headers.get('Host'), path=url.path)
+                return self.send(200, stub.get_capabilities(service_url, int(match.group(1))))
+            if request == 'describesensor':
+                stub.count('describe_sensor')
+                return self.send(200, stub.describe_sensor(params.get('procedure', ''), params.get('outputformat', '')))
+            return self.send(200, EXCEPTION_REPORT.format(code='OperationNotSupported', locator='request',
+                                                          text='Unsupported request').encode('utf-8'))
+
+    return Handler
+
+
+def start(port=0, host='127.0.0.1', **kwargs):
+    """
+    Starts a stub SOS server in a background thread ('kwargs' are StubSOS parameters).  Returns the server, whose
+    port is server.server_address[1] (a free port is used if 'port' is 0).
+    """
+    server = StubServer((host, port), make_handler(StubSOS(**kwargs)))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on.  Default: 127.0.0.1.')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on.  Default: 8765.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds each response is delayed by.  Default: 0.')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Maximum additional random delay (seconds) of each response.  Default: 0.')
+    parser.add_argument('--error_rate', type=float, default=0.0,
+                        help='Fraction of stations whose DescribeSensor requests fail.  Default: 0.')
+    parser.add_argument('--transient_rate', type=float, default=0.0,
+                        help='Fraction of requests failing transiently with \'503 Service Unavailable\'.  Default: 0.')
+    parser.add_argument('--capacity', type=int,
+                        help='Maximum number of concurrent requests served, beyond which requests fail with \'503 Service Unavailable\'.  Default: unlimited.')
+    parser.add_argument('--inactive_rate', type=float, default=0.0,
+                        help='Fraction of stations whose observations ended years ago.  Default: 0.')
+    parser.add_argument('--ndbc', action='store_true',
+                        help='Reject the IOOS SOS profile DescribeSensor outputFormat, as NDBC does.')
+    args = parser.parse_args()
+
+    server = StubServer((args.host, args.port),
+                        make_handler(StubSOS(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                             transient_rate=args.transient_rate, capacity=args.capacity,
+                                             inactive_rate=args.inactive_rate, ndbc=args.ndbc)))
+    print("Stub SOS listening on http://{host}:{port}/<stations>/sos".format(host=args.host, port=args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+Throughput benchmark of sensorml2iso against the offline stub SOS (benchmarks/stub_sos.py): reports stations/sec and
+peak RSS of harvesting station records (Sensorml2Iso.get_station_records), rendering and writing ISO records
+(Sensorml2Iso.generate_iso) and end-to-end harvests (Sensorml2Iso.run), for services of each of the given sizes.
+
+Each phase runs in a fresh process, so peak RSS is that of the phase (the 'generate_iso' phase harvests its station
+records first, untimed, so its peak RSS includes them).
+
+Usage: python benchmarks/throughput.py [--sizes 10,1000,10000] [--latency 0.0] [--workers 8] [--json results.json]
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, '..'))
+
+PHASES = ['get_station_records', 'generate_iso', 'run']
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size (bytes) of the current process, or None if not available.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS:
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def run_phase(args):
+    """
+    Runs a single phase in this process, writing its results (JSON) to 'args.result'.
+    """
+    from sensorml2iso.batch import service_kwargs
+    from sensorml2iso.sensorml2iso import Sensorml2Iso
+
+    work_dir = tempfile.mkdtemp(prefix='sensorml2iso-benchmark-')
+    try:
+        os.chdir(work_dir)
+        s2i = Sensorml2Iso(workers=args.workers,
+                           **service_kwargs({'service': args.url, 'output_dir': 'out', 'force': True,
+                                             'host_limit': args.host_limit, 'render_workers': args.render_workers}))
+        s2i.namespaces = s2i.get_namespaces()
+
+        if args.phase == 'get_station_records':
+            start = time.time()
+            stations = s2i.get_station_records(s2i.service) or []
+            elapsed = time.time() - start
+            s2i.fetcher.close()
+        elif args.phase == 'generate_iso':
+            stations = s2i.get_station_records(s2i.service) or []
+            s2i.fetcher.close()
+            start = time.time()
+            s2i.generate_iso(stations)
+            elapsed = time.time() - start
+        else:
+            start = time.time()
+            s2i.run()
+            elapsed = time.time() - start
+            stations = [name for name in os.listdir('out') if name.endswith('.xml')]
+
+        result = {'stations': len(stations), 'seconds': elapsed, 'peak_rss': peak_rss()}
+    finally:
+        os.chdir(BENCHMARKS_DIR)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.result, 'w') as f:
+        json.dump(result, f)
+
+
+def benchmark(url, phase, args):
+    """
+    Runs a phase in a child process.  Returns its results.
+    """
+    fd, result_path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        with open(os.devnull, 'w') as devnull:
+            subprocess.check_call([sys.executable, os.path.abspath(__file__), '--phase', phase, '--url', url,
+                                   '--result', result_path, '--workers', str(args.workers), '--host_limit', str(args.host_limit),
+                                   '--render_workers', str(args.render_workers)], stdout=devnull, stderr=devnull)
+        with io.open(result_path, mode='rt', encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        os.remove(result_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0])
+    parser.add_argument('--sizes', type=str, default='10,1000,10000',
+                        help='Comma-separated numbers of stations of the services to benchmark.  Default: 10,1000,10000.')
+    parser.add_argument('--phases', type=str, default=','.join(PHASES),
+                        help='Comma-separated phases to benchmark.  Default: {phases}.'.format(phases=','.join(PHASES)))
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds each stub response is delayed by.  Default: 0.')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Maximum additional random delay (seconds) of each stub response.  Default: 0.')
+    parser.add_argument('--error_rate', type=float, default=0.0,
+                        help='Fraction of stations whose DescribeSensor requests fail.  Default: 0.')
+    parser.add_argument('--transient_rate', type=float, default=0.0,
+                        help='Fraction of stub requests failing transiently with \'503 Service Unavailable\'.  Default: 0.')
+    parser.add_argument('--capacity', type=int,
+                        help='Maximum number of concurrent requests the stub serves, beyond which it responds \'503 Service Unavailable\'.  Default: unlimited.')
+    parser.add_argument('--ndbc', action='store_true',
+                        help='Stub rejects the IOOS SOS profile DescribeSensor outputFormat, as NDBC does.')
+    parser.add_argument('--workers', type=int, default=8, help='Number of concurrent DescribeSensor requests.  Default: 8.')
+    parser.add_argument('--host_limit', type=int, default=4,
+                        help='Maximum number of concurrent DescribeSensor requests to the stub.  Default: 4.')
+    parser.add_argument('--render_workers', type=int, default=1, help='Number of rendering processes.  Default: 1.')
+    parser.add_argument('--json', type=str, help='Path of a JSON file to write the results to.')
+    # internal: run a single phase in this process
+    parser.add_argument('--phase', type=str, help=argparse.SUPPRESS)
+    parser.add_argument('--url', type=str, help=argparse.SUPPRESS)
+    parser.add_argument('--result', type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase is not None:
+        run_phase(args)
+        return 0
+
+    import stub_sos
+    server = stub_sos.start(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                            transient_rate=args.transient_rate, capacity=args.capacity, ndbc=args.ndbc)
+    port = server.server_address[1]
+
+    results = []
+    print("{phase:<20} {stations:>9} {seconds:>9} {rate:>11} {rss:>14}".format(
+        phase='phase', stations='stations', seconds='seconds', rate='stations/s', rss='peak RSS (MB)'))
+    try:
+        for size in [int(size) for size in args.sizes.split(',')]:
+            url = 'http://127.0.0.1:{port}/{size}/sos'.format(port=port, size=size)
+            for phase in args.phases.split(','):
+                result = benchmark(url, phase, args)
+                result.update({'phase': phase, 'size': size})
+                results.append(result)
+                print("{phase:<20} {stations:>9} {seconds:>9.2f} {rate:>11.1f} {rss:>14}".format(
+                    phase=phase, stations=result['stations'], seconds=result['seconds'],
+                    rate=result['stations'] / result['seconds'] if result['seconds'] else 0.0,
+                    rss='{mb:.1f}'.format(mb=result['peak_rss'] / 1048576.0) if result['peak_rss'] else 'n/a'))
+    finally:
+        server.shutdown()
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
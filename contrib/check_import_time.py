@@ -0,0 +1,55 @@
+"""
+Import-time budget check for the sensorml2iso command line interface, run in CI.
+
+Short cron runs, argument errors, 'sensorml2iso --help' and container health checks must not pay for importing the
+harvesting dependencies, which take seconds.  This fails if importing sensorml2iso.command_line loads any of
+HEAVY_MODULES, or takes longer than BUDGET seconds over bare interpreter startup (best of RUNS runs).
+
+Usage: python contrib/check_import_time.py
+"""
+import subprocess
+import sys
+import time
+
+# seconds allowed for 'import sensorml2iso.command_line', beyond interpreter startup:
+BUDGET = 0.25
+RUNS = 5
+
+HEAVY_MODULES = ['pandas', 'owslib', 'pyoos', 'lxml', 'jinja2', 'requests', 'aiohttp', 'dateutil', 'pytz']
+
+
+def best_time(code):
+    """
+    Returns the fastest wall time (seconds) of RUNS fresh interpreters running 'code'.
+    """
+    times = []
+    for run in range(RUNS):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', code])
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    if sys.version_info < (3, 5):
+        print("Skipping import-time check: the package imports Sensorml2Iso eagerly in Python 2.")
+        return 0
+
+    loaded = subprocess.check_output([sys.executable, '-c', (
+        "import sys, sensorml2iso.command_line; "
+        "print(' '.join(sorted(set(m.split('.')[0] for m in sys.modules) & set({heavy!r}))))"
+    ).format(heavy=HEAVY_MODULES)]).decode('utf-8').split()
+    if loaded:
+        print("Error: importing sensorml2iso.command_line loads: {modules}".format(modules=", ".join(loaded)))
+        return 1
+
+    elapsed = best_time('import sensorml2iso.command_line') - best_time('pass')
+    print("sensorml2iso.command_line import time: {elapsed:.3f}s (budget: {budget:.3f}s)".format(elapsed=elapsed, budget=BUDGET))
+    if elapsed > BUDGET:
+        print("Error: import-time budget exceeded.")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
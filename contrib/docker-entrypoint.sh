@@ -8,9 +8,14 @@ done
 
 
 if [[ $# -eq 0 ]]; then
-    rsyslogd
-    cron
-    exec tail -f /var/log/syslog
+    # harvest the services of config.json on their schedules, in a long-running 'sensorml2iso serve' process (or
+    # from cron, one process per service and run, with SENSORML2ISO_SCHEDULER=cron):
+    if [[ "${SENSORML2ISO_SCHEDULER:-serve}" == "cron" ]]; then
+        rsyslogd
+        cron
+        exec tail -f /var/log/syslog
+    fi
+    exec /sbin/setuser app sensorml2iso serve --config /etc/sensorml2iso/config.json --resume ${SENSORML2ISO_SERVE_ARGS:-}
 fi
 
 exec /sbin/setuser app sensorml2iso "$@"
@@ -1,4 +1,28 @@
-from .sensorml2iso import Sensorml2Iso
-from . import command_line
+import sys
+import types
 
-__all__ = [Sensorml2Iso, command_line]
+
+class _LazyModule(types.ModuleType):
+    """
+    Package module type importing Sensorml2Iso (and its slow to import OWSLib and lxml dependencies) on first
+    access rather than with the package, so eg. 'sensorml2iso --help' starts quickly.
+    """
+
+    def __getattr__(self, name):
+        if name == 'Sensorml2Iso':
+            from .sensorml2iso import Sensorml2Iso
+            return Sensorml2Iso
+        if name == 'command_line':
+            from . import command_line
+            return command_line
+        raise AttributeError("module {module!r} has no attribute {name!r}".format(module=self.__name__, name=name))
+
+
+if sys.version_info >= (3, 5):
+    sys.modules[__name__].__class__ = _LazyModule
+else:
+    # module types can't be changed in Python 2:
+    from .sensorml2iso import Sensorml2Iso
+    from . import command_line
+
+__all__ = ['Sensorml2Iso', 'command_line']
@@ -0,0 +1,277 @@
+"""
+asyncio harvesting engine ('--engine asyncio').  Requires Python 3.5+ and the aiohttp package.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from lxml import etree
+
+from owslib.ows import ExceptionReport
+from owslib.util import ServiceException
+from requests.exceptions import RequestException
+
+from .capabilities import load_capabilities
+from .fetch import check_status, describe_sensor_request
+from .session import ACCEPT_ENCODING, RETRY_STATUS
+
+
+class AsyncHostLimiter:
+    """
+    asyncio counterpart of a HostLimiter: caps the requests in flight to a SOS host on the event loop at the
+    concurrency limit of the fetcher's HostLimiter for the host, whose AIMDController it shares (so the limit learned
+    carries over between harvests and engines).
+
+    Attributes
+    ----------
+    limiter : HostLimiter
+        The fetcher's HostLimiter for the host.
+    """
+
+    def __init__(self, limiter):
+        """
+        """
+        self.limiter = limiter
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        """
+        Waits until a request to the host may start.
+        """
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < self.limiter.controller.concurrency)
+            self.in_flight += 1
+        delay = self.limiter.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def release(self, latency=None, failed=False):
+        """
+        Ends a request started with acquire, recording its outcome.
+        """
+        self.limiter.feedback(latency, failed)
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+
+class AsyncHarvester:
+    """
+    Performs every SOS request of a harvest (GetCapabilities, DescribeSensor per station and output format
+    fallbacks) on a single asyncio event loop, handing XML parsing off to an executor.
+
+    Attributes
+    ----------
+    s2i : Sensorml2Iso
+        The Sensorml2Iso instance the harvest is run for (used for logging and reporting).
+    workers : int
+        Maximum number of requests in flight at once.
+    host_limit : int
+        Maximum number of concurrent requests against any single SOS host (capped further by the fetcher's
+        HostLimiter for the host).
+    timeout : int
+        Timeout (seconds) applied to each individual request.
+    """
+
+    def __init__(self, s2i, workers=8, host_limit=4, timeout=200):
+        """
+        """
+        self.s2i = s2i
+        self.workers = workers
+        self.host_limit = host_limit
+        self.timeout = timeout
+        self.limiters = {}
+
+    def run(self, sos_url, sos_url_params, station_urns_sel, oFrmts):
+        """
+        Runs the harvest to completion.  Returns the same values as Sensorml2Iso.get_sensorml.
+        """
+        loop = asyncio.new_event_loop()
+        executor = ThreadPoolExecutor()
+        loop.set_default_executor(executor)
+        try:
+            return loop.run_until_complete(self.harvest(loop, sos_url, sos_url_params, station_urns_sel, oFrmts))
+        finally:
+            loop.close()
+            executor.shutdown()
+
+    async def harvest(self, loop, sos_url, sos_url_params, station_urns_sel, oFrmts):
+        """
+        """
+        # requests per host are capped by the host limiters (whose ceiling may be above 'host_limit'):
+        connector = aiohttp.TCPConnector(limit=self.workers)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers={'Accept-Encoding': ACCEPT_ENCODING}) as session:
+            cache = self.s2i.capabilities_cache
+            capabilities_start = time.time()
+            try:
+                headers = cache.request_headers(sos_url_params) if cache is not None else {}
+                status, headers, content = await self.get(session, sos_url_params, headers=headers)
+                check_status(status, content)
+            except (aiohttp.ClientError, asyncio.TimeoutError, RequestException) as e:
+                self.s2i.exit_connection_error(sos_url_params, e)
+            content = self.s2i.resolve_capabilities(sos_url_params, status, headers, content)
+            sosgc = await loop.run_in_executor(None, load_capabilities, sos_url_params, content)
+            await loop.run_in_executor(None, self.s2i.diff_capabilities, sosgc)
+            self.s2i.metrics.add('capabilities', time.time() - capabilities_start)
+            describe_sensor_start = time.time()
+
+            sml_recs = {}
+            sml_formats = {}
+            sml_errors = {}
+            describe_sensor_url = {}
+
+            if station_urns_sel is not None:
+                station_urns = self.s2i.stations_to_fetch(sosgc, station_urns_sel)
+                # request the rest in the first station's outputFormat first if not known yet, as in the threaded engine:
+                results = []
+                if station_urns and self.s2i.format_memo.get(sos_url) is None:
+                    results.append(await self.fetch_sensorml(loop, session, sosgc, station_urns[0], oFrmts))
+                    oFrmts = self.s2i.prefer_output_format(oFrmts, [fmt for sml, fmt, errors in results if sml is not None])
+                results.extend(await asyncio.gather(*[self.fetch_sensorml(loop, session, sosgc, station_urn, oFrmts)
+                                                      for station_urn in station_urns[len(results):]]))
+                for station_urn, (sml, fmt, errors) in zip(station_urns, results):
+                    describe_sensor_url[station_urn] = self.s2i.generate_describe_sensor_url(sosgc, procedure=station_urn, oFrmt=fmt)
+                    if errors:
+                        sml_errors[station_urn] = errors[-1]
+                    if sml is not None:
+                        sml_recs[station_urn] = sml
+                        sml_formats[station_urn] = fmt
+            else:
+                station_urns = self.s2i.get_station_urns(sosgc)
+                self.s2i.report_stations(sos_url_params, station_urns)
+                station_urns = self.s2i.stations_to_fetch(sosgc, station_urns)
+
+                # try each oFrmt for the whole service until one returns valid SensorML documents, as is done in the
+                # threaded engine:
+                for fmt_idx, fmt in enumerate(oFrmts):
+                    if fmt_idx > 0:
+                        self.s2i.metrics.count('describe_sensor_format_retries', len(station_urns))
+                    results = await asyncio.gather(*[self.fetch_sensorml(loop, session, sosgc, station_urn, [fmt])
+                                                     for station_urn in station_urns])
+                    sml_recs = {}
+                    sml_formats = {}
+                    sml_errors = {}
+                    for station_urn, (sml, _, errors) in zip(station_urns, results):
+                        if sml is not None:
+                            sml_recs[station_urn] = sml
+                            sml_formats[station_urn] = fmt
+                        else:
+                            sml_errors[station_urn] = errors[-1]
+                    if not sml_recs:
+                        continue
+                    for station in station_urns:
+                        describe_sensor_url[station] = self.s2i.generate_describe_sensor_url(sosgc, procedure=station, oFrmt=fmt)
+                    self.s2i.report_sensorml_errors(sos_url_params, sml_errors)
+                    break
+                else:
+                    # no oFrmt returned valid SensorML, record the DescribeSensor URLs of the first for the failures:
+                    for station in station_urns:
+                        describe_sensor_url[station] = self.s2i.generate_describe_sensor_url(sosgc, procedure=station, oFrmt=oFrmts[0])
+
+            self.s2i.metrics.add('describe_sensor', time.time() - describe_sensor_start)
+
+        return sosgc, station_urns, sml_recs, sml_formats, sml_errors, describe_sensor_url
+
+    async def fetch_sensorml(self, loop, session, sos, procedure, output_formats):
+        """
+        Asynchronous equivalent of Sensorml2Iso.fetch_sensorml (reusing the SensorML journaled by the interrupted run
+        being resumed, and journaling the outcome).
+        """
+        journal = self.s2i.journal
+        journaled = journal.get_sensorml(procedure, output_formats)
+        if journaled is not None:
+            self.s2i.metrics.count('describe_sensor_resumed')
+            return journaled[0], journaled[1], []
+        sml, fmt, errors = await self.describe_sensor(loop, session, sos, procedure, output_formats,
+                                                      self.s2i.max_age(procedure))
+        await loop.run_in_executor(None, journal.fetched, procedure, fmt, sml, errors)
+        return sml, fmt, errors
+
+    async def describe_sensor(self, loop, session, sos, procedure, output_formats, max_age=None):
+        """
+        Asynchronous equivalent of DescribeSensorFetcher.fetch_sensorml.
+        """
+        fetcher = self.s2i.fetcher
+        metrics = self.s2i.metrics
+        errors = []
+        for fmt in output_formats:
+            if errors:
+                metrics.count('describe_sensor_format_retries')
+            base_url, params = describe_sensor_request(sos, procedure, fmt)
+            try:
+                headers = {}
+                if fetcher.cache is not None:
+                    content, headers = await loop.run_in_executor(None, fetcher.cache.get, sos.url, procedure,
+                                                                  fmt, max_age)
+                    if content is not None:
+                        metrics.count('describe_sensor_cache_hits')
+                        tree = await loop.run_in_executor(None, etree.fromstring, content)
+                        return tree, fmt, errors
+                status, headers, content = await self.get(session, base_url.rstrip('?'), params=params,
+                                                          headers=headers, observe=True)
+                if status == 304:
+                    metrics.count('describe_sensor_not_modified')
+                try:
+                    tree = await loop.run_in_executor(None, fetcher.resolve, sos, procedure, fmt, status, headers,
+                                                      content)
+                except ServiceException:
+                    # the SOS is refusing requests, back off:
+                    fetcher.host_limiter(base_url).feedback(failed=True)
+                    raise
+                return tree, fmt, errors
+            except (ServiceException, ExceptionReport, RequestException) as e:
+                errors.append(str(e))
+                metrics.count('describe_sensor_failures')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                errors.append(str(e) or e.__class__.__name__)
+                metrics.count('describe_sensor_failures')
+        return None, fmt, errors
+
+    async def get(self, session, url, params=None, headers=None, observe=False):
+        """
+        Issues a GET request, retrying transient failures (connection errors, timeouts and RETRY_STATUS responses)
+        with the fetcher's RetryPolicy, as DescribeSensorFetcher.get does.  Request latencies are recorded if
+        'observe'.  Returns a tuple (status code, response headers, response body).
+        """
+        policy = self.s2i.fetcher.retry_policy
+        metrics = self.s2i.metrics
+        limiter = self.host_limiter(url)
+        attempt = 0
+        while True:
+            await limiter.acquire()
+            start = time.time()
+            failed = True
+            try:
+                async with session.get(url, params=params, headers=headers) as response:
+                    content = await response.read()
+                failed = response.status >= 500 or response.status == 429
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError):
+                if attempt >= policy.retries:
+                    raise
+                wait = policy.delay(attempt)
+            else:
+                if response.status not in RETRY_STATUS or attempt >= policy.retries:
+                    return response.status, response.headers, content
+                wait = policy.delay(attempt, response.headers.get('Retry-After'))
+            finally:
+                latency = time.time() - start
+                await limiter.release(latency, failed)
+                if observe:
+                    metrics.observe_request(latency)
+            metrics.count('http_retries')
+            await asyncio.sleep(wait)
+            attempt += 1
+
+    def host_limiter(self, url):
+        """
+        Returns the AsyncHostLimiter of the host of 'url' (created on the event loop on first use).
+        """
+        limiter = self.s2i.fetcher.host_limiter(url)
+        async_limiter = self.limiters.get(id(limiter))
+        if async_limiter is None:
+            async_limiter = self.limiters[id(limiter)] = AsyncHostLimiter(limiter)
+        return async_limiter
@@ -0,0 +1,356 @@
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import traceback
+from multiprocessing.pool import ThreadPool
+
+try:
+    from urllib.parse import urlparse  # Python 3
+except ImportError:
+    from urlparse import urlparse  # Python 2
+
+from .cache import DEFAULT_CACHE_DIR, OutputFormatMemo, SensorMLCache
+from .capabilities import CapabilitiesCache
+
+DEFAULT_RESPONSE_FORMATS = ['application/json', 'text/xml; subtype="om/1.0.0/profiles/ioos_sos/1.0"']
+
+
+def load_config(path):
+    """
+    Returns the list of service entries in a sensorml2iso config.json file (the format used by the Docker image).
+    """
+    with io.open(path, mode='rt', encoding='utf-8') as f:
+        config = json.load(f)
+    if not isinstance(config, list):
+        raise ValueError("config file {path} must contain a list of service entries".format(path=path))
+    return config
+
+
+def entry_name(config_entry):
+    """
+    Returns the name of the log, CSV and metrics files of a config.json service entry: its server plus a hash of its
+    service URL and output directory, so entries for services on the same server (or for the same service, with other
+    output directories) never write the same files.
+    """
+    service = config_entry.get('service') or u""
+    key = hashlib.sha1(u"|".join([service, config_entry.get('output_dir') or u""]).encode('utf-8')).hexdigest()[:8]
+    return "{server}-{key}".format(server=urlparse(service).netloc.replace(":", "_"), key=key)
+
+
+def service_kwargs(config_entry):
+    """
+    Returns Sensorml2Iso keyword arguments for a config.json service entry, applying the command line defaults.
+    Raises ValueError for invalid entries.
+    """
+    service = config_entry.get('service')
+    service_url = urlparse(service or '')
+    if not service_url.scheme or not service_url.netloc:
+        raise ValueError("'service' value must contain a valid URL.  Value passed: {param}".format(param=service))
+    if service_url.params or service_url.query:
+        raise ValueError("'service' value should not contain query parameters ('{query}').  Value passed: {param}".format(query=service_url.query, param=service))
+
+    sos_type = config_entry.get('sos_type', 'ioos').lower()
+    if sos_type not in ['ioos', 'ndbc', 'coops']:
+        raise ValueError("'sos_type' value must be one of 'ioos', 'ndbc', or 'coops'.  Value passed: {param}".format(param=sos_type))
+
+    engine = config_entry.get('engine', 'threads').lower()
+    if engine not in ['threads', 'asyncio']:
+        raise ValueError("'engine' value must be one of 'threads' or 'asyncio'.  Value passed: {param}".format(param=engine))
+    if engine == 'asyncio':
+        try:
+            import aiohttp
+        except ImportError:
+            raise ValueError("'engine' value 'asyncio' requires the aiohttp package (Python 3.5+).  Install it with 'pip install sensorml2iso[asyncio]' or 'pip install aiohttp'.")
+
+    stream = config_entry.get('stream') is True
+    if stream and engine != 'threads':
+        raise ValueError("'stream' is only supported with the 'threads' engine.")
+
+    queue_size = config_entry.get('queue_size', 64)
+    if not isinstance(queue_size, int) or queue_size < 1:
+        raise ValueError("'queue_size' value must be a positive integer.  Value passed: {param}".format(param=queue_size))
+
+    render_workers = config_entry.get('render_workers', 1)
+    if not isinstance(render_workers, int) or render_workers < 1:
+        raise ValueError("'render_workers' value must be a positive integer.  Value passed: {param}".format(param=render_workers))
+
+    fsync = config_entry.get('fsync', 'none').lower()
+    if fsync not in ['none', 'batch', 'always']:
+        raise ValueError("'fsync' value must be one of 'none', 'batch' or 'always'.  Value passed: {param}".format(param=fsync))
+
+    archive = config_entry.get('archive')
+    if archive is not None and archive.lower() not in ['zip', 'tar.gz']:
+        raise ValueError("'archive' value must be one of 'zip' or 'tar.gz'.  Value passed: {param}".format(param=archive))
+
+    template_dir = config_entry.get('template_dir')
+    if template_dir is not None and not os.path.isdir(template_dir):
+        raise ValueError("'template_dir' value must be an existing directory.  Value passed: {param}".format(param=template_dir))
+
+    host_limit = config_entry.get('host_limit')
+    if host_limit is not None and (not isinstance(host_limit, int) or host_limit < 1):
+        raise ValueError("'host_limit' value must be a positive integer.  Value passed: {param}".format(param=host_limit))
+
+    host_rate = config_entry.get('host_rate')
+    if host_rate is not None and (not isinstance(host_rate, (int, float)) or host_rate <= 0):
+        raise ValueError("'host_rate' value must be a positive number.  Value passed: {param}".format(param=host_rate))
+
+    log_level = config_entry.get('log_level')
+    if log_level is not None and log_level.lower() not in ['debug', 'info', 'warning', 'error']:
+        raise ValueError("'log_level' value must be one of 'debug', 'info', 'warning' or 'error'.  Value passed: {param}".format(param=log_level))
+
+    sensorml_dump_rate = config_entry.get('sensorml_dump_rate', 0.0)
+    if not isinstance(sensorml_dump_rate, (int, float)) or not 0 <= sensorml_dump_rate <= 1:
+        raise ValueError("'sensorml_dump_rate' value must be a number between 0 and 1.  Value passed: {param}".format(param=sensorml_dump_rate))
+
+    sensorml_max_age = config_entry.get('sensorml_max_age', 24)
+    if not isinstance(sensorml_max_age, (int, float)) or sensorml_max_age < 0:
+        raise ValueError("'sensorml_max_age' value must be a non-negative number.  Value passed: {param}".format(param=sensorml_max_age))
+
+    return {
+        'service': service,
+        'active_station_days': config_entry.get('active_station_days'),
+        'stations': config_entry.get('stations') or None,
+        'getobs_req_hours': config_entry.get('getobs_req_hours', 2),
+        'response_formats': config_entry.get('response_formats') or DEFAULT_RESPONSE_FORMATS,
+        'sos_type': sos_type,
+        'output_dir': config_entry.get('output_dir'),
+        'host_limit': host_limit,
+        'host_rate': host_rate,
+        'engine': engine,
+        'render_workers': render_workers,
+        'template_dir': template_dir,
+        'stream': stream,
+        'queue_size': queue_size,
+        'fsync': fsync,
+        'archive': archive.lower() if archive is not None else None,
+        'waf_index': config_entry.get('waf_index') is True,
+        'force': config_entry.get('force') is True,
+        'prometheus_file': config_entry.get('prometheus_file'),
+        'prune': config_entry.get('prune') is True,
+        'resume': config_entry.get('resume') is True,
+        'sensorml_max_age': sensorml_max_age,
+        'diff_report': config_entry.get('diff_report'),
+        'log_level': log_level.lower() if log_level is not None else None,
+        'sensorml_dump_rate': sensorml_dump_rate,
+        'verbose': config_entry.get('verbose') is True
+    }
+
+
+class Batch:
+    """
+    Harvests every service in a config.json file concurrently in a single process, sharing one DescribeSensor worker
+    pool, one set of on-disk caches and one compiled ISO template across services.  Each service keeps its own options
+    and output directory.
+
+    Attributes
+    ----------
+    config : list
+        config.json service entries
+    workers : int
+        Number of concurrent DescribeSensor requests, shared by all services
+    host_limit : int
+        Maximum number of concurrent requests to a single SOS host (unless set by its services' 'host_limit')
+    host_rate : float
+        Maximum number of requests started per second against a single SOS host (unless set by its services'
+        'host_rate'; unlimited if None)
+    adaptive : bool
+        Adapt the concurrency of requests to each SOS host to its latency and failures, up to its ceiling
+    timeout : int
+        Timeout (seconds) for each DescribeSensor request
+    pool_size : int
+        Number of HTTP connections kept alive to each SOS host ('host_limit' if None)
+    retries : int
+        Maximum number of retries of a SOS request failing with a transient error
+    retry_backoff : float
+        Base backoff (seconds) of the jittered exponential backoff between retries
+    cache_dir : str
+        Directory to persist downloaded SOS documents in between runs (no caching if None)
+    resume : bool
+        Resume the harvest of every service interrupted in the previous run (as well as of services whose entry sets
+        'resume')
+    """
+
+    def __init__(self, config, workers=16, host_limit=4, timeout=200, cache_dir=None, sensorml_cache_ttl=24,
+                 sensorml_cache_size=512, pool_size=None, retries=3, retry_backoff=0.5, host_rate=None,
+                 adaptive=True, resume=False):
+        """
+        """
+        from .fetch import DescribeSensorFetcher
+        self.config = config
+        self.cache_dir = cache_dir
+        self.resume = resume
+
+        sensorml_cache = None
+        self.capabilities_cache = None
+        if cache_dir is not None:
+            sensorml_cache = SensorMLCache(cache_dir, ttl=sensorml_cache_ttl * 3600,
+                                           max_size=sensorml_cache_size * 1024 * 1024)
+            self.capabilities_cache = CapabilitiesCache(cache_dir)
+        self.format_memo = OutputFormatMemo(cache_dir)
+        self.fetcher = DescribeSensorFetcher(workers=workers, host_limit=host_limit, timeout=timeout,
+                                             cache=sensorml_cache, pool_size=pool_size, retries=retries,
+                                             retry_backoff=retry_backoff, host_rate=host_rate, adaptive=adaptive)
+
+    def run(self):
+        """
+        Harvests all services, returning a list of tuples (config entry index, service URL, error message) of the
+        services that failed, in config order (several entries may harvest the same service URL).
+        """
+        errors = []
+        if not self.config:
+            return errors
+        pool = ThreadPool(len(self.config))
+        try:
+            for index, (service, error) in enumerate(pool.map(self.run_service, self.config)):
+                if error is not None:
+                    errors.append((index, service, error))
+        finally:
+            pool.close()
+            pool.join()
+            self.fetcher.close()
+        return errors
+
+    def run_service(self, config_entry):
+        """
+        Harvests a single config.json service entry.  Returns a tuple (service URL, error message or None).
+        """
+        service = config_entry.get('service')
+        try:
+            kwargs = service_kwargs(config_entry)
+        except ValueError as e:
+            return service, "Invalid config entry: {err}".format(err=str(e))
+        if self.resume:
+            kwargs['resume'] = True
+
+        from .sensorml2iso import Sensorml2Iso
+        try:
+            name = entry_name(config_entry)
+            obj = Sensorml2Iso(
+                log_file=config_entry.get('log_file') or 'sensorml2iso-{name}.log'.format(name=name),
+                csv_file='sensorml2iso-{name}.csv'.format(name=name),
+                metrics_file='sensorml2iso-metrics-{name}.json'.format(name=name),
+                fetcher=self.fetcher,
+                capabilities_cache=self.capabilities_cache,
+                format_memo=self.format_memo,
+                cache_dir=self.cache_dir,
+                **kwargs)
+            obj.run()
+        # Sensorml2Iso reports fatal errors with sys.exit, which must not end the other services' harvests:
+        except SystemExit as e:
+            return service, str(e.code)
+        except Exception as e:
+            traceback.print_exc()
+            return service, str(e)
+        return service, None
+
+
+def add_arguments(parser):
+    """
+    Adds the command line arguments of the options shared by all services of a Batch to 'parser' (used by
+    'sensorml2iso batch' and 'sensorml2iso serve').
+    """
+    parser.add_argument('-c', '--config', type=str, required=True,
+                        help='Path of the config.json file listing the SOS services to harvest (same format as /etc/sensorml2iso/config.json in the Docker image).')
+
+    parser.add_argument('--workers', type=int, required=False, default=16,
+                        help='Number of SOS DescribeSensor requests to issue concurrently, shared by all services.  Default: 16.')
+
+    parser.add_argument('--host_limit', type=int, required=False, default=4,
+                        help='Maximum number of concurrent requests to a single SOS host.  Default: 4.')
+
+    parser.add_argument('--timeout', type=int, required=False, default=200,
+                        help='Timeout (seconds) for each individual SOS DescribeSensor request.  Default: 200.')
+
+    parser.add_argument('--cache_dir', type=str, required=False, default=DEFAULT_CACHE_DIR,
+                        help='Directory to persist downloaded SOS documents in between runs.  Default: \'{cache_dir}\'.'.format(cache_dir=DEFAULT_CACHE_DIR))
+
+    parser.add_argument('--no_cache', action='store_true',
+                        help='Disable the on-disk cache of downloaded SOS documents.')
+
+    parser.add_argument('--sensorml_cache_ttl', type=float, required=False, default=24,
+                        help='Number of hours a cached SensorML (DescribeSensor) response is used before it is revalidated.  Default: 24.')
+
+    parser.add_argument('--sensorml_cache_size', type=int, required=False, default=512,
+                        help='Maximum size (MB) of the SensorML response cache.  Default: 512.')
+
+    parser.add_argument('--host_rate', type=float, required=False,
+                        help='Maximum number of requests started per second against a single SOS host, unless set by its services\' \'host_rate\' config.json values.  Default: unlimited.')
+
+    parser.add_argument('--no_adaptive', action='store_true',
+                        help='Always issue the maximum number of concurrent requests to each SOS host, rather than adapting concurrency to its latency and errors.')
+
+    parser.add_argument('--pool_size', type=int, required=False,
+                        help='Number of HTTP connections kept alive to each SOS host.  Default: the \'--host_limit\' value.')
+
+    parser.add_argument('--retries', type=int, required=False, default=3,
+                        help='Maximum number of retries of a SOS request failing with a transient error.  Default: 3.')
+
+    parser.add_argument('--retry_backoff', type=float, required=False, default=0.5,
+                        help='Base backoff (seconds) of the jittered exponential backoff between retries.  Default: 0.5.')
+
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume the harvest of every service interrupted in the previous run from its journal (as \'resume\' does for a single config.json entry).')
+
+
+def check_arguments(args):
+    """
+    Exits with an error message if the Batch options parsed from the command line are invalid.
+    """
+    if args.workers < 1 or args.host_limit < 1 or args.timeout < 1:
+        sys.exit("Error: '--workers', '--host_limit' and '--timeout' parameter values must be positive integers.")
+    if args.host_rate is not None and args.host_rate <= 0:
+        sys.exit("Error: '--host_rate' parameter value must be a positive number.  Value passed: {param}".format(param=args.host_rate))
+    if args.pool_size is not None and args.pool_size < 1:
+        sys.exit("Error: '--pool_size' parameter value must be a positive integer.  Value passed: {param}".format(param=args.pool_size))
+    if args.retries < 0 or args.retry_backoff < 0:
+        sys.exit("Error: '--retries' and '--retry_backoff' parameter values must not be negative.")
+
+
+def create_batch(config, args):
+    """
+    Returns a Batch of the services of 'config' with the options parsed from the command line.
+    """
+    return Batch(
+        config,
+        workers=args.workers,
+        host_limit=args.host_limit,
+        timeout=args.timeout,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        sensorml_cache_ttl=args.sensorml_cache_ttl,
+        sensorml_cache_size=args.sensorml_cache_size,
+        pool_size=args.pool_size,
+        retries=args.retries,
+        retry_backoff=args.retry_backoff,
+        host_rate=args.host_rate,
+        adaptive=not args.no_adaptive,
+        resume=args.resume)
+
+
+def main(argv=None):
+    """
+    Command line interface for 'sensorml2iso batch'
+    """
+    parser = argparse.ArgumentParser(
+        prog='sensorml2iso batch',
+        description='Harvest all SOS services listed in a config.json file concurrently in a single process')
+
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    check_arguments(args)
+
+    try:
+        config = load_config(args.config)
+    except (IOError, OSError, ValueError) as e:
+        sys.exit("Error: unable to read config file: {config}.  {err}".format(config=args.config, err=str(e)))
+
+    batch = create_batch(config, args)
+    errors = batch.run()
+
+    for index, service, error in errors:
+        print("Error: harvest of SOS service: {service} (config entry {index}) failed.  {err}".format(
+            service=service, index=index, err=error))
+    if errors:
+        sys.exit(1)
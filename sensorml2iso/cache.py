@@ -0,0 +1,217 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+
+from .util import atomic_write, makedirs
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'sensorml2iso')
+
+
+class SensorMLCache:
+    """
+    On-disk cache of raw DescribeSensor responses keyed by service, procedure and outputFormat.  Each entry stores the
+    response bytes plus its HTTP validators (ETag/Last-Modified).  Entries younger than the TTL are served without a
+    request, older entries are revalidated with a conditional GET, and the least recently used entries are evicted
+    once the cache grows beyond its size limit.
+
+    Attributes
+    ----------
+    cache_dir : str
+        Directory the cached responses are stored in.
+    ttl : float
+        Time (seconds) a cached response is used without revalidation.
+    max_size : int
+        Maximum total size (bytes) of cached responses before LRU eviction.
+    """
+
+    def __init__(self, cache_dir, ttl=86400, max_size=512 * 1024 * 1024):
+        """
+        """
+        self.cache_dir = os.path.join(cache_dir, 'sensorml')
+        self.ttl = ttl
+        self.max_size = max_size
+
+    def paths(self, service, procedure, output_format):
+        """
+        Returns the paths of the cached response and its metadata for a DescribeSensor request.
+        """
+        key = "\n".join([service, procedure, output_format])
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, digest + '.xml'), os.path.join(self.cache_dir, digest + '.json')
+
+    def get(self, service, procedure, output_format, max_age=None):
+        """
+        Returns a tuple (content, request_headers) for a DescribeSensor request: the cached response if it is still
+        within the TTL (or 'max_age' seconds, if not None) (request_headers is None), otherwise None plus the
+        conditional request headers to send.
+        """
+        xml_path, meta_path = self.paths(service, procedure, output_format)
+        meta = self.read_meta(meta_path)
+        if meta is None or not os.path.exists(xml_path):
+            return None, {}
+
+        if time.time() - meta['fetched'] < (self.ttl if max_age is None else max_age):
+            self.touch(meta_path)
+            with open(xml_path, 'rb') as f:
+                return f.read(), None
+
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return None, headers
+
+    def revalidated(self, service, procedure, output_format):
+        """
+        Returns the cached response for a request the server answered with '304 Not Modified', restarting its TTL.
+        """
+        xml_path, meta_path = self.paths(service, procedure, output_format)
+        meta = self.read_meta(meta_path)
+        if meta is not None:
+            meta['fetched'] = time.time()
+            atomic_write(meta_path, json.dumps(meta).encode('utf-8'))
+        with open(xml_path, 'rb') as f:
+            return f.read()
+
+    def put(self, service, procedure, output_format, headers, content):
+        """
+        Stores a valid DescribeSensor response along with its validators.
+        """
+        xml_path, meta_path = self.paths(service, procedure, output_format)
+        makedirs(self.cache_dir)
+        atomic_write(xml_path, content)
+        meta = {
+            'service': service,
+            'procedure': procedure,
+            'output_format': output_format,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'fetched': time.time()
+        }
+        atomic_write(meta_path, json.dumps(meta).encode('utf-8'))
+
+    def read_meta(self, meta_path):
+        """
+        """
+        try:
+            with io.open(meta_path, mode='rt', encoding='utf-8') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def touch(self, meta_path):
+        """
+        Marks an entry as recently used (the metadata file's mtime orders entries for LRU eviction).
+        """
+        try:
+            os.utime(meta_path, None)
+        except OSError:
+            pass
+
+    def prune(self):
+        """
+        Evicts the least recently used entries until the cache is within 'max_size'.  Returns the number evicted.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return 0
+
+        entries = []
+        total_size = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            meta_path = os.path.join(self.cache_dir, name)
+            xml_path = meta_path[:-len('.json')] + '.xml'
+            try:
+                size = os.path.getsize(xml_path) + os.path.getsize(meta_path)
+                used = os.path.getmtime(meta_path)
+            except OSError:
+                continue
+            entries.append((used, size, meta_path, xml_path))
+            total_size += size
+
+        evicted = 0
+        for used, size, meta_path, xml_path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            for path in (meta_path, xml_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total_size -= size
+            evicted += 1
+        return evicted
+
+
+class OutputFormatMemo:
+    """
+    The DescribeSensor outputFormat that last returned valid SensorML for each SOS service, so stations are requested
+    in that format first instead of after a failed request in each format listed before it (eg. NDBC).  Persisted as
+    JSON in the cache directory, or kept in memory for the run only if there is none.
+
+    Attributes
+    ----------
+    path : str
+        Path of the JSON file the formats are stored in (None if not persisted).
+    formats : dict
+        outputFormat keyed by SOS service URL.
+    """
+
+    def __init__(self, cache_dir=None):
+        """
+        """
+        self.path = os.path.join(cache_dir, 'output_formats.json') if cache_dir is not None else None
+        self.lock = threading.Lock()
+        self.formats = {}
+        if self.path is not None:
+            try:
+                with io.open(self.path, mode='rt', encoding='utf-8') as f:
+                    self.formats = json.load(f)
+            except (IOError, OSError, ValueError):
+                pass
+
+    def get(self, service):
+        """
+        Returns the outputFormat known to work for a SOS service, or None if not known.
+        """
+        return self.formats.get(service)
+
+    def order(self, service, output_formats):
+        """
+        Returns 'output_formats' with the format known to work for a SOS service (if any) moved to the front.
+        """
+        known = self.get(service)
+        if known not in output_formats:
+            return list(output_formats)
+        return [known] + [fmt for fmt in output_formats if fmt != known]
+
+    def put(self, service, output_format):
+        """
+        Records the outputFormat that returned valid SensorML for a SOS service.
+        """
+        with self.lock:
+            if self.formats.get(service) == output_format:
+                return
+            self.formats[service] = output_format
+            self.save()
+
+    def forget(self, service):
+        """
+        Forgets the outputFormat recorded for a SOS service (eg. once it no longer returns valid SensorML).
+        """
+        with self.lock:
+            if self.formats.pop(service, None) is not None:
+                self.save()
+
+    def save(self):
+        """
+        Persists the formats (called with the lock held).
+        """
+        if self.path is not None:
+            makedirs(os.path.dirname(self.path))
+            atomic_write(self.path, json.dumps(self.formats, indent=2, sort_keys=True).encode('utf-8'))
@@ -0,0 +1,532 @@
+import calendar
+import hashlib
+import io
+import json
+import os
+import time
+
+from lxml import etree
+
+from owslib.ows import ExceptionReport
+from owslib.util import clean_ows_url, extract_time, testXMLValue, xmltag_split
+
+from .record import to_utc
+from .util import atomic_write, makedirs
+
+
+NAMESPACES = {
+    'sos': 'http://www.opengis.net/sos/1.0',
+    'ows': 'http://www.opengis.net/ows/1.1',
+    'gml': 'http://www.opengis.net/gml',
+    'xlink': 'http://www.w3.org/1999/xlink'
+}
+
+
+def _xpath(path):
+    return etree.XPath(path, namespaces=NAMESPACES)
+
+
+def _tag(prefix, name):
+    return '{{{ns}}}{name}'.format(ns=NAMESPACES[prefix], name=name)
+
+
+def _timestamp(value):
+    """
+    Returns the POSIX time of a snapshot entry's UTC ISO 8601 time, or None if it isn't one (eg. 'now' or None).
+    """
+    try:
+        return calendar.timegm(time.strptime(value[:19], '%Y-%m-%dT%H:%M:%S'))
+    except (TypeError, ValueError):
+        return None
+
+
+TITLE = _xpath('ows:Title')
+ABSTRACT = _xpath('ows:Abstract')
+KEYWORDS = _xpath('ows:Keywords/ows:Keyword')
+OPERATION_METHODS = _xpath('ows:DCP/ows:HTTP/*')
+BEGIN_POSITION = _xpath('gml:TimePeriod/gml:beginPosition')
+END_POSITION = _xpath('gml:TimePeriod/gml:endPosition')
+
+OWS_EXCEPTION_REPORT = _tag('ows', 'ExceptionReport')
+OWS_SERVICE_IDENTIFICATION = _tag('ows', 'ServiceIdentification')
+OWS_OPERATIONS_METADATA = _tag('ows', 'OperationsMetadata')
+OWS_OPERATION = _tag('ows', 'Operation')
+SOS_OBSERVATION_OFFERING_LIST = _tag('sos', 'ObservationOfferingList')
+SOS_OBSERVATION_OFFERING = _tag('sos', 'ObservationOffering')
+SOS_TIME = _tag('sos', 'time')
+SOS_PROCEDURE = _tag('sos', 'procedure')
+SOS_OBSERVED_PROPERTY = _tag('sos', 'observedProperty')
+SOS_RESPONSE_FORMAT = _tag('sos', 'responseFormat')
+GML_ID = _tag('gml', 'id')
+GML_NAME = _tag('gml', 'name')
+XLINK_HREF = _tag('xlink', 'href')
+
+
+def _first(elements):
+    return elements[0] if elements else None
+
+
+def _clear(element):
+    # free a parsed element, and the already parsed siblings preceding it:
+    element.clear()
+    while element.getprevious() is not None:
+        del element.getparent()[0]
+
+
+def load_capabilities(sos_url_params, content):
+    """
+    Parses a SOS 1.0.0 GetCapabilities document incrementally (lxml iterparse), returning a SosCapabilities object.
+    Each offering is reduced to an Offering and freed as soon as it is parsed, so memory use is bounded by a single
+    offering rather than the whole document tree (NDBC lists about a thousand offerings).  Raises OWSLib's
+    ExceptionReport for an ows:ExceptionReport response, as OWSLib does.
+    """
+    capabilities = SosCapabilities(clean_ows_url(sos_url_params))
+    root = None
+    for event, element in etree.iterparse(io.BytesIO(content), events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+                if element.tag == OWS_EXCEPTION_REPORT:
+                    raise ExceptionReport(etree.fromstring(content))
+            continue
+
+        parent = element.getparent()
+        if element.tag == SOS_OBSERVATION_OFFERING:
+            if parent is not None and parent.tag == SOS_OBSERVATION_OFFERING_LIST:
+                capabilities.add_offering(Offering.from_element(element))
+                _clear(element)
+        elif element.tag == OWS_OPERATION:
+            if parent is not None and parent.tag == OWS_OPERATIONS_METADATA and 'name' in element.attrib:
+                capabilities.operations.append(Operation(element))
+        elif parent is root:
+            if element.tag == OWS_SERVICE_IDENTIFICATION:
+                capabilities.identification = ServiceIdentification(element)
+            _clear(element)
+    return capabilities
+
+
+class ServiceIdentification:
+    """
+    The ows:ServiceIdentification values used from a GetCapabilities document (as in OWSLib's ServiceIdentification).
+
+    Attributes
+    ----------
+    title, abstract : str
+        Service title and abstract (None if not available)
+    keywords : list
+        Service keywords
+    """
+
+    def __init__(self, element=None):
+        """
+        """
+        self.title = testXMLValue(_first(TITLE(element))) if element is not None else None
+        self.abstract = testXMLValue(_first(ABSTRACT(element))) if element is not None else None
+        self.keywords = [keyword.text for keyword in KEYWORDS(element) if keyword.text is not None] \
+            if element is not None else []
+
+
+class Operation:
+    """
+    A GetCapabilities ows:Operation (as in OWSLib's OperationsMetadata).
+
+    Attributes
+    ----------
+    name : str
+        Operation name (eg. 'DescribeSensor')
+    methods : list
+        Dicts of the 'type' (eg. 'Get') and 'url' of each HTTP method the operation is offered with
+    """
+
+    def __init__(self, element):
+        """
+        """
+        self.name = element.attrib['name']
+        self.methods = []
+        for method in OPERATION_METHODS(element):
+            url = method.get(XLINK_HREF)
+            if url is not None:
+                self.methods.append({'type': xmltag_split(method.tag), 'url': url})
+
+
+class Offering(object):
+    """
+    The values used from a GetCapabilities sos:ObservationOffering (as in OWSLib's SosObservationOffering), without
+    the offering's element tree.
+
+    Attributes
+    ----------
+    id : str
+        Offering gml:id
+    name : str
+        Offering name (the station or network URN)
+    begin_position, end_position : datetime.datetime
+        Offering time period (None if not available)
+    end_indeterminate : str
+        gml:indeterminatePosition of the end of the offering time period (eg. 'now', in which case 'end_position' is
+        the time the document was parsed), None if not indeterminate
+    procedures, observed_properties, response_formats : list
+        Procedure URNs, observed property URIs and GetObservation responseFormats of the offering
+    """
+
+    __slots__ = ('id', 'name', 'begin_position', 'end_position', 'end_indeterminate', 'procedures',
+                 'observed_properties', 'response_formats')
+
+    def __init__(self, **fields):
+        """
+        """
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_element(cls, element):
+        """
+        Returns the Offering of a sos:ObservationOffering element, in a single pass over its children.
+        """
+        offering = cls(id=testXMLValue(element.get(GML_ID), True), procedures=[], observed_properties=[],
+                       response_formats=[])
+        time_element = None
+        for child in element:
+            if child.tag == GML_NAME:
+                if offering.name is None:
+                    offering.name = testXMLValue(child)
+            elif child.tag == SOS_TIME:
+                if time_element is None:
+                    time_element = child
+            elif child.tag == SOS_PROCEDURE:
+                offering.procedures.append(testXMLValue(child.get(XLINK_HREF), True))
+            elif child.tag == SOS_OBSERVED_PROPERTY:
+                offering.observed_properties.append(testXMLValue(child.get(XLINK_HREF), True))
+            elif child.tag == SOS_RESPONSE_FORMAT:
+                offering.response_formats.append(testXMLValue(child))
+        if time_element is not None:
+            offering.begin_position = extract_time(_first(BEGIN_POSITION(time_element)))
+            end_element = _first(END_POSITION(time_element))
+            offering.end_position = extract_time(end_element)
+            if end_element is not None and not testXMLValue(end_element):
+                offering.end_indeterminate = testXMLValue(end_element.get('indeterminatePosition'), True)
+        return offering
+
+
+class SosCapabilities:
+    """
+    The parts of a SOS GetCapabilities document used to harvest it, with the attributes and methods of OWSLib's
+    SensorObservationService they replace.
+
+    Attributes
+    ----------
+    url : str
+        GetCapabilities URL, without its basic service parameters (the fallback DescribeSensor URL)
+    version : str
+        SOS version
+    identification : ServiceIdentification
+        Service identification
+    operations : list
+        Operations offered
+    offerings : list
+        Offerings, in document order
+    contents : dict
+        Offerings keyed by gml:id
+    """
+
+    def __init__(self, url, version='1.0.0'):
+        """
+        """
+        self.url = url
+        self.version = version
+        self.identification = ServiceIdentification()
+        self.operations = []
+        self.offerings = []
+        self.contents = {}
+
+    def add_offering(self, offering):
+        """
+        """
+        self.offerings.append(offering)
+        self.contents[offering.id] = offering
+
+    def getOperationByName(self, name):
+        """
+        Returns the named operation (OWSLib's method name).
+        """
+        for operation in self.operations:
+            if operation.name == name:
+                return operation
+        raise KeyError("No operation named %s" % name)
+
+
+class OfferingIndex:
+    """
+    Constant-time lookup of GetCapabilities offerings by station URN, built once per harvest.
+
+    Attributes
+    ----------
+    by_name : dict
+        Offerings keyed by offering name (station URN).  Where names repeat, the last offering listed wins.
+    by_id : dict
+        Offerings keyed by offering gml:id (eg. NDBC's 'station-<id>').
+    """
+
+    def __init__(self, sos):
+        """
+        """
+        self.by_id = dict(sos.contents)
+        self.by_name = {}
+        for offering in sos.offerings:
+            self.by_name[offering.name] = offering
+
+    def get(self, station_urn):
+        """
+        Returns the offering for a station URN, or None if the SOS does not list one.
+        """
+        return self.by_name.get(station_urn)
+
+    def get_ndbc(self, station_urn):
+        """
+        Returns the NDBC-style offering ('station-' + station id) for a station URN, or None if there is none.
+        """
+        return self.by_id.get('station-' + station_urn.split(':')[-1])
+
+    def response_formats(self, station_urn):
+        """
+        """
+        offering = self.get(station_urn)
+        return offering.response_formats if offering is not None else []
+
+    def observed_properties(self, station_urn):
+        """
+        """
+        offering = self.get(station_urn)
+        return offering.observed_properties if offering is not None else []
+
+    def begin_position(self, station_urn):
+        """
+        """
+        offering = self.get(station_urn)
+        return offering.begin_position if offering is not None else None
+
+    def end_position(self, station_urn):
+        """
+        """
+        offering = self.get(station_urn)
+        return offering.end_position if offering is not None else None
+
+    def is_inactive(self, station_urn, active_date, ndbc=False):
+        """
+        Returns True if a station's offering (NDBC-style offering if 'ndbc') ends before 'active_date' (a timezone-aware
+        datetime), False if it ends later or its end is not known.
+        """
+        offering = self.get_ndbc(station_urn) if ndbc else self.get(station_urn)
+        if offering is None or offering.end_position is None:
+            return False
+        return to_utc(offering.end_position) <= active_date
+
+
+class CapabilitiesCache:
+    """
+    Stores GetCapabilities documents on disk along with their HTTP validators (ETag/Last-Modified), so an unchanged
+    document can be revalidated with a conditional GET rather than downloaded again.
+
+    Attributes
+    ----------
+    cache_dir : str
+        Directory the cached documents are stored in.
+    """
+
+    def __init__(self, cache_dir):
+        """
+        """
+        self.cache_dir = os.path.join(cache_dir, 'capabilities')
+
+    def paths(self, url):
+        """
+        Returns the paths of the cached document and its metadata for a GetCapabilities URL.
+        """
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key + '.xml'), os.path.join(self.cache_dir, key + '.json')
+
+    def request_headers(self, url):
+        """
+        Returns the conditional request headers to send for a GetCapabilities URL.
+        """
+        xml_path, meta_path = self.paths(url)
+        if not os.path.exists(xml_path):
+            return {}
+        try:
+            with io.open(meta_path, mode='rt', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def resolve(self, url, status_code, headers, content):
+        """
+        Returns the GetCapabilities document for a response to a (conditional) request: the cached copy if the server
+        responded '304 Not Modified', otherwise the response content, which is stored along with its validators.
+        """
+        xml_path, meta_path = self.paths(url)
+        if status_code == 304:
+            with open(xml_path, 'rb') as f:
+                return f.read()
+
+        if status_code == 200 and (headers.get('ETag') or headers.get('Last-Modified')):
+            makedirs(self.cache_dir)
+            atomic_write(xml_path, content)
+            meta = {'url': url, 'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified')}
+            atomic_write(meta_path, json.dumps(meta).encode('utf-8'))
+        return content
+
+
+class CapabilitiesSnapshot:
+    """
+    Compact snapshot of the station offerings of a SOS service's GetCapabilities document (station list, time ranges,
+    procedures, observed properties and response formats), stored in the cache directory between runs so that the
+    offerings of the next run can be diffed against it.
+
+    The offering 'end' of a station still active at the previous run (ending within ACTIVE_WINDOW of that run) moves
+    forward with every new observation without its SensorML changing, so an 'end' moving forward is only a change for
+    stations that were inactive: a station reactivated after a gap shows up as changed, an active one doesn't.  An 'end'
+    moving back, or changing between a time and indeterminate ('now'), is always a change.
+
+    Attributes
+    ----------
+    path : str
+        Path of the snapshot file.
+    stations : dict
+        Snapshot entries of the previous run keyed by station URN (empty if there is no snapshot).
+    taken : float
+        Time the previous snapshot was taken (None if there is none).
+    """
+
+    FIELDS = ['begin', 'end', 'procedures', 'observed_properties', 'response_formats']
+
+    # seconds before the previous snapshot within which a station's offering must end for it to be active:
+    ACTIVE_WINDOW = 7 * 86400
+
+    def __init__(self, cache_dir, service):
+        """
+        """
+        key = hashlib.sha1(service.encode('utf-8')).hexdigest()
+        self.path = os.path.join(cache_dir, 'capabilities', key + '.snapshot.json')
+        self.stations = {}
+        self.taken = None
+        try:
+            with io.open(self.path, mode='rt', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            self.stations = snapshot['stations']
+            self.taken = snapshot['taken']
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+    @staticmethod
+    def entry(offering):
+        """
+        Returns the snapshot entry of an Offering.
+        """
+        begin, end = to_utc(offering.begin_position), to_utc(offering.end_position)
+        return {
+            'begin': begin.isoformat() if begin is not None else None,
+            # an indeterminate end ('now') is parsed as the current time, which is not a change:
+            'end': offering.end_indeterminate or (end.isoformat() if end is not None else None),
+            'procedures': offering.procedures,
+            'observed_properties': offering.observed_properties,
+            'response_formats': offering.response_formats
+        }
+
+    def take(self, offerings, station_urns):
+        """
+        Returns the snapshot entries of the offerings of 'station_urns', keyed by station URN.
+        """
+        return dict((station_urn, self.entry(offerings.get(station_urn))) for station_urn in station_urns
+                    if offerings.get(station_urn) is not None)
+
+    def diff(self, stations):
+        """
+        Returns the CapabilitiesDiff of snapshot entries 'stations' (from take) against the previous snapshot.
+        """
+        result = CapabilitiesDiff(self.taken)
+        for station_urn in sorted(stations):
+            previous = self.stations.get(station_urn)
+            if previous is None:
+                result.added.append(station_urn)
+                continue
+            fields = [field for field in self.FIELDS
+                      if self.field_changed(field, previous.get(field), stations[station_urn].get(field))]
+            if fields:
+                result.changed[station_urn] = fields
+            else:
+                result.unchanged.add(station_urn)
+        result.removed = sorted(station_urn for station_urn in self.stations if station_urn not in stations)
+        return result
+
+    def field_changed(self, field, previous, current):
+        """
+        Returns True if snapshot entry field 'field' changed from 'previous' to 'current'.
+        """
+        if previous == current:
+            return False
+        if field != 'end':
+            return True
+        previous_end, current_end = _timestamp(previous), _timestamp(current)
+        if previous_end is None or current_end is None or self.taken is None:
+            return True
+        active = previous_end >= self.taken - self.ACTIVE_WINDOW
+        return not (active and current_end > previous_end)
+
+    def save(self, stations):
+        """
+        Stores snapshot entries 'stations' (from take) as the snapshot of the current run.
+        """
+        makedirs(os.path.dirname(self.path))
+        snapshot = {'taken': time.time(), 'stations': stations}
+        atomic_write(self.path, json.dumps(snapshot, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+
+
+class CapabilitiesDiff:
+    """
+    Changes of a SOS service's station offerings since the previous run's CapabilitiesSnapshot.
+
+    Attributes
+    ----------
+    previous : float
+        Time the previous snapshot was taken (None if there was none, so all stations are 'added').
+    added, removed : list
+        URNs of the stations added to and removed from the GetCapabilities document.
+    changed : dict
+        Names of the snapshot fields that changed, keyed by station URN.
+    unchanged : set
+        URNs of the stations whose offering is unchanged.
+    """
+
+    def __init__(self, previous=None):
+        """
+        """
+        self.previous = previous
+        self.added = []
+        self.removed = []
+        self.changed = {}
+        self.unchanged = set()
+
+    def is_changed(self, station_urn):
+        """
+        Returns True if a station was added or changed (its SensorML may have changed too).
+        """
+        return station_urn not in self.unchanged
+
+    def to_dict(self):
+        """
+        Returns the diff as a JSON-serializable report.
+        """
+        return {
+            'previous': self.previous,
+            'added': self.added,
+            'changed': self.changed,
+            'removed': self.removed,
+            'unchanged': len(self.unchanged)
+        }
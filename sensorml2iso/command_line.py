@@ -5,10 +5,13 @@ try:
     from urllib.parse import urlparse  # Python 3
 except ImportError:
     from urlparse import urlparse  # Python 2
-from . import Sensorml2Iso
+from .cache import DEFAULT_CACHE_DIR
 
 _EPILOG = """
-
+To harvest all SOS services listed in a config.json file in a single process, run:
+  sensorml2iso batch --config config.json
+To keep harvesting them on the 'schedule' of each entry in a long-running process, run:
+  sensorml2iso serve --config config.json
 """
 
 SOS_URLS = [
@@ -26,6 +29,13 @@ def main():
     """
     Command line interface
     """
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        from . import batch
+        return batch.main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        from . import serve
+        return serve.main(sys.argv[2:])
+
     kwargs = {
         'description': 'Parse an IOOS i52N SOS endpoint and convert SensorML to ISO 19115-2 xml metadata',
         'epilog': _EPILOG,
@@ -37,7 +47,7 @@ def main():
                         help='URL of SOS service to parse and convert.  Examples: {urls}'.format(urls=os.linesep.join(SOS_URLS)))
 
     parser.add_argument('-d', '--active_station_days', type=int, required=False, default=None,
-                        help='Number of days from present to use to filter SOS stations not actively reporting observations for active/inactive designation.  Inactive stations are excluded from processing.')
+                        help='Number of days from present to use to filter SOS stations not actively reporting observations for active/inactive designation.  Inactive stations are excluded from processing (stations whose GetCapabilities offering ended before then without requesting their SensorML).')
 
     parser.add_argument('--stations', type=str,
                         help='Comma-separated list of station URNs to filter by. Eg. \'--stations=urn:ioos:station:nanoos:apl_nemo,urn:ioos:station:nanoos:apl_npb1ptwells\'.')
@@ -56,6 +66,96 @@ def main():
                         the default output directory will a subdirectory using the domain name of the SOS service URL passed \
                         (eg. sos.gliders.ioos.us).')
 
+    parser.add_argument('--workers', type=int, required=False, default=8,
+                        help='Number of SOS DescribeSensor requests to issue concurrently.  Default: 8.')
+
+    parser.add_argument('--host_limit', type=int, required=False, default=4,
+                        help='Maximum number of concurrent requests to a single SOS host, regardless of \'--workers\'.  Concurrency adapts to the host\'s latency and errors up to this ceiling.  Default: 4.')
+
+    parser.add_argument('--host_rate', type=float, required=False,
+                        help='Maximum number of requests started per second against the SOS host.  Default: unlimited.')
+
+    parser.add_argument('--no_adaptive', action='store_true',
+                        help='Always issue \'--host_limit\' concurrent requests to the SOS host, rather than adapting concurrency to its latency and errors.')
+
+    parser.add_argument('--timeout', type=int, required=False, default=200,
+                        help='Timeout (seconds) for each individual SOS DescribeSensor request.  Default: 200.')
+
+    parser.add_argument('--pool_size', type=int, required=False,
+                        help='Number of HTTP connections kept alive to the SOS host and reused across requests.  Default: the \'--host_limit\' value.')
+
+    parser.add_argument('--retries', type=int, required=False, default=3,
+                        help='Maximum number of retries of a SOS request failing with a transient error (connection error, timeout, or HTTP 429/502/503/504 status), with jittered exponential backoff.  Default: 3.')
+
+    parser.add_argument('--retry_backoff', type=float, required=False, default=0.5,
+                        help='Base backoff (seconds) between retries of a SOS request: the n-th retry waits a random time up to --retry_backoff * 2^n seconds (at most 30).  Default: 0.5.')
+
+    parser.add_argument('--engine', type=str, required=False, default='threads',
+                        help='Harvesting engine used for SOS requests [threads|asyncio].  \'asyncio\' performs all requests on a single event loop and requires Python 3.5+ and the aiohttp package.  Default: \'threads\'.')
+
+    parser.add_argument('--cache_dir', type=str, required=False, default=DEFAULT_CACHE_DIR,
+                        help='Directory to persist downloaded SOS documents in between runs, so unchanged documents are revalidated rather than downloaded again.  Default: \'{cache_dir}\'.'.format(cache_dir=DEFAULT_CACHE_DIR))
+
+    parser.add_argument('--sensorml_cache_ttl', type=float, required=False, default=24,
+                        help='Number of hours a cached SensorML (DescribeSensor) response is used before it is revalidated with the SOS using a conditional request.  Default: 24.')
+
+    parser.add_argument('--sensorml_cache_size', type=int, required=False, default=512,
+                        help='Maximum size (MB) of the SensorML response cache.  Least recently used responses are evicted beyond this size.  Default: 512.')
+
+    parser.add_argument('--sensorml_max_age', type=float, required=False, default=24,
+                        help='Number of hours a cached SensorML (DescribeSensor) response is used for a station whose GetCapabilities offering (time range, observed properties, response formats) is unchanged since the previous run.  Stations added or changed since are requested again.  Values above \'--sensorml_cache_ttl\' use cached responses of unchanged stations for longer than its TTL.  Default: 24.')
+
+    parser.add_argument('--diff_report', type=str, required=False,
+                        help='Path of a JSON report of the stations added, changed and removed since the previous run\'s GetCapabilities document, written at every run (requires the cache).')
+
+    parser.add_argument('--no_cache', action='store_true',
+                        help='Disable the on-disk cache of downloaded SOS documents.')
+
+    parser.add_argument('--render_workers', type=int, required=False, default=1,
+                        help='Number of processes to render station ISO 19115-2 XML records in, eg. the number of CPU cores.  Default: 1 (render in-process).')
+
+    parser.add_argument('--template_dir', type=str, required=False,
+                        help='Directory of Jinja2 templates overriding the packaged ISO 19115-2 templates of the same name (\'sensorml_iso.xml\', \'macros.xml\').')
+
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream each station through to its ISO 19115-2 XML file as soon as its SensorML arrives, keeping memory use flat regardless of the number of stations.  Requires the \'threads\' engine.')
+
+    parser.add_argument('--queue_size', type=int, required=False, default=64,
+                        help='Maximum number of stations buffered between pipeline stages in \'--stream\' mode.  Default: 64.')
+
+    parser.add_argument('--fsync', type=str, required=False, default='none',
+                        help='When written ISO 19115-2 XML files are flushed to disk [none|batch|always].  Files are always written to a temporary file and renamed into place.  \'batch\' writes files in batches, syncing the files of each batch before renaming them into place and the output directory once per batch, \'always\' syncs each file and the output directory after each file.  Default: \'none\' (left to the OS).')
+
+    parser.add_argument('--archive', type=str, required=False,
+                        help='Also package all ISO 19115-2 XML files into a single archive in the output directory [zip|tar.gz], for catalogs to harvest as one artifact.')
+
+    parser.add_argument('--waf_index', action='store_true',
+                        help='Also generate a Web Accessible Folder (WAF) index page (index.html) of the ISO 19115-2 XML files in the output directory.')
+
+    parser.add_argument('--force', action='store_true',
+                        help='Render and write every station\'s ISO 19115-2 XML file, even if its inputs are unchanged since the previous run.')
+
+    parser.add_argument('--prune', action='store_true',
+                        help='Delete ISO 19115-2 XML files of stations that are no longer output (eg. removed from the SOS or inactive).  Stations that failed in the current run are kept.')
+
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume the harvest interrupted in the previous run (eg. killed by a container restart) from its journal in the output directory: SensorML it fetched is reused, and stations whose ISO 19115-2 XML files it wrote are skipped.')
+
+    parser.add_argument('--metrics_file', type=str, required=False, default='sensorml2iso-metrics.json',
+                        help='Path of the JSON file the run\'s per-phase timings, DescribeSensor latency histogram and counters are written to at the end of every run.  Default: \'sensorml2iso-metrics.json\'.')
+
+    parser.add_argument('--prometheus_file', type=str, required=False,
+                        help='Path of a Prometheus textfile (eg. in node_exporter\'s textfile collector directory, ending in \'.prom\') to also write the run\'s metrics to.')
+
+    parser.add_argument('--log_file', type=str, required=False, default='sensorml2iso.log',
+                        help='Path of the log file to write.  Default: \'sensorml2iso.log\'.')
+
+    parser.add_argument('--log_level', type=str, required=False,
+                        help='Minimum level of the messages logged to stdout and the log file [debug|info|warning|error].  Default: \'debug\' with \'--verbose\', \'info\' otherwise.')
+
+    parser.add_argument('--sensorml_dump_rate', type=float, required=False, default=0.0,
+                        help='Fraction (0 to 1) of stations whose raw SensorML is written to the log file at the \'debug\' level.  Default: 0.')
+
     parser.add_argument('-v', '--verbose', action='store_true',
                         help='Verbose debugging mode.')
 
@@ -79,6 +179,47 @@ def main():
     if args.sos_type.lower() not in ['ioos', 'ndbc', 'coops']:
         sys.exit("Error: '--sos_type' parameter value must be one of 'ioos', 'ndbc', or 'coops'.  Value passed: {param}".format(param=args.sos_type))
 
+    if args.workers < 1 or args.host_limit < 1 or args.timeout < 1:
+        sys.exit("Error: '--workers', '--host_limit' and '--timeout' parameter values must be positive integers.")
+    if args.host_rate is not None and args.host_rate <= 0:
+        sys.exit("Error: '--host_rate' parameter value must be a positive number.  Value passed: {param}".format(param=args.host_rate))
+    if args.pool_size is not None and args.pool_size < 1:
+        sys.exit("Error: '--pool_size' parameter value must be a positive integer.  Value passed: {param}".format(param=args.pool_size))
+    if args.retries < 0 or args.retry_backoff < 0:
+        sys.exit("Error: '--retries' and '--retry_backoff' parameter values must not be negative.")
+
+    if args.stream and args.engine.lower() != 'threads':
+        sys.exit("Error: '--stream' parameter is only supported with the 'threads' engine.")
+    if args.queue_size < 1:
+        sys.exit("Error: '--queue_size' parameter value must be a positive integer.  Value passed: {param}".format(param=args.queue_size))
+
+    if args.sensorml_max_age < 0:
+        sys.exit("Error: '--sensorml_max_age' parameter value must not be negative.  Value passed: {param}".format(param=args.sensorml_max_age))
+
+    if args.render_workers < 1:
+        sys.exit("Error: '--render_workers' parameter value must be a positive integer.  Value passed: {param}".format(param=args.render_workers))
+
+    if args.fsync.lower() not in ['none', 'batch', 'always']:
+        sys.exit("Error: '--fsync' parameter value must be one of 'none', 'batch' or 'always'.  Value passed: {param}".format(param=args.fsync))
+    if args.archive is not None and args.archive.lower() not in ['zip', 'tar.gz']:
+        sys.exit("Error: '--archive' parameter value must be one of 'zip' or 'tar.gz'.  Value passed: {param}".format(param=args.archive))
+
+    if args.template_dir is not None and not os.path.isdir(args.template_dir):
+        sys.exit("Error: '--template_dir' parameter value must be an existing directory.  Value passed: {param}".format(param=args.template_dir))
+
+    if args.log_level is not None and args.log_level.lower() not in ['debug', 'info', 'warning', 'error']:
+        sys.exit("Error: '--log_level' parameter value must be one of 'debug', 'info', 'warning' or 'error'.  Value passed: {param}".format(param=args.log_level))
+    if not 0 <= args.sensorml_dump_rate <= 1:
+        sys.exit("Error: '--sensorml_dump_rate' parameter value must be between 0 and 1.  Value passed: {param}".format(param=args.sensorml_dump_rate))
+
+    if args.engine.lower() not in ['threads', 'asyncio']:
+        sys.exit("Error: '--engine' parameter value must be one of 'threads' or 'asyncio'.  Value passed: {param}".format(param=args.engine))
+    if args.engine.lower() == 'asyncio':
+        try:
+            import aiohttp
+        except ImportError:
+            sys.exit("Error: '--engine asyncio' requires the aiohttp package (Python 3.5+).  Install it with 'pip install sensorml2iso[asyncio]' or 'pip install aiohttp'.")
+
     service_url = urlparse(args.service)
     # print(service_url)
     if not service_url.scheme or not service_url.netloc:
@@ -86,6 +227,10 @@ def main():
     if service_url.params or service_url.query:
         sys.exit("Error: '--service' parameter should not contain query parameters ('{query}'). Please include only the service endpoint URL.  Value passed: {param}".format(query=service_url.query, param=args.service))
 
+    # the harvesting modules (and their OWSLib, lxml and Jinja2 dependencies) are slow to import, so are only
+    # imported once the arguments are valid:
+    from .sensorml2iso import Sensorml2Iso
+
     obj = Sensorml2Iso(
         service=args.service,
         active_station_days=args.active_station_days,
@@ -94,6 +239,35 @@ def main():
         response_formats=response_formats,
         sos_type=args.sos_type.lower(),
         output_dir=args.output_dir,
+        workers=args.workers,
+        host_limit=args.host_limit,
+        host_rate=args.host_rate,
+        adaptive=not args.no_adaptive,
+        timeout=args.timeout,
+        pool_size=args.pool_size,
+        retries=args.retries,
+        retry_backoff=args.retry_backoff,
+        engine=args.engine.lower(),
+        cache_dir=None if args.no_cache else args.cache_dir,
+        sensorml_cache_ttl=args.sensorml_cache_ttl,
+        sensorml_cache_size=args.sensorml_cache_size,
+        sensorml_max_age=args.sensorml_max_age,
+        diff_report=args.diff_report,
+        render_workers=args.render_workers,
+        template_dir=args.template_dir,
+        stream=args.stream,
+        queue_size=args.queue_size,
+        fsync=args.fsync.lower(),
+        archive=args.archive.lower() if args.archive is not None else None,
+        waf_index=args.waf_index,
+        force=args.force,
+        metrics_file=args.metrics_file,
+        prometheus_file=args.prometheus_file,
+        prune=args.prune,
+        resume=args.resume,
+        log_file=args.log_file,
+        log_level=args.log_level.lower() if args.log_level is not None else None,
+        sensorml_dump_rate=args.sensorml_dump_rate,
         verbose=args.verbose)
     obj.run()
 
@@ -0,0 +1,183 @@
+from dateutil import parser
+from lxml import etree
+
+from owslib.util import testXMLAttribute, testXMLValue
+
+NAMESPACES = {
+    'sml': 'http://www.opengis.net/sensorML/1.0.1',
+    'gml': 'http://www.opengis.net/gml',
+    'swe': 'http://www.opengis.net/swe/1.0.1',
+    'xlink': 'http://www.w3.org/1999/xlink'
+}
+IOOS_DEFINITION = 'http://mmisw.org/ont/ioos/definition/'
+
+
+def _xpath(path):
+    return etree.XPath(path, namespaces=NAMESPACES)
+
+
+def _tag(prefix, name):
+    return '{{{ns}}}{name}'.format(ns=NAMESPACES[prefix], name=name)
+
+
+# XPath expressions are compiled once, rather than namespace-expanded on every lookup:
+SYSTEM = _xpath('sml:member[1]/sml:System')
+POINT_POS = _xpath('gml:Point/gml:pos')
+POINT_COORDINATES = _xpath('gml:Point/gml:coordinates')
+IDENTIFIERS = _xpath('sml:IdentifierList/sml:identifier')
+CLASSIFIERS = _xpath('sml:ClassifierList/sml:classifier')
+TERM = _xpath('sml:Term')
+TERM_VALUE = _xpath('sml:Term/sml:value')
+CONTACT_MEMBERS = _xpath('sml:ContactList/sml:member')
+DOCUMENT_MEMBERS = _xpath('sml:DocumentList/sml:member')
+OUTPUT_QUANTITIES = _xpath('sml:OutputList/sml:output/swe:Quantity')
+BEGIN_POSITION = _xpath('gml:TimePeriod/gml:beginPosition')
+TIME_RANGE_VALUE = _xpath('.//swe:TimeRange/swe:value')
+COMPONENTS = _xpath('sml:ComponentList/sml:component')
+COMPONENT_QUANTITIES = _xpath('.//swe:Quantity')
+
+SML_LOCATION = _tag('sml', 'location')
+SML_IDENTIFICATION = _tag('sml', 'identification')
+SML_CLASSIFICATION = _tag('sml', 'classification')
+SML_CONTACT = _tag('sml', 'contact')
+SML_DOCUMENTATION = _tag('sml', 'documentation')
+SML_OUTPUTS = _tag('sml', 'outputs')
+SML_VALID_TIME = _tag('sml', 'validTime')
+SML_CAPABILITIES = _tag('sml', 'capabilities')
+SML_COMPONENTS = _tag('sml', 'components')
+
+
+def _first(elements):
+    return elements[0] if elements else None
+
+
+class StationSensorML:
+    """
+    Station metadata extracted from a DescribeSensor response (SensorML 1.0.1, IOOS SOS profile) in a single pass over
+    the children of its sml:System element, with precompiled XPath expressions.  Provides the values used from OWSLib's
+    SensorML and Pyoos' IoosDescribeSensor (station documents) without building either.
+
+    Attributes
+    ----------
+    system : lxml.etree._Element
+        The first sml:member's sml:System element
+    pos : str
+        The gml:Point location's gml:pos value (or gml:coordinates, as used by NDBC), None if not available
+    contacts : list
+        ContactList sml:member elements, or the sml:contact elements if there are none (as used by NDBC)
+    documents : list
+        DocumentList sml:member elements
+    output_quantities : list
+        definition URIs of the system's output swe:Quantity elements
+    begin_position : str
+        sml:validTime beginPosition value, None if not available
+    starting, ending : datetime.datetime
+        observationTimeRange capability values, None if not available
+    variables : list
+        Sorted unique definition URIs of the component swe:Quantity elements
+    shortName, longName, platformType : str
+        IOOS identifiers/classifiers
+    """
+
+    def __init__(self, root):
+        """
+        Raises ValueError if 'root' (a parsed DescribeSensor response) does not contain an sml:System.
+        """
+        self.system = _first(SYSTEM(root))
+        if self.system is None:
+            raise ValueError("No sml:member/sml:System element in SensorML")
+
+        location = None
+        self.identifiers = {}
+        self.classifiers = {}
+        contact_members = []
+        contact_elements = []
+        self.documents = []
+        self.output_quantities = []
+        self.begin_position = None
+        capabilities = {}
+        components = []
+
+        for element in self.system:
+            tag = element.tag
+            if tag == SML_LOCATION:
+                if location is None:
+                    location = element
+            elif tag == SML_IDENTIFICATION:
+                for identifier in IDENTIFIERS(element):
+                    self.identifiers[testXMLAttribute(identifier, 'name')] = self.get_term(identifier)
+            elif tag == SML_CLASSIFICATION:
+                for classifier in CLASSIFIERS(element):
+                    self.classifiers[testXMLAttribute(classifier, 'name')] = self.get_term(classifier)
+            elif tag == SML_CONTACT:
+                contact_elements.append(element)
+                contact_members.extend(CONTACT_MEMBERS(element))
+            elif tag == SML_DOCUMENTATION:
+                self.documents.extend(DOCUMENT_MEMBERS(element))
+            elif tag == SML_OUTPUTS:
+                self.output_quantities.extend(quantity.attrib['definition'] for quantity in OUTPUT_QUANTITIES(element))
+            elif tag == SML_VALID_TIME:
+                if self.begin_position is None:
+                    self.begin_position = testXMLValue(_first(BEGIN_POSITION(element)))
+            elif tag == SML_CAPABILITIES:
+                name = testXMLAttribute(element, 'name')
+                if name is not None and len(element):
+                    capabilities[name] = element[0]
+            elif tag == SML_COMPONENTS:
+                components.extend(COMPONENTS(element))
+
+        # assign 'pos' to GML point location (accommodate 'gml:coordinates' as used by NDBC if gml:Point not found):
+        self.pos = None
+        if location is not None:
+            self.pos = testXMLValue(_first(POINT_POS(location)))
+            if self.pos is None:
+                self.pos = testXMLValue(_first(POINT_COORDINATES(location)))
+
+        # obtain list of contacts (accommodate 'sml:contact' element repetition used by NDBC insead of  ContactList):
+        self.contacts = contact_members if contact_members else contact_elements
+
+        # observationTimeRange capability (case insensitive name):
+        try:
+            time_range = next(capability for name, capability in capabilities.items()
+                              if name.lower() == 'observationtimerange')
+            timerange = testXMLValue(_first(TIME_RANGE_VALUE(time_range))).split(" ")
+            self.starting = parser.parse(timerange[0])
+            self.ending = parser.parse(timerange[1])
+        except (StopIteration, AttributeError, TypeError, ValueError, IndexError):
+            self.starting = None
+            self.ending = None
+
+        # variables: definitions of the swe:Quantity elements of each component, falling back to the components'
+        # first attribute values if there are none:
+        self.variables = sorted(set(testXMLAttribute(quantity, 'definition')
+                                    for component in components for quantity in COMPONENT_QUANTITIES(component)))
+        if not self.variables:
+            self.variables = sorted(component.values()[0] for component in components)
+
+        self.shortName = self.get_ioos_def('shortName', 'identifier')
+        self.longName = self.get_ioos_def('longName', 'identifier')
+        self.platformType = self.get_ioos_def('platformType', 'classifier')
+
+    @staticmethod
+    def get_term(element):
+        """
+        Returns the (definition, value) of an identifier or classifier element's sml:Term.
+        """
+        return testXMLAttribute(_first(TERM(element)), 'definition'), testXMLValue(_first(TERM_VALUE(element)))
+
+    def get_ioos_def(self, ident, elem_type, ont=IOOS_DEFINITION):
+        """
+        Returns the value of the IOOS identifier or classifier named 'ident' (case insensitive) with the 'ont'
+        definition, as Pyoos' DescribeSensor.get_ioos_def does.
+        """
+        if elem_type == 'identifier':
+            terms = self.identifiers
+        elif elem_type == 'classifier':
+            terms = self.classifiers
+        else:
+            raise ValueError("Unknown element type '{}'".format(elem_type))
+        definition = ont + ident
+        for name, (term_definition, value) in terms.items():
+            if name is not None and name.lower() == ident.lower() and term_definition == definition:
+                return value
+        return None
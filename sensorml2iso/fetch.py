@@ -0,0 +1,302 @@
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+try:
+    from urllib.parse import urlparse   # Python 3
+except ImportError:
+    from urlparse import urlparse  # Python 2
+
+from lxml import etree
+from requests.exceptions import HTTPError, RequestException
+
+from owslib.ows import ExceptionReport
+from owslib.util import ServiceException, nspath_eval
+from owslib.namespaces import Namespaces
+
+from .limiter import HostLimiter
+from .session import RetryPolicy, create_session
+from .util import imap_bounded
+
+# OGC exception elements recognized in SOS responses (as checked by OWSLib's openURL):
+SERVICE_EXCEPTION_TAGS = [
+    '{http://www.opengis.net/ows}Exception',
+    '{http://www.opengis.net/ows/1.1}Exception',
+    '{http://www.opengis.net/ogc}ServiceException',
+    'ServiceException'
+]
+# namespaces of ows:ExceptionReport root elements, keyed by tag (SOS 1.0 services report exceptions in OWS 1.1, some
+# older services in OWS 1.0):
+EXCEPTION_REPORT_NAMESPACES = dict(
+    (nspath_eval('ows:ExceptionReport', {'ows': namespace}), namespace)
+    for namespace in [Namespaces().get_namespace('ows110'), Namespaces().get_namespace('ows')])
+SENSORML_TAG = nspath_eval('sml:SensorML', {'sml': Namespaces().get_namespace('sml101')})
+
+
+def describe_sensor_request(sos, procedure, output_format):
+    """
+    Returns the base URL and ordered query parameters of a GET DescribeSensor request (lifted from OWSLib).
+    """
+    try:
+        base_url = next((m.get('url') for m in sos.getOperationByName('DescribeSensor').methods
+                         if m.get('type').lower() == "get"))
+    except StopIteration:
+        base_url = sos.url
+
+    if not base_url.endswith("?"):
+        base_url = base_url + "?"
+    params = OrderedDict([('service', 'SOS'), ('version', sos.version), ('request', 'DescribeSensor'),
+                          ('procedure', procedure), ('outputFormat', output_format)])
+    return base_url, params
+
+
+def check_status(status_code, content):
+    """
+    Raises the same exceptions OWSLib raises for HTTP error status codes.
+    """
+    if status_code in [400, 401]:
+        raise ServiceException(content.decode('utf-8', 'replace'))
+    if status_code in [404, 500, 502, 503, 504]:
+        raise HTTPError("{code} Error for SOS request".format(code=status_code))
+
+
+def check_response(status_code, content):
+    """
+    Raises the same exceptions OWSLib raises for an HTTP response (status code and body bytes) containing an HTTP
+    error, an ows:ExceptionReport or an OGC ServiceException.  Returns the parsed XML otherwise.  The document is
+    inspected whatever its Content-Type (eg. 'text/xml;charset=UTF-8', or none).
+    """
+    check_status(status_code, content)
+
+    tree = etree.fromstring(content)
+    namespace = EXCEPTION_REPORT_NAMESPACES.get(tree.tag)
+    if namespace is not None:
+        if tree.find(nspath_eval('ows:Exception', {'ows': namespace})) is None:
+            raise ServiceException(etree.tostring(tree).decode('utf-8', 'replace'))
+        raise ExceptionReport(tree, namespace)
+    for tag in SERVICE_EXCEPTION_TAGS:
+        service_exception = tree if tree.tag == tag else tree.find(tag)
+        if service_exception is not None:
+            messages = [text.strip() for text in service_exception.itertext() if text.strip()]
+            raise ServiceException('\n'.join(messages))
+    return tree
+
+
+class DescribeSensorFetcher:
+    """
+    Issues SOS DescribeSensor requests concurrently from a bounded pool of worker threads, over a shared HTTP session
+    keeping connections to each SOS host alive between requests.
+
+    Attributes
+    ----------
+    workers : int
+        Maximum number of DescribeSensor requests in flight at once.
+    host_limit : int
+        Maximum number of concurrent requests against any single SOS host (the default ceiling of each host's
+        concurrency limit, see configure_host).
+    host_rate : float
+        Default maximum number of requests started per second against any single SOS host (unlimited if None).
+    adaptive : bool
+        Adapt each host's concurrency limit to its latency and failures (AIMD, from 2 up to its ceiling) rather than
+        always allowing 'host_limit' concurrent requests.
+    timeout : int
+        Timeout (seconds) applied to each individual DescribeSensor request.
+    cache : SensorMLCache
+        On-disk cache DescribeSensor responses are read through (no caching if None).
+    pool_size : int
+        Number of connections kept alive to each SOS host ('host_limit' if None).
+    retries : int
+        Maximum number of retries of a request failing with a transient error (connection error, timeout, or HTTP
+        429/502/503/504 status).
+    retry_backoff : float
+        Base backoff (seconds) of the jittered exponential backoff between retries.
+    """
+
+    def __init__(self, workers=8, host_limit=4, timeout=200, cache=None, pool_size=None, retries=3,
+                 retry_backoff=0.5, host_rate=None, adaptive=True):
+        """
+        """
+        self.workers = max(1, workers)
+        self.host_limit = max(1, host_limit)
+        self.host_rate = host_rate
+        self.adaptive = adaptive
+        self.timeout = timeout
+        self.cache = cache
+        self.pool_size = max(1, pool_size if pool_size is not None else self.host_limit)
+        self.retry_policy = RetryPolicy(retries=retries, backoff=retry_backoff)
+
+        self._host_limiters = {}
+        self._lock = threading.Lock()
+        self._pool = None
+        self._session = None
+
+    def host_limiter(self, url):
+        """
+        Returns the HostLimiter capping concurrent requests to the host of 'url'.
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            limiter = self._host_limiters.get(host)
+            if limiter is None:
+                limiter = self._host_limiters[host] = HostLimiter(self.host_limit, self.host_rate, self.adaptive)
+        return limiter
+
+    def configure_host(self, url, ceiling=None, rate=None):
+        """
+        Sets the concurrency ceiling and/or request rate of the host of 'url' (eg. from its config.json entry),
+        overriding 'host_limit' and 'host_rate'.
+        """
+        self.host_limiter(url).configure(ceiling, rate)
+
+    def describe_sensor(self, sos, procedure, output_format, metrics=None, max_age=None):
+        """
+        Returns the parsed DescribeSensor response for a single procedure, reading through the SensorML cache (with a
+        cached response used for up to 'max_age' seconds rather than the cache's TTL, if not None).  Requests are
+        recorded in 'metrics' if not None.
+        """
+        headers = {}
+        if self.cache is not None:
+            content, headers = self.cache.get(sos.url, procedure, output_format, max_age)
+            if content is not None:
+                if metrics is not None:
+                    metrics.count('describe_sensor_cache_hits')
+                return etree.fromstring(content)
+
+        base_url, params = describe_sensor_request(sos, procedure, output_format)
+        response = self.get(base_url, params=params, headers=headers, metrics=metrics, observe=True)
+        if metrics is not None and response.status_code == 304:
+            metrics.count('describe_sensor_not_modified')
+        try:
+            return self.resolve(sos, procedure, output_format, response.status_code, response.headers, response.content)
+        except ServiceException:
+            # the SOS is refusing requests, back off:
+            self.host_limiter(base_url).feedback(failed=True)
+            raise
+
+    def get(self, url, params=None, headers=None, metrics=None, observe=False):
+        """
+        Issues a GET request over the shared session, within the host's concurrency limit (not held while backing off
+        before a retry), retrying transient failures.  Each attempt's outcome adjusts the host's concurrency limit.
+        Retries (and request latencies, if 'observe') are recorded in 'metrics' if not None.  Returns the response.
+        """
+        session = self.get_session()
+        limiter = self.host_limiter(url)
+
+        def send():
+            limiter.acquire()
+            start = time.time()
+            failed = True
+            try:
+                response = session.get(url, params=params, headers=headers, timeout=self.timeout)
+                failed = response.status_code >= 500 or response.status_code == 429
+                return response
+            finally:
+                latency = time.time() - start
+                limiter.release(latency, failed)
+                if observe and metrics is not None:
+                    metrics.observe_request(latency)
+
+        return self.retry_policy.request(send, metrics)
+
+    def resolve(self, sos, procedure, output_format, status_code, headers, content):
+        """
+        Returns the parsed DescribeSensor response for an HTTP response, storing SensorML documents in the SensorML
+        cache and substituting the cached response if the server responded '304 Not Modified'.
+        """
+        if status_code == 304 and self.cache is not None:
+            return etree.fromstring(self.cache.revalidated(sos.url, procedure, output_format))
+        tree = check_response(status_code, content)
+        # anything else (eg. an exception the SOS reports in another format) must not be served from the cache:
+        if self.cache is not None and tree.tag == SENSORML_TAG:
+            self.cache.put(sos.url, procedure, output_format, headers, content)
+        return tree
+
+    def fetch_sensorml(self, sos, procedure, output_formats, metrics=None, max_age=None):
+        """
+        Requests SensorML for 'procedure' trying each of 'output_formats' in order until one succeeds, reading through
+        the SensorML cache as describe_sensor does.  Requests, failures and outputFormat retries are recorded in
+        'metrics' if not None.
+
+        Returns a tuple (parsed SensorML document or None, last output format tried, list of error messages for failed
+        formats)
+        """
+        errors = []
+        for fmt in output_formats:
+            if errors and metrics is not None:
+                metrics.count('describe_sensor_format_retries')
+            try:
+                return self.describe_sensor(sos, procedure, fmt, metrics, max_age), fmt, errors
+            except (ServiceException, ExceptionReport, RequestException) as e:
+                errors.append(str(e))
+                if metrics is not None:
+                    metrics.count('describe_sensor_failures')
+        return None, fmt, errors
+
+    def metadata_plus_exceptions(self, sos, procedures, output_format, metrics=None, fetch=None):
+        """
+        Concurrent equivalent of Pyoos' IoosSweSos.metadata_plus_exceptions.
+
+        Returns two dictionaries keyed by procedure: parsed SensorML documents for successful requests, and the error
+        text for failed requests.  Each procedure's SensorML is obtained with 'fetch' (a function taking the same
+        arguments as fetch_sensorml, eg. to read through a journal) if not None.
+        """
+        if fetch is None:
+            fetch = self.fetch_sensorml
+        responses = {}
+        response_failures = {}
+        results = self.map(lambda procedure: fetch(sos, procedure, [output_format], metrics), procedures)
+        for procedure, (sml, fmt, errors) in zip(procedures, results):
+            if sml is not None:
+                responses[procedure] = sml
+            else:
+                response_failures[procedure] = errors[-1]
+        return responses, response_failures
+
+    def map(self, func, items):
+        """
+        Applies 'func' to each of 'items' on the worker pool, returning results in the order of 'items'.  The pool is
+        shared by all callers (eg. several services harvested concurrently in batch mode).
+        """
+        items = list(items)
+        if not items:
+            return []
+        return self.get_pool().map(func, items)
+
+    def imap(self, func, items, window):
+        """
+        Lazy equivalent of map(): yields results in the order of 'items' as they complete, with at most 'window' items
+        in flight or awaiting the consumer.
+        """
+        return imap_bounded(self.get_pool(), func, items, window)
+
+    def get_pool(self):
+        """
+        Returns the worker pool, creating it on first use.
+        """
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self.workers)
+            return self._pool
+
+    def get_session(self):
+        """
+        Returns the HTTP session, creating it on first use.
+        """
+        with self._lock:
+            if self._session is None:
+                self._session = create_session(pool_size=self.pool_size, pool_hosts=max(10, self.workers))
+            return self._session
+
+    def close(self):
+        """
+        Shuts down the worker pool and closes the HTTP session's connections.
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+            session, self._session = self._session, None
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if session is not None:
+            session.close()
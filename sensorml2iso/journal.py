@@ -0,0 +1,155 @@
+import base64
+import io
+import json
+import os
+import threading
+import time
+import zlib
+
+from lxml import etree
+
+
+class Journal:
+    """
+    Append-only progress journal of a harvest (JSON lines in the output directory), recording each station's fetch
+    (with its SensorML, compressed), parse and render outcome as it happens, so a harvest killed part way through
+    (container restart, OOM killer, ...) can be resumed: the SensorML it fetched is reused rather than requested again,
+    and the stations whose ISO records it wrote are skipped.  Each record is flushed to the OS as it is appended, and a
+    torn last record (written as the process died) is ignored.  The journal is deleted once a run completes.
+
+    Attributes
+    ----------
+    path : str
+        Path of the journal file (in the output directory of the harvest).
+    options : str
+        Fingerprint of the harvest options affecting its outputs.  A journal written with other options is not resumed.
+    resumed : bool
+        Whether the journal of an interrupted run was loaded (with 'resume'), and is appended to.
+    fsync : bool
+        Flush each record to disk (not only to the OS).
+    sensorml : dict
+        Tuples (outputFormat, compressed SensorML) journaled by the interrupted run, keyed by station URN.
+    completed : dict
+        Render records of the stations the interrupted run wrote (or found unchanged), keyed by station URN.
+    """
+
+    FILENAME = '.sensorml2iso-journal.jsonl'
+
+    def __init__(self, output_directory, options=None, resume=False, fsync=False):
+        """
+        """
+        self.path = os.path.join(output_directory, self.FILENAME)
+        self.options = options
+        self.fsync = fsync
+        self.sensorml = {}
+        self.completed = {}
+        self.resumed = False
+        self.file = None
+        self.lock = threading.Lock()
+        if resume:
+            self.load()
+
+    def load(self):
+        """
+        Loads the records of an interrupted run written with the same options.
+        """
+        records = []
+        try:
+            with io.open(self.path, mode='rb') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line.decode('utf-8')))
+                    except ValueError:
+                        # torn record written as the process died:
+                        break
+        except (IOError, OSError):
+            return
+        if not records or records[0].get('event') != 'start' or records[0].get('options') != self.options:
+            return
+        for record in records:
+            station_urn = record.get('station')
+            if record.get('stage') == 'fetch' and record.get('ok'):
+                self.sensorml[station_urn] = (record['format'], record['sensorml'])
+            elif record.get('stage') == 'render' and record.get('ok'):
+                self.completed[station_urn] = record
+        self.resumed = True
+
+    def open(self):
+        """
+        Starts journaling, appending to the journal being resumed, or replacing any other.
+        """
+        self.file = io.open(self.path, mode='ab' if self.resumed else 'wb')
+        self.append({'event': 'resume' if self.resumed else 'start', 'options': self.options, 'time': time.time()})
+
+    def append(self, record):
+        """
+        Appends a record (no-op if the journal is not open).
+        """
+        line = (json.dumps(record, sort_keys=True, separators=(',', ':')) + '\n').encode('utf-8')
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(line)
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+
+    def close(self, complete=False):
+        """
+        Stops journaling, deleting the journal if the run is 'complete'.
+        """
+        with self.lock:
+            f, self.file = self.file, None
+        if f is None:
+            return
+        f.close()
+        if complete:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def get_sensorml(self, station_urn, output_formats):
+        """
+        Returns a tuple (parsed SensorML, outputFormat) journaled for a station in one of 'output_formats' by the run
+        being resumed, or None.
+        """
+        journaled = self.sensorml.get(station_urn)
+        if journaled is None or journaled[0] not in output_formats:
+            return None
+        try:
+            return etree.fromstring(zlib.decompress(base64.b64decode(journaled[1]))), journaled[0]
+        except (ValueError, TypeError, zlib.error, etree.XMLSyntaxError):
+            return None
+
+    def fetched(self, station_urn, fmt, sml, errors):
+        """
+        Journals the outcome of a station's DescribeSensor requests.
+        """
+        if self.file is None:
+            return
+        if sml is None:
+            self.append({'station': station_urn, 'stage': 'fetch', 'ok': False, 'format': fmt,
+                         'error': errors[-1] if errors else None})
+            return
+        content = base64.b64encode(zlib.compress(etree.tostring(sml))).decode('ascii')
+        self.append({'station': station_urn, 'stage': 'fetch', 'ok': True, 'format': fmt, 'sensorml': content})
+
+    def parsed(self, station_urn, ok):
+        """
+        Journals whether a station's SensorML was parsed into a station record.
+        """
+        self.append({'station': station_urn, 'stage': 'parse', 'ok': ok})
+
+    def rendered(self, station_urn, station_fingerprint=None, filename=None, metadata_date=None, error=None):
+        """
+        Journals a station's ISO record written to 'filename' (or unchanged, if 'filename' is None), or the 'error'
+        writing it.
+        """
+        record = {'station': station_urn, 'stage': 'render', 'ok': error is None}
+        if error is not None:
+            record['error'] = str(error)
+        elif filename is not None:
+            record.update({'fingerprint': station_fingerprint, 'filename': filename,
+                           'metadataDate': metadata_date.isoformat()})
+        self.append(record)
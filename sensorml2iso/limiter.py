@@ -0,0 +1,166 @@
+import threading
+import time
+
+# latency (seconds) above the fastest observed request still considered healthy, so that sub-millisecond differences
+# (eg. on a local network) don't hold the limit back:
+LATENCY_SLACK = 0.05
+
+
+class AIMDController:
+    """
+    Additive-increase/multiplicative-decrease (AIMD) concurrency limit of a SOS host, as in TCP congestion control:
+    each successful request raises the limit by 1/limit (about one more request in flight per round of requests) as
+    long as latency stays healthy, and a failure (timeout, connection error, 5xx/429 response or OGC
+    ServiceException) multiplies it by 'decrease_factor', at most once per typical request latency, so a burst of
+    concurrent failures only backs off once.
+
+    Attributes
+    ----------
+    ceiling : int
+        Maximum concurrency limit.
+    limit : float
+        Current concurrency limit (requests in flight allowed: int(limit), at least 1).
+    decrease_factor : float
+        Factor the limit is multiplied by on failure.
+    latency_tolerance : float
+        Latency is healthy while its moving average stays below 'latency_tolerance' times the fastest request (plus
+        LATENCY_SLACK); the limit holds rather than rises otherwise.
+    """
+
+    def __init__(self, ceiling=4, initial=2, decrease_factor=0.5, latency_tolerance=2.0):
+        """
+        """
+        self.ceiling = max(1, ceiling)
+        self.limit = float(max(1, min(self.ceiling, initial)))
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.latency = None
+        self.min_latency = None
+        self.last_decrease = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def concurrency(self):
+        """
+        Number of requests allowed in flight.
+        """
+        return max(1, int(self.limit))
+
+    def set_ceiling(self, ceiling):
+        """
+        """
+        with self.lock:
+            self.ceiling = max(1, ceiling)
+            self.limit = min(self.limit, self.ceiling)
+
+    def healthy(self):
+        """
+        Returns whether latency is healthy (always, until requests have been timed).
+        """
+        if self.latency is None:
+            return True
+        return self.latency <= self.latency_tolerance * self.min_latency + LATENCY_SLACK
+
+    def success(self, latency):
+        """
+        Records a successful request taking 'latency' seconds.
+        """
+        with self.lock:
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            self.min_latency = latency if self.min_latency is None else min(self.min_latency, latency)
+            if self.healthy():
+                self.limit = min(self.ceiling, self.limit + 1.0 / self.limit)
+
+    def failure(self):
+        """
+        Records a failed request.
+        """
+        with self.lock:
+            now = time.time()
+            if now - self.last_decrease < (self.latency or 0.0):
+                return
+            self.last_decrease = now
+            self.limit = max(1.0, self.limit * self.decrease_factor)
+
+
+class HostLimiter:
+    """
+    Caps the requests in flight to a SOS host at its AIMDController's concurrency limit (fixed at the ceiling if not
+    'adaptive'), and optionally spaces request starts to at most 'rate' per second.
+
+    Attributes
+    ----------
+    controller : AIMDController
+        Concurrency limit of the host.
+    adaptive : bool
+        Adapt the concurrency limit to the host's latency and failures (fixed at the ceiling otherwise).
+    rate : float
+        Maximum number of requests started per second (unlimited if None).
+    """
+
+    def __init__(self, ceiling=4, rate=None, adaptive=True):
+        """
+        """
+        self.adaptive = adaptive
+        self.controller = AIMDController(ceiling, initial=2 if adaptive else ceiling)
+        self.rate = rate
+        self.in_flight = 0
+        self.next_start = 0.0
+        self.condition = threading.Condition()
+
+    def configure(self, ceiling=None, rate=None):
+        """
+        Sets the host's concurrency ceiling and/or request rate (None leaves them unchanged).
+        """
+        with self.condition:
+            if ceiling is not None:
+                self.controller.set_ceiling(ceiling)
+                if not self.adaptive:
+                    self.controller.limit = float(self.controller.ceiling)
+            if rate is not None:
+                self.rate = rate
+            self.condition.notify_all()
+
+    def reserve(self):
+        """
+        Reserves the next request start slot allowed by 'rate'.  Returns the time (seconds) to wait until it.
+        """
+        if not self.rate:
+            return 0.0
+        with self.condition:
+            now = time.time()
+            start = max(now, self.next_start)
+            self.next_start = start + 1.0 / self.rate
+            return start - now
+
+    def acquire(self):
+        """
+        Waits until a request to the host may start.
+        """
+        with self.condition:
+            while self.in_flight >= self.controller.concurrency:
+                self.condition.wait()
+            self.in_flight += 1
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def feedback(self, latency=None, failed=False):
+        """
+        Records the outcome of a request in the AIMDController (if 'adaptive').
+        """
+        if not self.adaptive:
+            return
+        if failed:
+            self.controller.failure()
+        elif latency is not None:
+            self.controller.success(latency)
+
+    def release(self, latency=None, failed=False):
+        """
+        Ends a request started with acquire, recording its outcome.
+        """
+        self.feedback(latency, failed)
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
@@ -0,0 +1,118 @@
+import atexit
+import hashlib
+import logging
+import sys
+import threading
+
+try:
+    from queue import Queue  # Python 3
+except ImportError:
+    from Queue import Queue  # Python 2
+
+try:
+    from logging.handlers import QueueHandler, QueueListener  # Python 3.2+
+except ImportError:
+    QueueHandler = QueueListener = None
+
+LOG_LEVELS = ['debug', 'info', 'warning', 'error']
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+# 'extra' for records only written to the log file (eg. raw SensorML dumps), never to the console:
+FILE_ONLY = {'file_only': True}
+
+# queue listeners of the open loggers, stopped (flushing their queues) at exit if not closed before:
+_listeners = {}
+_listeners_lock = threading.Lock()
+
+
+class ConsoleFilter(logging.Filter):
+    """
+    Drops records logged with FILE_ONLY from the console.
+    """
+
+    def filter(self, record):
+        return not getattr(record, 'file_only', False)
+
+
+def get_logger(name, log_file=None, level=logging.INFO, console=True):
+    """
+    Returns a logger writing records of 'level' and above to 'log_file' (opened on the first record, not written if
+    None) and to stdout if 'console'.  Records are handed to the handlers through a queue, so logging never blocks a
+    harvest on file or console I/O (handlers are called directly on Python 2, which has no QueueHandler).
+
+    The logger is not registered with the logging module, so the per-harvest loggers of a long-running process are
+    released with their harvests.  Close it with close_logger.
+    """
+    logger = logging.Logger(name, level)
+    logger.propagate = False
+
+    handlers = []
+    if log_file is not None:
+        file_handler = logging.FileHandler(log_file, mode='w', encoding='utf-8', delay=True)
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handlers.append(file_handler)
+    if console:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter('%(message)s'))
+        console_handler.addFilter(ConsoleFilter())
+        handlers.append(console_handler)
+
+    if QueueHandler is None or not handlers:
+        for handler in handlers:
+            logger.addHandler(handler)
+        return logger
+
+    queue = Queue(-1)
+    listener = QueueListener(queue, *handlers)
+    listener.start()
+    logger.addHandler(QueueHandler(queue))
+    with _listeners_lock:
+        _listeners[id(logger)] = (listener, handlers)
+    return logger
+
+
+def close_logger(logger):
+    """
+    Writes out the records still queued for a logger from get_logger, and closes its handlers.
+    """
+    with _listeners_lock:
+        listener, handlers = _listeners.pop(id(logger), (None, None))
+    if listener is not None:
+        listener.stop()
+    for handler in list(logger.handlers) + (handlers or []):
+        handler.close()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+
+def get_level(name=None, verbose=False):
+    """
+    Returns the logging level for a LOG_LEVELS name ('debug' if 'verbose', 'info' otherwise if None).
+    """
+    if name is None:
+        name = 'debug' if verbose else 'info'
+    return getattr(logging, name.upper())
+
+
+def sampled(key, rate):
+    """
+    Returns whether 'key' (eg. a station URN) falls in a 'rate' fraction (0 to 1) sample, chosen by hash so the same
+    keys are sampled on every run.
+    """
+    if rate <= 0:
+        return False
+    if rate >= 1:
+        return True
+    return int(hashlib.sha1(key.encode('utf-8')).hexdigest()[:8], 16) < rate * 0x100000000
+
+
+@atexit.register
+def _stop_listeners():
+    with _listeners_lock:
+        listeners = list(_listeners.values())
+        _listeners.clear()
+    for listener, handlers in listeners:
+        listener.stop()
+        for handler in handlers:
+            handler.close()
@@ -0,0 +1,109 @@
+import hashlib
+import io
+import json
+import os
+
+from .util import atomic_write
+
+
+def fingerprint(*inputs):
+    """
+    Returns a SHA-1 hex digest identifying a set of JSON-serializable rendering inputs.
+    """
+    serialized = json.dumps(inputs, sort_keys=True, default=str, separators=(',', ':'))
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+def template_checksum(template_dir):
+    """
+    Returns a SHA-1 hex digest of the contents of all templates in 'template_dir' (the template version).
+    """
+    sha1 = hashlib.sha1()
+    for name in sorted(os.listdir(template_dir)):
+        path = os.path.join(template_dir, name)
+        if not os.path.isfile(path):
+            continue
+        sha1.update(name.encode('utf-8'))
+        with open(path, 'rb') as f:
+            sha1.update(f.read())
+    return sha1.hexdigest()
+
+
+class Manifest:
+    """
+    Records, per station, the fingerprint of the inputs its ISO record was rendered from, so stations whose inputs are
+    unchanged since the previous run can skip rendering and keep their existing output file (and metadataDate).
+
+    Attributes
+    ----------
+    output_directory : str
+        Output directory the manifest file is stored in (alongside the ISO records it describes).
+    entries : dict
+        Manifest entries ('fingerprint', 'filename', 'metadataDate') keyed by station URN.
+    """
+
+    FILENAME = '.sensorml2iso-manifest.json'
+
+    def __init__(self, output_directory):
+        """
+        """
+        self.output_directory = output_directory
+        self.path = os.path.join(output_directory, self.FILENAME)
+        self.seen = set()
+        try:
+            with io.open(self.path, mode='rt', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.entries = {}
+
+    def unchanged(self, station_urn, station_fingerprint, filename):
+        """
+        Returns True if the station's record was previously rendered from identical inputs and is still present.
+        """
+        entry = self.entries.get(station_urn)
+        if entry is None or entry['fingerprint'] != station_fingerprint or entry['filename'] != filename:
+            return False
+        return os.path.exists(os.path.join(self.output_directory, filename))
+
+    def retain(self, station_urn):
+        """
+        Marks a station as part of the current run without changing its entry.
+        """
+        self.seen.add(station_urn)
+
+    def update(self, station_urn, station_fingerprint, filename, metadata_date):
+        """
+        Records a station's newly rendered record.
+        """
+        self.seen.add(station_urn)
+        self.entries[station_urn] = {
+            'fingerprint': station_fingerprint,
+            'filename': filename,
+            'metadataDate': metadata_date.isoformat()
+        }
+
+    def removed(self):
+        """
+        Returns a dict of output filenames keyed by station URN for stations not part of the current run.
+        """
+        return {station_urn: entry['filename'] for station_urn, entry in self.entries.items()
+                if station_urn not in self.seen}
+
+    def current(self, kept=()):
+        """
+        Returns the output filenames of the stations part of the current run, and of the stations 'kept' (eg. stations
+        that failed in the current run, whose previous records are kept).
+        """
+        return [entry['filename'] for station_urn, entry in self.entries.items()
+                if station_urn in self.seen or station_urn in kept]
+
+    def remove(self, station_urn):
+        """
+        Drops a station's entry.
+        """
+        self.entries.pop(station_urn, None)
+
+    def save(self):
+        """
+        """
+        atomic_write(self.path, json.dumps(self.entries, indent=2, sort_keys=True).encode('utf-8'))
@@ -0,0 +1,201 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from .util import atomic_write, timed
+
+# run phases, in pipeline order:
+PHASES = ['capabilities', 'describe_sensor', 'parse', 'filter', 'render', 'write']
+
+# upper bounds (seconds) of the DescribeSensor request latency histogram buckets:
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+# run counters, with their Prometheus help text:
+COUNTERS = [
+    ('describe_sensor_requests', 'DescribeSensor requests sent'),
+    ('describe_sensor_cache_hits', 'DescribeSensor responses served from the SensorML cache without a request'),
+    ('describe_sensor_not_modified', 'DescribeSensor requests answered with 304 Not Modified'),
+    ('describe_sensor_failures', 'DescribeSensor requests that failed (any outputFormat)'),
+    ('describe_sensor_format_retries', 'DescribeSensor requests retried with another outputFormat'),
+    ('describe_sensor_resumed', 'DescribeSensor responses reused from the journal of the interrupted run resumed'),
+    ('http_retries', 'SOS requests retried after a transient failure'),
+    ('host_concurrency_limit', 'Adaptive concurrency limit of requests to the SOS host at the end'),
+    ('stations_added', 'Stations added to the GetCapabilities document since the previous run'),
+    ('stations_changed', 'Stations whose GetCapabilities offering changed since the previous run'),
+    ('stations_removed', 'Stations removed from the GetCapabilities document since the previous run'),
+    ('stations_total', 'Stations with valid SensorML'),
+    ('stations_active', 'Stations passing the active station filter'),
+    ('stations_prefiltered', 'Stations inactive by their GetCapabilities offering, not requested'),
+    ('stations_failed', 'Stations that failed'),
+    ('stations_written', 'ISO records written'),
+    ('stations_unchanged', 'ISO records unchanged since the previous run'),
+    ('stations_resumed', 'Stations completed by the interrupted run resumed, and skipped')
+]
+
+
+def escape_label(value):
+    """
+    Escapes a Prometheus label value.
+    """
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Metrics:
+    """
+    Timings and counters of a harvest run: the time spent in each phase (PHASES), a DescribeSensor request latency
+    histogram and run counters (COUNTERS).  Safe to update from the fetcher's worker threads.  Written at the end of
+    every run as JSON and/or as a Prometheus textfile (for node_exporter's textfile collector).
+
+    Attributes
+    ----------
+    service : str
+        URL of the SOS service harvested.
+    phases : dict
+        Seconds spent in each phase.
+    counters : dict
+        Run counters.
+    latency_buckets : list
+        DescribeSensor request counts per LATENCY_BUCKETS bucket (non-cumulative, plus one for slower requests).
+    """
+
+    def __init__(self, service):
+        """
+        """
+        self.service = service
+        self.started = time.time()
+        self.finished = None
+        self.success = False
+        self.phases = dict((phase, 0.0) for phase in PHASES)
+        self.counters = dict((name, 0) for name, _ in COUNTERS)
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, phase, seconds):
+        """
+        Adds 'seconds' to a phase.
+        """
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, phase):
+        """
+        Context manager adding the time spent in its block to a phase.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(phase, time.time() - start)
+
+    def count(self, name, n=1):
+        """
+        Increments a run counter.
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe_request(self, seconds):
+        """
+        Records the latency of a DescribeSensor request.  Requests are concurrent, so the 'describe_sensor' phase is the
+        time the run spent waiting on them rather than the sum of their latencies.
+        """
+        bucket = len(LATENCY_BUCKETS)
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                bucket = index
+                break
+        with self.lock:
+            self.counters['describe_sensor_requests'] += 1
+            self.latency_buckets[bucket] += 1
+            self.latency_sum += seconds
+
+    def timed(self, iterable, phase):
+        """
+        Yields the items of 'iterable', adding the time spent producing them to a phase.
+        """
+        return timed(iterable, lambda seconds: self.add(phase, seconds))
+
+    def finish(self, success):
+        """
+        Marks the run as finished.
+        """
+        self.finished = time.time()
+        self.success = success
+
+    def to_dict(self):
+        """
+        Returns the metrics as a JSON-serializable dict.
+        """
+        with self.lock:
+            finished = self.finished if self.finished is not None else time.time()
+            buckets = []
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ['+Inf'], self.latency_buckets):
+                cumulative += count
+                buckets.append({'le': bound, 'count': cumulative})
+            return {
+                'service': self.service,
+                'started': self.started,
+                'finished': finished,
+                'seconds': finished - self.started,
+                'success': self.success,
+                'phases': dict(self.phases),
+                'counters': dict(self.counters),
+                'describe_sensor_latency': {
+                    'buckets': buckets,
+                    'sum': self.latency_sum,
+                    'count': cumulative
+                }
+            }
+
+    def write_json(self, path):
+        """
+        Writes the metrics to 'path' as JSON.
+        """
+        atomic_write(path, json.dumps(self.to_dict(), indent=2, sort_keys=True).encode('utf-8'))
+
+    def to_prometheus(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        metrics = self.to_dict()
+        service = u'service="{service}"'.format(service=escape_label(self.service))
+        lines = [
+            u'# HELP sensorml2iso_run_seconds Duration of the last sensorml2iso run.',
+            u'# TYPE sensorml2iso_run_seconds gauge',
+            u'sensorml2iso_run_seconds{{{service}}} {value}'.format(service=service, value=metrics['seconds']),
+            u'# HELP sensorml2iso_run_success Whether the last sensorml2iso run completed (1) or failed (0).',
+            u'# TYPE sensorml2iso_run_success gauge',
+            u'sensorml2iso_run_success{{{service}}} {value}'.format(service=service, value=int(metrics['success'])),
+            u'# HELP sensorml2iso_last_run_timestamp_seconds Time the last sensorml2iso run finished.',
+            u'# TYPE sensorml2iso_last_run_timestamp_seconds gauge',
+            u'sensorml2iso_last_run_timestamp_seconds{{{service}}} {value}'.format(service=service, value=metrics['finished']),
+            u'# HELP sensorml2iso_phase_seconds Time spent in each phase of the last sensorml2iso run.',
+            u'# TYPE sensorml2iso_phase_seconds gauge'
+        ]
+        for phase in PHASES:
+            lines.append(u'sensorml2iso_phase_seconds{{{service},phase="{phase}"}} {value}'.format(
+                service=service, phase=phase, value=metrics['phases'][phase]))
+        for name, help_text in COUNTERS:
+            lines.append(u'# HELP sensorml2iso_{name} {help} in the last sensorml2iso run.'.format(name=name, help=help_text))
+            lines.append(u'# TYPE sensorml2iso_{name} gauge'.format(name=name))
+            lines.append(u'sensorml2iso_{name}{{{service}}} {value}'.format(
+                name=name, service=service, value=metrics['counters'][name]))
+        latency = metrics['describe_sensor_latency']
+        lines.append(u'# HELP sensorml2iso_describe_sensor_request_seconds DescribeSensor request latency in the last sensorml2iso run.')
+        lines.append(u'# TYPE sensorml2iso_describe_sensor_request_seconds histogram')
+        for bucket in latency['buckets']:
+            lines.append(u'sensorml2iso_describe_sensor_request_seconds_bucket{{{service},le="{le}"}} {count}'.format(
+                service=service, le=bucket['le'], count=bucket['count']))
+        lines.append(u'sensorml2iso_describe_sensor_request_seconds_sum{{{service}}} {value}'.format(service=service, value=latency['sum']))
+        lines.append(u'sensorml2iso_describe_sensor_request_seconds_count{{{service}}} {value}'.format(service=service, value=latency['count']))
+        return u"\n".join(lines) + u"\n"
+
+    def write_prometheus(self, path):
+        """
+        Writes the metrics to 'path' as a Prometheus textfile (renamed into place, as node_exporter requires).
+        """
+        atomic_write(path, self.to_prometheus().encode('utf-8'))
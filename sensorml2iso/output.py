@@ -0,0 +1,232 @@
+import io
+import os
+import tarfile
+import tempfile
+import time
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+
+try:
+    from urllib.parse import quote  # Python 3
+except ImportError:
+    from urllib import quote  # Python 2
+
+from .util import atomic_write, replace
+
+FSYNC_MODES = ['none', 'batch', 'always']
+ARCHIVE_FORMATS = ['zip', 'tar.gz']
+
+ARCHIVE_BASENAME = 'iso_records'
+WAF_INDEX = 'index.html'
+
+
+def fsync_directory(path):
+    """
+    Flushes a directory's entries (eg. renames into it) to disk, where the platform supports it.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def fsync_file(path):
+    """
+    Flushes a written file's data to disk.
+    """
+    fd = os.open(path, os.O_RDWR)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def remove_quietly(path):
+    """
+    Removes a file, if it still exists.
+    """
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def temp_path(directory):
+    """
+    Returns the path of a new hidden temporary file in 'directory' (hidden so WAF harvesters never list it).
+    """
+    fd, path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    os.close(fd)
+    return path
+
+
+class OutputWriter:
+    """
+    Writes ISO records into the output directory.  Each record is written to a temporary file in the output directory
+    and renamed over its target, so a crash or a concurrent reader never sees a partially written record.  With
+    'batch' fsync, records are written in batches: the temporary files of a batch are all written, then each is flushed
+    to disk, then all are renamed into place and the output directory is flushed once, rather than flushing the
+    directory after each rename as 'always' does.
+
+    Attributes
+    ----------
+    output_directory : str
+        Directory the records are written to.
+    fsync : str
+        When written records are flushed to disk: 'none' (left to the OS), 'batch' (once per batch of records, then the
+        output directory once per batch) or 'always' (each record and the output directory after each rename).
+    batch_size : int
+        Number of records buffered before a batch is written ('batch' fsync only, records are written one at a time
+        otherwise).
+    """
+
+    def __init__(self, output_directory, fsync='none', batch_size=64):
+        """
+        """
+        if fsync not in FSYNC_MODES:
+            raise ValueError("Unknown fsync mode '{fsync}'".format(fsync=fsync))
+        self.output_directory = output_directory
+        self.fsync = fsync
+        self.batch_size = max(1, batch_size) if fsync == 'batch' else 1
+        self.pending = []
+
+    def write(self, basename, data, item=None):
+        """
+        Queues a record ('data', text) to be written to 'basename'.  Returns a list of (item, error) tuples for the
+        records of the batch this completed, in order (error is None for records written successfully), or an empty
+        list if the batch is not complete yet.
+        """
+        self.pending.append((basename, data, item))
+        if len(self.pending) >= self.batch_size:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """
+        Writes the queued records.  Returns a list of (item, error) tuples as 'write' does.
+        """
+        pending, self.pending = self.pending, []
+        errors = [None] * len(pending)
+        tmp_paths = [None] * len(pending)
+        for index, (basename, data, item) in enumerate(pending):
+            try:
+                tmp_paths[index] = self.write_temp(data)
+            except (IOError, OSError) as e:
+                errors[index] = e
+        # flush the records of the batch to disk together, once all are written and before any is renamed into place:
+        if self.fsync == 'batch':
+            for index, tmp_path in enumerate(tmp_paths):
+                if tmp_path is None:
+                    continue
+                try:
+                    fsync_file(tmp_path)
+                except (IOError, OSError) as e:
+                    remove_quietly(tmp_path)
+                    tmp_paths[index] = None
+                    errors[index] = e
+        for index, (basename, data, item) in enumerate(pending):
+            if tmp_paths[index] is None:
+                continue
+            try:
+                replace(tmp_paths[index], os.path.join(self.output_directory, basename))
+            except (IOError, OSError) as e:
+                remove_quietly(tmp_paths[index])
+                errors[index] = e
+        if self.fsync != 'none' and any(error is None for error in errors):
+            fsync_directory(self.output_directory)
+        return [(item, error) for (basename, data, item), error in zip(pending, errors)]
+
+    def write_temp(self, data):
+        """
+        Writes a record to a new temporary file in the output directory.  Returns the temporary file's path.
+        """
+        tmp_path = temp_path(self.output_directory)
+        try:
+            with io.open(tmp_path, mode='wt', encoding='utf8') as f:
+                f.write(data)
+                if self.fsync == 'always':
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o644)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return tmp_path
+
+    def close(self):
+        """
+        Writes any records still queued.  Returns a list of (item, error) tuples as 'write' does.
+        """
+        return self.flush()
+
+
+def archive_filename(archive_format):
+    """
+    Returns the basename of the archive of all records for an archive format.
+    """
+    return "{basename}.{ext}".format(basename=ARCHIVE_BASENAME, ext=archive_format)
+
+
+def write_archive(output_directory, basenames, archive_format):
+    """
+    Packages the records 'basenames' of 'output_directory' into a single zip or tar.gz archive in the output directory,
+    written atomically.  Returns the archive's path.
+    """
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ValueError("Unknown archive format '{archive_format}'".format(archive_format=archive_format))
+    path = os.path.join(output_directory, archive_filename(archive_format))
+    tmp_path = temp_path(output_directory)
+    try:
+        if archive_format == 'zip':
+            with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for basename in basenames:
+                    archive.write(os.path.join(output_directory, basename), basename)
+        else:
+            with tarfile.open(tmp_path, 'w:gz') as archive:
+                for basename in basenames:
+                    archive.add(os.path.join(output_directory, basename), basename)
+        os.chmod(tmp_path, 0o644)
+        replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def write_waf_index(output_directory, basenames, title):
+    """
+    Writes a Web Accessible Folder (WAF) index page listing the records 'basenames' (and any other files, eg. an
+    archive, given) of 'output_directory' with their sizes and modification times, written atomically.  Returns the
+    index page's path.
+    """
+    rows = []
+    for basename in sorted(basenames):
+        stat = os.stat(os.path.join(output_directory, basename))
+        rows.append(u'<tr><td><a href={href}>{name}</a></td><td>{modified}</td><td>{size}</td></tr>'.format(
+            href=quoteattr(quote(basename)), name=escape(basename),
+            modified=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(stat.st_mtime)), size=stat.st_size))
+    page = u"\n".join([
+        u'<!DOCTYPE html>',
+        u'<html>',
+        u'<head><meta charset="utf-8"><title>{title}</title></head>'.format(title=escape(title)),
+        u'<body>',
+        u'<h1>{title}</h1>'.format(title=escape(title)),
+        u'<table>',
+        u'<tr><th>Name</th><th>Last modified</th><th>Size</th></tr>'
+    ] + rows + [
+        u'</table>',
+        u'</body>',
+        u'</html>',
+        u''
+    ])
+    path = os.path.join(output_directory, WAF_INDEX)
+    atomic_write(path, page.encode('utf-8'))
+    return path
@@ -0,0 +1,130 @@
+"""
+Streaming harvest ('--stream'): each station flows through the fetch, parse, render and write stages as soon as its
+SensorML arrives, rather than after the whole service has been harvested.
+"""
+from itertools import chain
+
+from .capabilities import OfferingIndex
+from .record import to_csv
+
+
+class StreamingHarvester:
+    """
+    Harvests a SOS service as a pipeline of bounded stages: DescribeSensor requests are issued from the fetcher's worker
+    pool at most 'queue_size' stations ahead of parsing, and parsed stations are rendered and written in turn (at most
+    'queue_size' stations ahead of writing when rendering across processes).  Memory use is independent of the number
+    of stations, and ISO records are written from the first station on.
+
+    Attributes
+    ----------
+    s2i : Sensorml2Iso
+        The Sensorml2Iso instance the harvest is run for (used for parsing, rendering and reporting).
+    queue_size : int
+        Maximum number of stations buffered between the fetch and parse stages.
+    """
+
+    def __init__(self, s2i, queue_size=64):
+        """
+        """
+        self.s2i = s2i
+        self.queue_size = max(1, queue_size)
+        self.total_cnt = 0
+        self.active_cnt = 0
+
+    def run(self, sos_url, station_urns_sel=None):
+        """
+        Runs the harvest to completion.  Returns the number of valid stations harvested.
+        """
+        s2i = self.s2i
+        sos_url_params = s2i.get_capabilities_url(sos_url)
+        sosgc = s2i.get_sos(sos_url_params)
+        offerings = OfferingIndex(sosgc)
+
+        if station_urns_sel is not None:
+            station_urns = station_urns_sel
+        else:
+            station_urns = s2i.get_station_urns(sosgc)
+            s2i.report_stations(sos_url_params, station_urns)
+        station_urns = s2i.stations_to_fetch(sosgc, station_urns)
+
+        station_active_date = s2i.station_active_date
+        s2i.generate_iso(self.stations(sosgc, offerings, station_urns, sos_url, sos_url_params, station_active_date))
+
+        if station_active_date is not None:
+            s2i.logger.debug("Date for determining active/inactive stations in SOS service: %s", station_active_date.date())
+            s2i.logger.debug("'Active' stations: %d / Total stations: %d", self.active_cnt, self.total_cnt + s2i.prefiltered)
+
+        if s2i.sensorml_cache is not None:
+            evicted = s2i.sensorml_cache.prune()
+            if evicted:
+                s2i.logger.debug("Evicted %d least recently used entries from SensorML cache", evicted)
+
+        return self.total_cnt
+
+    def stations(self, sosgc, offerings, station_urns, sos_url, sos_url_params, station_active_date):
+        """
+        Yields the record of each active station in 'station_urns' order, as its SensorML arrives.  Sets the
+        Sensorml2Iso 'failures' list once exhausted.
+        """
+        s2i = self.s2i
+        fetcher = s2i.fetcher
+        oFrmts = s2i.output_formats(sos_url)
+
+        sml_errors = {}
+        failures = []
+        describe_sensor_url = {}
+        csv_header = True
+        formats = []
+
+        # request SensorML concurrently, iterating oFrmts items for each station (first is IOOS SOS spec-compliant,
+        # second is for NDBC SOS), starting from the format known to work for the service.  If not known yet, the rest
+        # are requested in the format of the first station first:
+        first = []
+        if station_urns and s2i.format_memo.get(sos_url) is None:
+            first.append(s2i.fetch_sensorml(sosgc, station_urns[0], oFrmts))
+            oFrmts = s2i.prefer_output_format(oFrmts, [fmt for sml, fmt, errors in first if sml is not None])
+        results = chain(first, fetcher.imap(lambda station_urn: s2i.fetch_sensorml(sosgc, station_urn, oFrmts),
+                                            station_urns[len(first):], self.queue_size))
+        # the describe_sensor phase is the time spent waiting on DescribeSensor responses:
+        results = s2i.metrics.timed(results, 'describe_sensor')
+        for station_urn, (sml, fmt, errors) in zip(station_urns, results):
+            station_describe_sensor_url = s2i.generate_describe_sensor_url(sosgc, procedure=station_urn, oFrmt=fmt)
+            if sml is None:
+                sml_errors[station_urn] = errors[-1]
+                describe_sensor_url[station_urn] = station_describe_sensor_url
+                s2i.logger.warning("Station: %s failed (no SensorML in sml_recs dict).  URL: %s", station_urn, station_describe_sensor_url.replace("&amp;", "&"))
+                failures.append(station_urn)
+                continue
+
+            with s2i.metrics.timer('parse'):
+                station = s2i.get_station_record(station_urn, sml, sosgc, offerings, sos_url, sos_url_params,
+                                                 station_describe_sensor_url)
+            # the SensorML tree is no longer needed once parsed:
+            del sml
+            s2i.journal.parsed(station_urn, station is not None)
+            if station is None:
+                failures.append(station_urn)
+                continue
+            # the outputFormat is only learned from stations whose SensorML was parsed into station records:
+            formats.append(fmt)
+
+            self.total_cnt += 1
+            s2i.metrics.count('stations_total')
+            if station_active_date is not None:
+                with s2i.metrics.timer('filter'):
+                    active = station.is_active(station_active_date)
+                if not active:
+                    continue
+                if s2i.verbose:
+                    s2i.csv.write(to_csv([station], header=csv_header))
+                    csv_header = False
+            self.active_cnt += 1
+            s2i.metrics.count('stations_active')
+
+            yield station
+
+        if station_urns:
+            s2i.learn_output_format(sos_url, formats)
+        s2i.failures = failures
+        s2i.report_sensorml_errors(sos_url_params, sml_errors)
+        s2i.report_failures(sml_errors, failures, describe_sensor_url)
@@ -0,0 +1,119 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import pytz
+
+
+def to_utc(value):
+    """
+    Returns a datetime as a timezone-aware UTC datetime, or None if 'value' is None.  Naive datetimes are taken to be in
+    UTC (as OWSLib returns indeterminate 'now' positions).
+    """
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return pytz.utc.localize(value)
+    return value.astimezone(pytz.utc)
+
+
+def active_since(days):
+    """
+    Returns the timezone-aware UTC time 'days' days before now, after which stations must have observations to be
+    active.
+    """
+    return datetime.now(pytz.utc) - timedelta(days=days)
+
+
+class StationRecord(object):
+    """
+    The template inputs harvested for a single station, with a fixed set of fields.  Fields can be read and assigned
+    as attributes or by name (record['lon']).
+
+    Attributes
+    ----------
+    lon, lat : float
+        Station location (None if not available in the SensorML)
+    station_urn : str
+        Station URN
+    sos_url, describesensor_url : str
+        GetCapabilities and DescribeSensor request URLs for the station
+    shortName, longName, wmoID, serverName : str
+        Station identification
+    title, abstract : str
+        Capabilities-level service metadata
+    keywords : list
+        Capabilities-level service keywords
+    begin_service_date : datetime.datetime
+        Start of the station's validTime (the harvest time if not available)
+    platformType, parentNetwork, sponsor : str
+        Station classifiers
+    contacts_dct : dict
+        owslib Contact objects keyed by role
+    documents_dct : dict
+        owslib Documentation objects keyed by name
+    starting, ending : datetime.datetime
+        Station observation time range (None if not available)
+    variable_uris, variables : list
+        Observed property URIs and names
+    parameter_uris, parameters : str
+        Comma-separated parameter URIs and names
+    response_formats, download_formats : list
+        GetObservation responseFormats offered by the station, and those linked to in the ISO record
+    getobs_req_dct : dict
+        Example GetObservation request details, keyed by '<variable>-<responseFormat>'
+    fingerprint : str
+        Fingerprint of the station's rendering inputs
+    """
+
+    __slots__ = ('lon', 'lat', 'station_urn', 'sos_url', 'describesensor_url', 'shortName', 'longName', 'wmoID',
+                 'serverName', 'title', 'abstract', 'keywords', 'begin_service_date', 'platformType', 'parentNetwork',
+                 'sponsor', 'contacts_dct', 'documents_dct', 'starting', 'ending', 'variable_uris', 'variables',
+                 'parameter_uris', 'parameters', 'response_formats', 'download_formats', 'getobs_req_dct',
+                 'fingerprint')
+
+    def __init__(self, **fields):
+        """
+        """
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def __getitem__(self, name):
+        """
+        """
+        return getattr(self, name)
+
+    def __setitem__(self, name, value):
+        """
+        """
+        setattr(self, name, value)
+
+    def keys(self):
+        """
+        Returns the field names, in order.
+        """
+        return list(self.__slots__)
+
+    def to_dict(self):
+        """
+        Returns the fields as an OrderedDict.
+        """
+        return OrderedDict((name, getattr(self, name)) for name in self.__slots__)
+
+    def is_active(self, active_date):
+        """
+        Returns True if the station's 'ending' time is later than 'active_date' (naive datetimes are taken to be in UTC).
+        """
+        if self.ending is None:
+            return False
+        return to_utc(self.ending) > to_utc(active_date)
+
+
+def to_csv(records, header=True):
+    """
+    Returns station records as CSV text (indexed by station URN), for the verbose mode sensorml2iso.csv export.
+    """
+    # pandas is only needed for this export, so it is not imported in normal runs:
+    import pandas as pd
+    stations_df = pd.DataFrame.from_records([record.to_dict() for record in records], columns=StationRecord.__slots__)
+    stations_df.index = stations_df['station_urn']
+    return stations_df.to_csv(encoding='utf-8', header=header)
@@ -0,0 +1,131 @@
+import hashlib
+import multiprocessing
+import os
+import threading
+
+from .manifest import fingerprint, template_checksum
+from .util import imap_bounded, makedirs
+
+PACKAGE_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+TEMPLATE_NAME = 'sensorml_iso.xml'
+
+# Jinja2 environments keyed by (template_dir, bytecode_cache_dir), shared by every harvest in the process so each
+# template is compiled once (environments cache their compiled templates):
+_environments = {}
+_environments_lock = threading.Lock()
+
+# the ISO template compiled by each rendering worker process:
+_worker_template = None
+
+
+def get_bytecode_cache(directory):
+    """
+    Returns a Jinja2 bytecode cache storing compiled templates in 'directory', keyed by template name, path and source
+    checksum, so processes rendering the same templates skip compiling them, and edited or user-supplied templates
+    never pick up another template's bytecode.
+    """
+    from jinja2 import FileSystemBytecodeCache
+    from jinja2.bccache import Bucket
+
+    class ChecksumBytecodeCache(FileSystemBytecodeCache):
+
+        def get_bucket(self, environment, name, filename, source):
+            checksum = self.get_source_checksum(source)
+            key = hashlib.sha1(u"|".join([name, filename or u"", checksum]).encode('utf-8')).hexdigest()
+            bucket = Bucket(environment, key, checksum)
+            self.load_bytecode(bucket)
+            return bucket
+
+    makedirs(directory)
+    return ChecksumBytecodeCache(directory)
+
+
+def get_environment(template_dir=None, bytecode_cache_dir=None):
+    """
+    Returns the process-wide Jinja2 environment loading templates from 'template_dir' (if any), then the package
+    templates, so a template directory can override eg. just macros.xml.  Compiled templates are persisted in
+    'bytecode_cache_dir' if not None.
+    """
+    key = (template_dir, bytecode_cache_dir)
+    with _environments_lock:
+        env = _environments.get(key)
+        if env is None:
+            from jinja2 import ChoiceLoader, Environment, FileSystemLoader, PackageLoader
+            loader = PackageLoader('sensorml2iso', 'templates')
+            if template_dir is not None:
+                loader = ChoiceLoader([FileSystemLoader(template_dir), loader])
+            bytecode_cache = get_bytecode_cache(bytecode_cache_dir) if bytecode_cache_dir is not None else None
+            env = Environment(loader=loader, bytecode_cache=bytecode_cache, trim_blocks=True, lstrip_blocks=True,
+                              autoescape=True)
+            _environments[key] = env
+    return env
+
+
+def get_template(template_dir=None, bytecode_cache_dir=None):
+    """
+    Returns the compiled ISO 19115-2 template (the package template, unless overridden in 'template_dir').
+    """
+    return get_environment(template_dir, bytecode_cache_dir).get_template(TEMPLATE_NAME)
+
+
+def template_version(template_dir=None):
+    """
+    Returns a SHA-1 hex digest identifying the templates ISO records are rendered with (package templates plus any in
+    'template_dir').
+    """
+    version = template_checksum(PACKAGE_TEMPLATE_DIR)
+    if template_dir is not None:
+        version = fingerprint(version, template_checksum(template_dir))
+    return version
+
+
+def init_worker(template_dir=None, bytecode_cache_dir=None):
+    """
+    Rendering worker process initializer: compiles the ISO template once per worker (loaded from the bytecode cache if
+    available).
+    """
+    global _worker_template
+    _worker_template = get_template(template_dir, bytecode_cache_dir)
+
+
+def render_context(ctx):
+    """
+    Renders a single station's template context in a rendering worker process.
+    """
+    return _worker_template.render(ctx)
+
+
+def pool_context():
+    """
+    Returns the multiprocessing context rendering worker processes are started with: 'spawn', as the harvesting
+    process is multi-threaded (fetcher pool, log listeners, the services of a batch or 'serve'), and a worker forked
+    while another thread holds a lock (eg. _environments_lock, or a logging lock) would deadlock acquiring it.  Python
+    2 has no start methods, and forks.
+    """
+    try:
+        return multiprocessing.get_context('spawn')
+    except AttributeError:
+        return multiprocessing
+
+
+def render_all(contexts, template=None, workers=1, template_dir=None, bytecode_cache_dir=None):
+    """
+    Renders each of 'contexts' (station template context dicts, consumed lazily), yielding the ISO XML documents in the
+    order of 'contexts'.  Contexts are rendered in the calling process with 'template' (the template from
+    'template_dir' and the package if None) if 'workers' is 1, or spread across a pool of 'workers' processes
+    otherwise, in which case contexts must be picklable.
+    """
+    if workers <= 1:
+        if template is None:
+            template = get_template(template_dir, bytecode_cache_dir)
+        for ctx in contexts:
+            yield template.render(ctx)
+        return
+
+    pool = pool_context().Pool(workers, initializer=init_worker, initargs=(template_dir, bytecode_cache_dir))
+    try:
+        for iso_xml in imap_bounded(pool, render_context, contexts, workers * 4):
+            yield iso_xml
+    finally:
+        pool.terminate()
+        pool.join()
@@ -1,7 +1,10 @@
 import os
 import errno
-import io
+import hashlib
+import json
+import logging
 import sys
+import time
 from datetime import datetime, timedelta
 from dateutil import parser
 import pytz
@@ -12,24 +15,30 @@ try:
 except ImportError:
     from urllib import unquote, unquote_plus, urlencode  # Python 2
     from urlparse import urlparse
-from collections import OrderedDict
+from collections import Counter, deque
 from lxml import etree
-from requests.exceptions import ConnectionError, ReadTimeout
+from requests.exceptions import RequestException
 
 # import numpy as np
-import pandas as pd
 
-from owslib.sos import SensorObservationService
-from owslib.swe.sensor.sml import SensorML, Contact, Documentation
+from owslib.swe.sensor.sml import Contact, Documentation
 from owslib.util import testXMLValue, testXMLAttribute, nspath_eval, ServiceException
 from owslib.namespaces import Namespaces
 
-from pyoos.collectors.ioos.swe_sos import IoosSweSos
 
-from pyoos.parsers.ioos.describe_sensor import IoosDescribeSensor
-from pyoos.parsers.ioos.one.describe_sensor import ont
-
-from jinja2 import Environment, PackageLoader
+from .cache import OutputFormatMemo, SensorMLCache
+from .capabilities import CapabilitiesCache, CapabilitiesSnapshot, OfferingIndex, load_capabilities
+from .extract import StationSensorML
+from .fetch import DescribeSensorFetcher, check_status, describe_sensor_request
+from .journal import Journal
+from .log import FILE_ONLY, close_logger, get_level, get_logger, sampled
+from .manifest import Manifest, fingerprint
+from .metrics import PHASES, Metrics
+from .pipeline import StreamingHarvester
+from .record import StationRecord, active_since, to_csv
+from .util import atomic_write, timed
+from .output import OutputWriter, archive_filename, write_archive, write_waf_index
+from .render import render_all, template_version
 
 
 class Sensorml2Iso:
@@ -50,10 +59,94 @@ class Sensorml2Iso:
         Name of SOS implementation type [ioos|ndbc|coops]
     output_dir : str
         Name of an output directory (relative) to output ISO 19115-2 XML metadata to
+    workers : int
+        Number of concurrent DescribeSensor requests to issue
+    host_limit : int
+        Maximum number of concurrent requests to the SOS host (the ceiling of its adaptive concurrency limit, and of
+        a shared 'fetcher' for this service's host if not None)
+    host_rate : float
+        Maximum number of requests started per second against the SOS host (unlimited if None)
+    adaptive : bool
+        Adapt the concurrency of requests to the SOS host to its latency and failures (AIMD, up to 'host_limit')
+        rather than always issuing 'host_limit' concurrent requests
+    timeout : int
+        Timeout (seconds) for each DescribeSensor request
+    pool_size : int
+        Number of HTTP connections kept alive to the SOS host ('host_limit' if None)
+    retries : int
+        Maximum number of retries of a SOS request failing with a transient error (connection error, timeout, or HTTP
+        429/502/503/504 status)
+    retry_backoff : float
+        Base backoff (seconds) of the jittered exponential backoff between retries
+    engine : str
+        Name of the harvesting engine used for SOS requests [threads|asyncio]
+    cache_dir : str
+        Directory to persist downloaded SOS documents in between runs (no caching if None)
+    sensorml_cache_ttl : float
+        Hours a cached DescribeSensor response is used before it is revalidated with the SOS
+    sensorml_cache_size : int
+        Maximum size (MB) of the DescribeSensor response cache
+    sensorml_max_age : float
+        Hours a cached DescribeSensor response is used for a station whose GetCapabilities offering is unchanged since
+        the previous run (responses of stations added or changed since are revalidated with the SOS)
+    diff_report : str
+        Path of the JSON report of the stations added, changed and removed since the previous run's GetCapabilities
+        document, written at every run with a 'cache_dir' (not written if None)
+    render_workers : int
+        Number of processes to render station ISO records in (rendered in-process if 1)
+    template_dir : str
+        Directory of templates overriding the package templates of the same name (eg. sensorml_iso.xml, macros.xml)
+    stream : bool
+        Stream each station through to ISO output as soon as its SensorML arrives, with bounded memory use
+    queue_size : int
+        Maximum number of stations buffered between pipeline stages when streaming
+    fsync : str
+        When written ISO records are flushed to disk [none|batch|always]
+    archive : str
+        Also package all ISO records into a single archive in the output directory [zip|tar.gz] (not packaged if None)
+    waf_index : bool
+        Also generate a Web Accessible Folder (WAF) index page of the ISO records in the output directory
+    force : bool
+        Render and write every station's ISO record, even if its inputs are unchanged since the previous run
+    prune : bool
+        Delete ISO records of stations that are no longer output (stations that failed in the current run are kept)
+    resume : bool
+        Resume the harvest interrupted in the previous run (if any) from its journal, reusing the SensorML it fetched
+        and skipping the stations whose ISO records it wrote
+    log_file : str
+        Path of the log file to write (opened on the first record logged, not written if None)
+    log_level : str
+        Minimum level of the messages logged [debug|info|warning|error] ('debug' if 'verbose', 'info' otherwise if None)
+    sensorml_dump_rate : float
+        Fraction (0 to 1) of stations whose raw SensorML is written to the log file at the 'debug' level
+    metrics_file : str
+        Path of the JSON file the run's timings and counters are written to at the end of every run (not written if None)
+    prometheus_file : str
+        Path of a Prometheus textfile (eg. in node_exporter's textfile collector directory) the run's timings and
+        counters are written to at the end of every run (not written if None)
+    csv_file : str
+        Path of the station CSV file written in verbose mode
+    fetcher : DescribeSensorFetcher
+        A DescribeSensorFetcher (worker pool and SensorML cache) shared with other instances, eg. in batch mode.  One
+        is created from the 'workers', 'host_limit', 'timeout' and cache parameters if None.
+    capabilities_cache : CapabilitiesCache
+        A GetCapabilities cache shared with other instances.  One is created in 'cache_dir' if None.
+    format_memo : OutputFormatMemo
+        The DescribeSensor outputFormat known to work for each SOS service, shared with other instances.  One is
+        created in 'cache_dir' (in memory if None) if None.
+    template : jinja2.Template
+        A compiled ISO template to render with in-process.  The template is otherwise obtained from the process-wide
+        rendering environment for 'template_dir' (compiled once per process, with compiled templates persisted in
+        'cache_dir').
     more : str
         More class attributes...
     """
 
+    # IOOS SOS DescribeSensor OutputFormat strings (first is compliant to the IOOS SOS spec, second is to accommodate
+    # NDBC).  More info here:
+    # http://ioos.github.io/sos-guidelines/doc/wsdd/sos_wsdd_github_notoc/#describesensor-request:638e0b263020c13a76a55332bd966dbe
+    SENSORML_OUTPUT_FORMATS = ['text/xml; subtype="sensorML/1.0.1/profiles/ioos_sos/1.0"', 'text/xml;subtype="sensorML/1.0.1"']
+
     RESPONSE_FORMAT_TYPE_MAP = {
         'application/json': 'application/json',
         'application/zip; subtype=x-netcdf': 'application/x-netcdf',
@@ -76,7 +169,14 @@ class Sensorml2Iso:
     }
 
     def __init__(self, service=None, active_station_days=None, stations=None, getobs_req_hours=None,
-                 response_formats=None, sos_type=None, output_dir=None, verbose=False):
+                 response_formats=None, sos_type=None, output_dir=None, workers=8, host_limit=4, timeout=200,
+                 host_rate=None, adaptive=True, pool_size=None, retries=3, retry_backoff=0.5, engine='threads', cache_dir=None, sensorml_cache_ttl=24, sensorml_cache_size=512,
+                 sensorml_max_age=24, diff_report=None,
+                 render_workers=1, template_dir=None, stream=False, queue_size=64, fsync='none', archive=None,
+                 waf_index=False, force=False, prune=False, resume=False, log_file='sensorml2iso.log', log_level=None,
+                 sensorml_dump_rate=0.0, csv_file='sensorml2iso.csv', metrics_file='sensorml2iso-metrics.json',
+                 prometheus_file=None,
+                 fetcher=None, capabilities_cache=None, format_memo=None, template=None, verbose=False):
         """
         """
 
@@ -87,74 +187,273 @@ class Sensorml2Iso:
         self.getobs_req_hours = getobs_req_hours
         self.response_formats = response_formats
         self.sos_type = sos_type
+        self.engine = engine
+        self.render_workers = render_workers
+        self.template_dir = template_dir
+        self.stream = stream
+        self.queue_size = queue_size
+        self.fsync = fsync
+        self.archive = archive
+        self.waf_index = waf_index
+        self.force = force
+        self.prune = prune
+        self.resume = resume
+        self.sensorml_max_age = sensorml_max_age
+        self.diff_report = diff_report
         self.verbose = verbose
+        self.failures = []
+        self.metrics_file = metrics_file
+        self.prometheus_file = prometheus_file
+        self.metrics = Metrics(service)
+
+        self.template = template
+
+        self.cache_dir = cache_dir
+        self.bytecode_cache_dir = os.path.join(cache_dir, 'templates') if cache_dir is not None else None
+        if capabilities_cache is None and cache_dir is not None:
+            capabilities_cache = CapabilitiesCache(cache_dir)
+        self.capabilities_cache = capabilities_cache
+        if format_memo is None:
+            format_memo = OutputFormatMemo(cache_dir)
+        self.format_memo = format_memo
+
+        # a fetcher passed in is shared with other instances, and is shut down by its owner rather than in run():
+        self.owns_fetcher = fetcher is None
+        if fetcher is None:
+            sensorml_cache = None
+            if cache_dir is not None:
+                sensorml_cache = SensorMLCache(cache_dir, ttl=sensorml_cache_ttl * 3600,
+                                               max_size=sensorml_cache_size * 1024 * 1024)
+            fetcher = DescribeSensorFetcher(workers=workers, host_limit=host_limit if host_limit is not None else 4,
+                                            timeout=timeout, cache=sensorml_cache, pool_size=pool_size,
+                                            retries=retries, retry_backoff=retry_backoff, host_rate=host_rate,
+                                            adaptive=adaptive)
+        self.fetcher = fetcher
+        # this service's host ceiling and rate (eg. from its config.json entry) also apply to a shared fetcher:
+        if host_limit is not None or host_rate is not None:
+            self.fetcher.configure_host(service, host_limit, host_rate)
+        self.sensorml_cache = fetcher.cache
 
         self.service_url = urlparse(self.service)
         self.server_name = self.service_url.netloc
 
-        self.log = io.open('sensorml2iso.log', mode='wt', encoding='utf-8')
+        self.sensorml_dump_rate = sensorml_dump_rate
+        self.logger = get_logger('sensorml2iso.{server}'.format(server=self.server_name), log_file,
+                                 get_level(log_level, verbose))
 
         if output_dir is not None:
             self.output_directory = output_dir
         else:
             self.output_directory = self.service_url.netloc
         self.output_directory = self.output_directory.replace(":", "_")
-
+        # the run's progress journal and active date, set in run():
+        self.journal = Journal(self.output_directory)
+        self.station_active_date = None
+        self.prefiltered = 0
+        # the diff of the GetCapabilities offerings against the previous run's, and the snapshot to save, set in run():
+        self.capabilities_diff = None
+        self.snapshot = None
+
+        self.print_debug_info()
         if self.verbose:
-            self.print_debug_info()
             try:
                 # self.csv = io.open('sensorml2iso.csv', mode='wt', encoding='utf-8')
-                self.csv = open('sensorml2iso.csv', mode='wt')
+                self.csv = open(csv_file, mode='wt')
             except OSError:
                 pass
 
-            if self.stations is not None:
-                self.log.write(u"Station URNs to filter by:\n")
-                print("Station URNs to filter by:")
-                for station in self.stations:
-                    self.log.write(u"URN: {station}\n".format(station=station))
-                    print("URN: {station}".format(station=station))
+        if self.stations is not None and self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Station URNs to filter by:")
+            for station in self.stations:
+                self.logger.debug("URN: %s", station)
 
         if os.path.exists(self.output_directory):
             if not os.path.isdir(self.output_directory):
-                self.log.write(u"\nError: the configured output directory: {output_dir} exists, but is not a directory".format(output_dir=os.path.abspath(self.output_directory)))
+                self.logger.error("Error: the configured output directory: %s exists, but is not a directory", os.path.abspath(self.output_directory), extra=FILE_ONLY)
+                close_logger(self.logger)
                 sys.exit("Error: the configured output directory: {output_dir} exists, but is not a directory".format(output_dir=os.path.abspath(self.output_directory)))
         else:
             self.create_output_dir()
 
     def run(self):
+        """
+        """
+        self.metrics = Metrics(self.service)
+        self.journal = self.open_journal()
+        # stations must have observations after this date to be output (--active_station_days parameter if provided):
+        self.station_active_date = active_since(self.active_station_days) if self.active_station_days is not None else None
+        self.prefiltered = 0
+        self.capabilities_diff = None
+        self.snapshot = None
+        success = False
+        try:
+            self.harvest()
+            self.save_snapshot()
+            success = True
+        finally:
+            # the journal is kept for a later --resume unless the run completed:
+            self.journal.close(complete=success)
+            if self.owns_fetcher:
+                self.fetcher.close()
+            self.write_metrics(success)
+            close_logger(self.logger)
+
+    def open_journal(self):
+        """ Returns the run's progress journal, opened, resuming the journal of the interrupted previous run if
+        configured (--resume parameter if provided)
+        """
+        options = fingerprint(self.service, self.stations, self.active_station_days, self.getobs_req_hours,
+                              self.response_formats, self.sos_type, template_version(self.template_dir))
+        journal = Journal(self.output_directory, options, resume=self.resume, fsync=self.fsync == 'always')
+        if journal.resumed:
+            self.logger.info("Resuming interrupted harvest: %d stations completed, SensorML of %d stations journaled", len(journal.completed), len(journal.sensorml))
+        elif self.resume:
+            self.logger.info("No interrupted harvest to resume in output directory: %s", os.path.abspath(self.output_directory))
+        try:
+            journal.open()
+        except (IOError, OSError) as e:
+            self.logger.warning("Warning: Unable to write journal file: %s.  %s", journal.path, e)
+        return journal
+
+    def stations_to_fetch(self, sosgc, station_urns):
+        """ Returns the station URNs to request SensorML for: 'station_urns' less the stations completed by the
+        interrupted run being resumed, and the stations whose GetCapabilities offering ended before the active date
+        (--active_station_days parameter if provided), so inactive stations cost no DescribeSensor request
+        """
+        if self.journal.completed:
+            station_urns = [station_urn for station_urn in station_urns if station_urn not in self.journal.completed]
+        if self.station_active_date is None:
+            return station_urns
+
+        with self.metrics.timer('filter'):
+            offerings = OfferingIndex(sosgc)
+            ndbc = self.sos_type.lower() == 'ndbc'
+            active_urns = [station_urn for station_urn in station_urns
+                           if not offerings.is_inactive(station_urn, self.station_active_date, ndbc)]
+        self.prefiltered = len(station_urns) - len(active_urns)
+        self.metrics.count('stations_prefiltered', self.prefiltered)
+        self.logger.debug("Stations inactive by their GetCapabilities offering, not requested: %d / %d", self.prefiltered, len(station_urns))
+        return active_urns
+
+    def fetch_sensorml(self, sos, station_urn, output_formats, metrics=None):
+        """ Returns a tuple (SensorML, outputFormat, errors) for a station as DescribeSensorFetcher.fetch_sensorml
+        does, reusing the SensorML journaled by the interrupted run being resumed, and journaling the outcome
+        """
+        journaled = self.journal.get_sensorml(station_urn, output_formats)
+        if journaled is not None:
+            self.metrics.count('describe_sensor_resumed')
+            return journaled[0], journaled[1], []
+        sml, fmt, errors = self.fetcher.fetch_sensorml(sos, station_urn, output_formats,
+                                                       self.metrics if metrics is None else metrics,
+                                                       max_age=self.max_age(station_urn))
+        self.journal.fetched(station_urn, fmt, sml, errors)
+        return sml, fmt, errors
+
+    def max_age(self, station_urn):
+        """ Returns the age (seconds) up to which a station's cached SensorML is used: --sensorml_max_age for a station
+        whose GetCapabilities offering is unchanged since the previous run, 0 (revalidate it) for a station added or
+        changed, or None (the SensorML cache TTL) if there is no previous run to compare with
+        """
+        diff = self.capabilities_diff
+        if diff is None or diff.previous is None:
+            return None
+        return 0 if diff.is_changed(station_urn) else self.sensorml_max_age * 3600
+
+    def diff_capabilities(self, sosgc):
+        """ Diffs the station offerings of a GetCapabilities object against the snapshot of the previous run's (kept in
+        the cache directory), logging and reporting the stations added, changed and removed since (--diff_report
+        parameter if provided)
+        """
+        if self.cache_dir is None:
+            return
+        snapshot = CapabilitiesSnapshot(self.cache_dir, self.service)
+        stations = snapshot.take(OfferingIndex(sosgc), self.get_station_urns(sosgc))
+        diff = snapshot.diff(stations)
+        self.capabilities_diff = diff
+        self.snapshot = (snapshot, stations)
+
+        if diff.previous is None:
+            self.logger.debug("No GetCapabilities snapshot of a previous run to compare with: %s", snapshot.path)
+        else:
+            self.metrics.count('stations_added', len(diff.added))
+            self.metrics.count('stations_changed', len(diff.changed))
+            self.metrics.count('stations_removed', len(diff.removed))
+            self.logger.info("GetCapabilities offerings since the previous run: %d stations added, %d changed, %d removed, %d unchanged", len(diff.added), len(diff.changed), len(diff.removed), len(diff.unchanged))
+            if self.logger.isEnabledFor(logging.DEBUG):
+                for station_urn, fields in sorted(iteritems(diff.changed)):
+                    self.logger.debug("Station offering changed: %s (%s)", station_urn, ", ".join(fields))
+
+        if self.diff_report is not None:
+            report = diff.to_dict()
+            report.update({'service': self.service, 'time': time.time()})
+            try:
+                atomic_write(self.diff_report, json.dumps(report, indent=2, sort_keys=True).encode('utf-8'))
+            except (IOError, OSError) as e:
+                self.logger.warning("Warning: Unable to write GetCapabilities diff report: %s.  %s", self.diff_report, e)
+
+    def save_snapshot(self):
+        """ Saves the snapshot of this run's GetCapabilities offerings for the next run to diff against, less the
+        stations that failed (so they are requested again), and keeping the previous entries of stations not
+        harvested (--stations parameter if provided)
+        """
+        if self.snapshot is None:
+            return
+        snapshot, stations = self.snapshot
+        failures = set(self.failures)
+        for station_urn in list(stations):
+            if station_urn in failures:
+                del stations[station_urn]
+            elif self.stations is not None and station_urn not in self.stations:
+                if station_urn in snapshot.stations:
+                    stations[station_urn] = snapshot.stations[station_urn]
+                else:
+                    del stations[station_urn]
+        try:
+            snapshot.save(stations)
+        except (IOError, OSError) as e:
+            self.logger.warning("Warning: Unable to write GetCapabilities snapshot: %s.  %s", snapshot.path, e)
+
+    def harvest(self):
         """
         """
         self.namespaces = self.get_namespaces()
-        # obtain the stations DataFrame:
-        stations_df = self.get_stations_df(self.service, self.stations)
 
-        if stations_df is None:
-            self.log.write(u"\nNo valid SensorML documents obtained from SOS serivce.  Verify service is compliant with the SOS profile [URL: {url}]".format(url=self.service))
+        # stream stations through to ISO output as they are harvested (--stream parameter if provided):
+        if self.stream:
+            harvester = StreamingHarvester(self, queue_size=self.queue_size)
+            if not harvester.run(self.service, self.stations) and not self.journal.completed and not self.prefiltered:
+                self.logger.error("No valid SensorML documents obtained from SOS serivce.  Verify service is compliant with the SOS profile [URL: %s]", self.service, extra=FILE_ONLY)
+                sys.exit("No valed SensorML documents obtained from SOS serivce.  Verify service is compliant with the SOS profile [URL: {url}]".format(url=self.service))
+            return
+
+        # obtain the station records:
+        station_recs = self.get_station_records(self.service, self.stations)
+
+        # (all stations may have been completed by the interrupted run being resumed, or be inactive):
+        if station_recs is None and (self.journal.completed or self.prefiltered):
+            station_recs = []
+        if station_recs is None:
+            self.logger.error("No valid SensorML documents obtained from SOS serivce.  Verify service is compliant with the SOS profile [URL: %s]", self.service, extra=FILE_ONLY)
             sys.exit("No valed SensorML documents obtained from SOS serivce.  Verify service is compliant with the SOS profile [URL: {url}]".format(url=self.service))
 
-        # determine active/inactive stations (--active_station_days parameter if provided) and filter stations_df accordingly:
-        if self.active_station_days is not None:
-            station_active_date = datetime.now() - timedelta(days=self.active_station_days)
-            active_cnt = len(stations_df[stations_df.ending > station_active_date.isoformat()])
-            total_cnt = len(stations_df)
-            filtered_stations_df = stations_df.loc[stations_df.ending > station_active_date.isoformat()]
-            if self.verbose:
-                # print("Date for determining active/inactive stations in SOS service: {active_date}".format(active_date=active_date.strftime("%Y-%m-%d")))
-                print("Date for determining active/inactive stations in SOS service: {active_date:%Y-%m-%d}".format(active_date=station_active_date))
-                print("'Active' stations: %d / Total stations: %d" % (active_cnt, total_cnt))
-                print("DataFrame sizes: Original(stations_df): {len_stations_df:2.0f}, Filtered: {len_filtered_stations_df:2.0f}".format(len_stations_df=len(stations_df), len_filtered_stations_df=len(filtered_stations_df)))
-                self.log.write(u"\nDate for determining active/inactive stations in SOS service: {active_date:%Y-%m-%d}".format(active_date=station_active_date))
-                self.log.write(u"\n'Active' stations: %d / Total stations: %d" % (active_cnt, total_cnt))
-                self.log.write(u"\nDataFrame sizes: Original(stations_df): {len_stations_df:2.0f}, Filtered: {len_filtered_stations_df:2.0f}".format(len_stations_df=len(stations_df), len_filtered_stations_df=len(filtered_stations_df)))
+        # determine active/inactive stations (--active_station_days parameter if provided) and filter station_recs accordingly:
+        # (stations whose GetCapabilities offering ended before the active date were not requested):
+        if self.station_active_date is not None:
+            with self.metrics.timer('filter'):
+                filtered_station_recs = [station for station in station_recs if station.is_active(self.station_active_date)]
+            self.metrics.count('stations_active', len(filtered_station_recs))
+            active_cnt = len(filtered_station_recs)
+            total_cnt = len(station_recs) + self.prefiltered
+            self.logger.debug("Date for determining active/inactive stations in SOS service: %s", self.station_active_date.date())
+            self.logger.debug("'Active' stations: %d / Total stations: %d", active_cnt, total_cnt)
 
             if self.verbose:
-                # self.csv.write(unicode(stations_df[stations_df.ending > station_active_date.isoformat()].to_csv(encoding='utf-8')))
-                self.csv.write(stations_df[stations_df.ending > station_active_date.isoformat()].to_csv(encoding='utf-8'))
+                self.csv.write(to_csv(filtered_station_recs))
 
-            self.generate_iso(filtered_stations_df)
+            self.generate_iso(filtered_station_recs)
         else:
-            self.generate_iso(stations_df)
+            self.metrics.count('stations_active', len(station_recs))
+            self.generate_iso(station_recs)
         return
 
     # These functions are all from OWSLib, with minor adaptations
@@ -171,417 +470,629 @@ class Sensorml2Iso:
         """
         return nspath_eval(path, self.namespaces)
 
-    def get_stations_df(self, sos_url, station_urns_sel=None):
-        """ Returns a Pandas Dataframe
+    def get_station_records(self, sos_url, station_urns_sel=None):
+        """ Returns a list of StationRecords (None if no valid station SensorML was obtained)
         """
-        # oFrmts: IOOS SOS OutputFormat strings (first is compliant to the IOOS SOS spec,
-        # second is to accommodate NDBC).  More info here:
-        # http://ioos.github.io/sos-guidelines/doc/wsdd/sos_wsdd_github_notoc/#describesensor-request:638e0b263020c13a76a55332bd966dbe
-        oFrmts = ['text/xml; subtype="sensorML/1.0.1/profiles/ioos_sos/1.0"', 'text/xml;subtype="sensorML/1.0.1"']
-        params = {'service': 'SOS', 'request': 'GetCapabilities', 'acceptVersions': '1.0.0'}
-        sos_url_params = sos_url + '?' + urlencode(params)
-        # sos_url_params_quoted = quote(sos_url_params,"/=:")
-        # sos_url_params_unquoted = unquote(sos_url_params)
+        oFrmts = self.output_formats(sos_url)
+        sos_url_params = self.get_capabilities_url(sos_url)
+
+        # obtain the GetCapabilities document and SensorML for each station with the selected harvesting engine:
+        if self.engine == 'asyncio':
+            from .aio import AsyncHarvester
+            harvester = AsyncHarvester(self, workers=self.fetcher.workers, host_limit=self.fetcher.host_limit,
+                                       timeout=self.fetcher.timeout)
+            sosgc, station_urns, sml_recs, sml_formats, sml_errors, describe_sensor_url = harvester.run(
+                sos_url, sos_url_params, station_urns_sel, oFrmts)
+        else:
+            sosgc, station_urns, sml_recs, sml_formats, sml_errors, describe_sensor_url = self.get_sensorml(
+                sos_url, sos_url_params, station_urns_sel, oFrmts)
+        offerings = OfferingIndex(sosgc)
+
+        if self.sensorml_cache is not None:
+            evicted = self.sensorml_cache.prune()
+            if evicted:
+                self.logger.debug("Evicted %d least recently used entries from SensorML cache", evicted)
+
+        station_recs = []
+        failures = []
+        formats = []
+        # populate 'station_recs' list by parsing SensorML strings:
+        for station_idx, station_urn in enumerate(station_urns):
+            # process valid SensorML responses, quietly pass on invalid stations (add to failures list for verbose reporting):
+            try:
+                sml = sml_recs[station_urn]
+            except KeyError:
+                self.logger.warning("Station: %s failed (no SensorML in sml_recs dict).  URL: %s", station_urn, describe_sensor_url[station_urn].replace("&amp;", "&"))
+                failures.append(station_urn)
+                continue
+
+            with self.metrics.timer('parse'):
+                station = self.get_station_record(station_urn, sml, sosgc, offerings, sos_url, sos_url_params,
+                                                  describe_sensor_url[station_urn])
+            self.journal.parsed(station_urn, station is not None)
+            if station is None:
+                failures.append(station_urn)
+                continue
+
+            self.metrics.count('stations_total')
+            station_recs.append(station)
+            formats.append(sml_formats[station_urn])
+
+        # the outputFormat is only learned from stations whose SensorML was parsed into station records:
+        if station_urns:
+            self.learn_output_format(sos_url, formats)
+
+        self.failures = failures + [station_fail for station_fail in sml_errors if station_fail not in sml_recs]
+
+        self.report_failures(sml_errors, failures, describe_sensor_url)
+
+        if station_recs:
+            return station_recs
+        else:
+            return None
+
+    def get_station_record(self, station_urn, sml, sosgc, offerings, sos_url, sos_url_params, describe_sensor_url):
+        """ Returns the StationRecord (template inputs) parsed from a station's SensorML, or None if
+        the station is skipped
+        """
+        if self.sos_type.lower() == 'ndbc':
+            sosgc_station_offering = offerings.get_ndbc(station_urn)
+        else:
+            sosgc_station_offering = None
 
         try:
-            sosgc = SensorObservationService(sos_url_params)
-        except (ConnectionError, ReadTimeout) as e:
-            self.log.write(u"\nError: unable to connect to SOS service: {url} due to HTTP connection error.".format(url=sos_url_params))
-            self.log.write(u"\nHTTP connection error: {err}.".format(err=str(e)))
-            sys.exit("\nError: unable to connect to SOS service: {url}. \nUnderlying HTTP connection error: {err}".format(url=sos_url_params, err=str(e)))
+            ds = StationSensorML(sml)
+        except ValueError:
+            self.logger.warning("Invalid SensorML, skipping.  Check DescribeSensor request for : %s, URL: %s", station_urn, describe_sensor_url.replace("&amp;", "&"))
+            return None
 
-        # vars to store returns from sos_collector.metadata_plus_exceptions function:
+        station = StationRecord()
+        # debug (raw SensorML is only serialized for the sampled stations, and only written to the log file):
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            self.logger.debug("Processing station: %s", station_urn)
+            if sampled(station_urn, self.sensorml_dump_rate):
+                self.logger.debug("SensorML: %s\n%s", station_urn, etree.tostring(sml).decode('utf-8'), extra=FILE_ONLY)
+
+        # GML point location (gml:pos, or 'gml:coordinates' as used by NDBC if gml:pos not found):
+        try:
+            station.lon = float(ds.pos.split()[1])
+            station.lat = float(ds.pos.split()[0])
+        except AttributeError as e:
+            station.lon = None
+            station.lat = None
+
+        # Parse the DocumentList into a dict storing documents by index value 'name' (may cause index duplication
+        # errors but there is not enough information in SensorML for alternatives)
+        # Assume that member corresponds to xlink:arcrole="urn:ogc:def:role:webPage"
+        documents_dct = {}
+        for d in ds.documents:
+            document = Documentation(d)
+            name = testXMLAttribute(d, "name")
+            # url = document.documents[0].url
+            documents_dct[name] = document
+
+        # contacts (ContactList members, or the 'sml:contact' element repetition used by NDBC):
+        contacts_dct = {}
+        for c in ds.contacts:
+            contact = Contact(c)
+            role = contact.role.split('/')[-1]
+            contacts_dct[role] = contact
+
+        # verify a 'publisher' Contact exists (template expects one):
+        if "publisher" not in contacts_dct.keys():
+            self.logger.warning("Station: %s skipped.  No \'http://mmisw.org/ont/ioos/definition/publisher\' Contact role defined in SensorML as required.  Roles defined: [%s]", station_urn, ", ".join(contacts_dct.keys()))
+            return None
+
+        quant_lst = ds.output_quantities
+        parameter_lst = [sweQuant.split('/')[-1] for sweQuant in quant_lst]
+
+        # attempt to read beginPosition, if available, otherwise use current date
+        # bc ISO requires date value in output location in template:
+        beginPosition = ds.begin_position
+        try:
+            begin_service_date = parser.parse(beginPosition)
+        except (AttributeError, TypeError) as e:
+            begin_service_date = datetime.now(pytz.utc)
+
+        station.station_urn = station_urn
+        station.sos_url = sos_url_params
+        station.describesensor_url = describe_sensor_url
+
+        station.shortName = ds.shortName
+        station.longName = ds.longName
+        if self.sos_type.lower() == 'ndbc':
+            station.wmoID = station_urn.split(':')[-1]
+        else:
+            station.wmoID = ds.get_ioos_def('wmoID', 'identifier')
+        station.serverName = self.server_name
+
+        # Some capabilities-level metadata:
+        station.title = sosgc.identification.title
+        station.abstract = sosgc.identification.abstract
+        station.keywords = sosgc.identification.keywords
+        station.begin_service_date = begin_service_date
+
+        # Beware that a station can have >1 classifier of the same type
+        # This code does not accommodate that possibility
+        station.platformType = ds.platformType
+        station.parentNetwork = ds.get_ioos_def('parentNetwork', 'classifier')
+        station.sponsor = ds.get_ioos_def('sponsor', 'classifier')
+
+        # store some nested dictionaries in 'station' for appropriate SensorML sources:
+        station.contacts_dct = contacts_dct
+        station.documents_dct = documents_dct
+
+        if self.sos_type.lower() == 'ndbc' and sosgc_station_offering is not None:
+            station.starting = sosgc_station_offering.begin_position
+            station.ending = sosgc_station_offering.end_position
+        else:
+            station.starting = ds.starting
+            station.ending = ds.ending
+
+        if self.sos_type.lower() == 'ndbc' and sosgc_station_offering is not None:
+            station.variable_uris = sosgc_station_offering.observed_properties
+            station.variables = [var.split('/')[-1] for var in sosgc_station_offering.observed_properties]
+            station.parameter_uris = ','.join(station.variable_uris)
+            station.parameters = ','.join(station.variables)
+        else:
+            station.variable_uris = ds.variables
+            station.variables = [var.split('/')[-1] for var in ds.variables]
+            station.parameter_uris = ','.join(quant_lst)
+            station.parameters = ','.join(parameter_lst)
+
+        if debug:
+            for var in station.variable_uris:
+                self.logger.debug("variable: %s", var)
+
+        # parse 'responseFormat' vals from the station's offering in GetCapabilities:
+        response_formats = offerings.response_formats(station_urn)
+
+        # match responseFormats from SensorML (response_formats) against those passed in --response_formats parameter to
+        # populate 'download_formats' list, that is then used to generate GetObservation requests for the template:
+        # (default --response_formats values are: 'application/json,application/zip; subtype=x-netcdf' )
+        download_formats = [response_format for response_format in response_formats
+                            if response_format in self.response_formats]
+        station.response_formats = response_formats
+        station.download_formats = download_formats
+
+        if debug:
+            for format in response_formats:
+                self.logger.debug("responseFormat: %s", format)
+            for format in download_formats:
+                self.logger.debug("downloadFormats: %s", format)
+
+        # calculate event_time using self.getobs_req_hours:
+        event_time_formatstr = "{begin:%Y-%m-%dT%H:%M:%S}{utc_code}/{end:%Y-%m-%dT%H:%M:%S}{utc_code}"
+        utc_code = 'Z' if self.sos_type.lower() == 'ndbc' else ''
+        if station.starting is not None and station.ending is not None:
+            event_time = event_time_formatstr.format(
+                begin=station.ending - timedelta(hours=self.getobs_req_hours), end=station.ending,
+                utc_code=utc_code)
+            self.logger.debug("Using starting/ending times from SensorML for eventTime")
+            self.logger.debug("observationTimeRange: starting: %s, ending: %s", station.starting, station.ending)
+        else:
+            now = datetime.now(pytz.utc)
+            then = now - timedelta(hours=self.getobs_req_hours)
+            event_time = event_time_formatstr.format(begin=then, end=now, utc_code=utc_code)
+            self.logger.debug("No 'observationTimeRange' present in SensorML.  Using present time for eventTime: then: %s, now: %s", then, now)
+
+        self.logger.debug("eventTime: %s", event_time)
+
+        # create a dict to store parameters for valid example GetObservation requests for station:
+        getobs_req_dct = {}
+        # populate a parameters dictionary for download links for each 'observedProperty' type
+        # and secondly for each 'responseFormat' per observedProperty:
+        getobs_params_base = {'service': 'SOS', 'request': 'GetObservation', 'version': '1.0.0',
+                              'offering': station_urn, 'eventTime': event_time}
+        for variable in station.variable_uris:
+            getobs_params = getobs_params_base.copy()
+            getobs_params['observedProperty'] = variable
+            variable = variable.split('/')[-1]
+            for format in download_formats:
+                getobs_params['responseFormat'] = format
+                getobs_request_url_encoded = sos_url + '?' + urlencode(getobs_params)
+                getobs_request_url = unquote(getobs_request_url_encoded)
+                getobs_req_dct[variable + '-' + format] = {
+                    'variable': variable,
+                    'url': getobs_request_url,
+                    'format_type': self.RESPONSE_FORMAT_TYPE_MAP.get(format, format),
+                    'format_name': self.RESPONSE_FORMAT_NAME_MAP.get(format, format)
+                }
+                if debug:
+                    self.logger.debug("getobs_request_url (var: %s): %s", variable.split("/")[-1], getobs_request_url)
+
+        # ToDo: finish adding the 'getobs_req_dct' to the output template
+        station.getobs_req_dct = getobs_req_dct
+
+        # fingerprint the station's rendering inputs (SensorML, capabilities-level metadata and CLI options) so
+        # generate_iso can skip stations unchanged since the previous run:
+        station.fingerprint = fingerprint(
+            hashlib.sha1(etree.tostring(sml)).hexdigest(), sos_url_params, describe_sensor_url,
+            sosgc.identification.title, sosgc.identification.abstract, sosgc.identification.keywords,
+            station.starting, station.ending, station.variable_uris, response_formats,
+            self.getobs_req_hours, self.response_formats, self.sos_type)
+
+        return station
+
+    def get_sensorml(self, sos_url, sos_url_params, station_urns_sel, oFrmts):
+        """ Returns the GetCapabilities object, list of station URNs, and dicts of SensorML, SensorML outputFormat,
+        DescribeSensor errors and DescribeSensor URLs keyed by station URN, using the threaded DescribeSensorFetcher
+        """
+        sosgc = self.get_sos(sos_url_params)
+        describe_sensor_start = time.time()
+
+        # vars to store returns from the fetcher's metadata_plus_exceptions function:
         sml_recs = {}
+        sml_formats = {}
         sml_errors = {}
         describe_sensor_url = {}
 
-        # leverage Pyoos Collector to query for all available stations and obtain SensorML
-        # (if station subset not passed in --stations param)
+        # query for all available stations and obtain SensorML (if station subset not passed in --stations param)
         if station_urns_sel is not None:
-            station_urns = station_urns_sel
+            station_urns = self.stations_to_fetch(sosgc, station_urns_sel)
+
+            # request SensorML for the selected stations concurrently, iterating oFrmts items for each describe_sensor
+            # request (first is IOOS SOS spec-compliant, second is for NDBC SOS), starting from the format known to
+            # work for the service.  If not known yet, the rest are requested in the format of the first station first:
+            results = []
+            if station_urns and self.format_memo.get(sos_url) is None:
+                results.append(self.fetch_sensorml(sosgc, station_urns[0], oFrmts))
+                oFrmts = self.prefer_output_format(oFrmts, [fmt for sml, fmt, errors in results if sml is not None])
+            results.extend(self.fetcher.map(lambda station_urn: self.fetch_sensorml(sosgc, station_urn, oFrmts),
+                                            station_urns[len(results):]))
+            for station_urn, (sml, fmt, errors) in zip(station_urns, results):
+                describe_sensor_url[station_urn] = self.generate_describe_sensor_url(sosgc, procedure=station_urn, oFrmt=fmt)
+                if errors:
+                    sml_errors[station_urn] = errors[-1]
+                if sml is not None:
+                    sml_recs[station_urn] = sml
+                    sml_formats[station_urn] = fmt
         else:
-            sos_collector = IoosSweSos(sos_url)
-            station_urns = [urn.name for urn in sos_collector.server.offerings
-                            if 'network' not in urn.name.split(':')]
-            sos_collector.features = station_urns
-
-            # write out stations in SOS that will be handled:
-            if self.verbose:
-                self.log.write(u"\nStations to process for SOS: {sos}".format(sos=sos_url_params))
-                print("Stations to process for SOS: {sos}".format(sos=sos_url_params))
-                for feature in sos_collector.features:
-                    self.log.write(u"\n - {feature}".format(feature=feature))
-                    print(" - {feature}".format(feature=feature))
+            station_urns = self.get_station_urns(sosgc)
+            self.report_stations(sos_url_params, station_urns)
+            station_urns = self.stations_to_fetch(sosgc, station_urns)
 
-            # iterate over possible oFrmts expected of the various SOS services (IOOS SOS 1.0, NDBC):
+            # iterate over possible oFrmts expected of the various SOS services (IOOS SOS 1.0, NDBC), starting from
+            # the format known to work for the service:
             # for fmt in reversed(oFrmts):
-            for fmt in oFrmts:
+            for fmt_idx, fmt in enumerate(oFrmts):
+                if fmt_idx > 0:
+                    self.metrics.count('describe_sensor_format_retries', len(station_urns))
                 try:
-                    sml_recs, sml_errors = sos_collector.metadata_plus_exceptions(output_format=fmt, timeout=200)
+                    sml_recs, sml_errors = self.fetcher.metadata_plus_exceptions(sosgc, station_urns, fmt, self.metrics,
+                                                                                 fetch=self.fetch_sensorml)
                     # if no valid SensorML docs returned, try next oFrmt:
                     if not sml_recs:
                         continue
                     else:
-                        # assign correct DescribeSensor url (use sos_collector.feature rather than sml_recs.keys() to
-                        # create DescribeSensor URLs for failures to record in logs):
-                        for station in sos_collector.features:
+                        # assign correct DescribeSensor url (use station_urns rather than sml_recs.keys() to create
+                        # DescribeSensor URLs for failures to record in logs):
+                        for station in station_urns:
                             describe_sensor_url[station] = self.generate_describe_sensor_url(sosgc, procedure=station, oFrmt=fmt)
-
-                        # report on errors returned from metadata_plus_exceptions:
-                        if sml_errors:
-                            if self.verbose:
-                                for station, msg in iteritems(sml_errors):
-                                    self.log.write(u"\nSOS DescribeSensor error returned for: {station}, skipping. Error msg: {msg}".format(station=station, msg=msg))
-                                    print("SOS DescribeSensor error returned for: {station}, skipping. Error msg: {msg}".format(station=station, msg=msg))
-                        else:
-                            self.log.write(u"\nSuccess, no errors returned from DescribeSensor requests in service: {sos}".format(sos=sos_url_params))
-                            print("Success, no errors returned from DescribeSensor requests in service: {sos}".format(sos=sos_url_params))
+                        sml_formats = dict((station, fmt) for station in sml_recs)
+                        self.report_sensorml_errors(sos_url_params, sml_errors)
                     break
                 # ServiceException shouldn't be thrown by metadata_plus_exceptions function, but handle regardless by attempting next oFrmt:
                 except ServiceException as e:
                     continue
-
-        station_recs = []
-        failures = []
-        # generate Pandas DataFrame by populating 'station_recs' list by parsing SensorML strings:
-        for station_idx, station_urn in enumerate(station_urns):
-            if station_urns_sel is not None:
-                # iterate oFrmts items for describe_sensor request (first is IOOS SOS spec-compliant, second is for NDBC SOS):
-                for fmt in oFrmts:
-                    try:
-                        describe_sensor_url[station_urn] = self.generate_describe_sensor_url(sosgc, procedure=station_urn, oFrmt=fmt)
-                        sml_str = sosgc.describe_sensor(procedure=station_urn, outputFormat=fmt, timeout=200)
-                        break
-                    except ServiceException as e:
-                        sml_errors[station_urn] = str(e)
-                        continue
-                sml = SensorML(sml_str)
-
-            else:
-                # process valid SensorML responses, quietly pass on invalid stations (add to failures list for verbose reporting):
-                try:
-                    sml = sml_recs[station_urn]
-                except KeyError:
-                    self.log.write(u"\n\nStation: {station} failed (no SensorML in sml_recs dict).  URL: {ds}".format(station=station_urn, ds=describe_sensor_url[station_urn].replace("&amp;", "&")))
-                    print("Station: {station} failed (no SensorML in sml_recs dict).  URL: {ds}".format(station=station_urn, ds=describe_sensor_url[station_urn].replace("&amp;", "&")))
-                    failures.append(station_urn)
-                    continue
-
-            if self.sos_type.lower() == 'ndbc':
-                # later: add an error check
-                sosgc_station_offering = sosgc.contents['station-' + station_urn.split(':')[-1]]
             else:
-                sosgc_station_offering = None
+                # no oFrmt returned valid SensorML, record the DescribeSensor URLs of the first for the failures:
+                for station in station_urns:
+                    describe_sensor_url[station] = self.generate_describe_sensor_url(sosgc, procedure=station, oFrmt=oFrmts[0])
 
-            try:
-                ds = IoosDescribeSensor(sml._root)
-            except AttributeError:
-                self.log.write(u"\nInvalid SensorML passed to IoosDescribeSensor.  Check DescribeSensor request for : {station}, URL: ".format(station=station, ds=describe_sensor_url[station_urn].replace("&amp;", "&")))
-                print("Invalid SensorML passed to IoosDescribeSensor.  Check DescribeSensor request for : {station}, URL: ".format(station=station, ds=describe_sensor_url[station_urn].replace("&amp;", "&")))
+        self.metrics.add('describe_sensor', time.time() - describe_sensor_start)
+        return sosgc, station_urns, sml_recs, sml_formats, sml_errors, describe_sensor_url
 
-            station = OrderedDict()
-            # debug:
-            if self.verbose:
-                self.log.write(u"\n\nProcessing station: {station}".format(station=station_urn))
-                print("Processing station: {station}".format(station=station_urn))
-                self.log.write("\n" + etree.tostring(sml._root).decode('utf-8'))
-
-            # assign 'pos' to GML point location (accommodate 'gml:coordinates' as used by NDBC if gml:Point not found):
-            try:
-                pos = testXMLValue(ds.system.location.find(self.nsp('gml:Point/gml:pos'))) \
-                    if testXMLValue(ds.system.location.find(self.nsp('gml:Point/gml:pos'))) is not None \
-                    else testXMLValue(ds.system.location.find(self.nsp('gml:Point/gml:coordinates')))
-                station['lon'] = float(pos.split()[1])
-                station['lat'] = float(pos.split()[0])
-            except AttributeError as e:
-                station['lon'] = None
-                station['lat'] = None
-
-            system_el = sml._root.findall(self.nsp('sml:member'))[0].find(self.nsp('sml:System'))
-
-            # Parse the DocumentList into a dict storing documents by index value 'name' (may cause index duplication
-            # errors but there is not enough information in SensorML for alternatives)
-            # Assume that member corresponds to xlink:arcrole="urn:ogc:def:role:webPage"
-            documents = system_el.findall(self.nsp('sml:documentation/sml:DocumentList/sml:member'))
-            documents_dct = {}
-            for d in documents:
-                document = Documentation(d)
-                name = testXMLAttribute(d, "name")
-                # url = document.documents[0].url
-                documents_dct[name] = document
-
-            # obtain list of contacts (accommodate 'sml:contact' element repetition used by NDBC insead of  ContactList):
-            contacts = system_el.findall(self.nsp('sml:contact/sml:ContactList/sml:member')) \
-                if system_el.findall(self.nsp('sml:contact/sml:ContactList/sml:member')) \
-                else system_el.findall(self.nsp('sml:contact'))
-            contacts_dct = {}
-            for c in contacts:
-                contact = Contact(c)
-                role = contact.role.split('/')[-1]
-                contacts_dct[role] = contact
-
-            # verify a 'publisher' Contact exists (template expects one):
-            if "publisher" not in contacts_dct.keys():
-                self.log.write(u"\n\nStation: {station} skipped.  No \'http://mmisw.org/ont/ioos/definition/publisher\' Contact role defined in SensorML as required.  Roles defined: [{roles}]".format(station=station_urn, roles=", ".join(contacts_dct.keys())))
-                print("Station: {station} skipped.  No \'http://mmisw.org/ont/ioos/definition/publisher\' Contact role defined in SensorML as required.  Roles defined: [{roles}]".format(station=station_urn, roles=", ".join(contacts_dct.keys())))
-                failures.append(station_urn)
-                continue
-
-            sweQuants = system_el.findall(self.nsp('sml:outputs/sml:OutputList/sml:output/swe:Quantity'))
-            quant_lst = [sweQuant.attrib['definition'] for sweQuant in sweQuants]
-            parameter_lst = [sweQuant.split('/')[-1] for sweQuant in quant_lst]
+    def output_formats(self, sos_url):
+        """ Returns the DescribeSensor outputFormats to try for the SOS, starting from the format known to work for it
+        """
+        return self.format_memo.order(sos_url, self.SENSORML_OUTPUT_FORMATS)
 
-            # attempt to read beginPosition, if available, otherwise use current date
-            # bc ISO requires date value in output location in template:
-            beginPosition = testXMLValue(system_el.find(self.nsp('sml:validTime/gml:TimePeriod/gml:beginPosition')))
-            try:
-                begin_service_date = parser.parse(beginPosition)
-            except (AttributeError, TypeError) as e:
-                begin_service_date = datetime.now(pytz.utc)
-
-            station['station_urn'] = station_urn
-            station['sos_url'] = sos_url_params
-            station['describesensor_url'] = describe_sensor_url[station_urn]
-
-            station['shortName'] = ds.shortName
-            station['longName'] = ds.longName
-            if self.sos_type.lower() == 'ndbc':
-                station['wmoID'] = station_urn.split(':')[-1]
-            else:
-                station['wmoID'] = ds.get_ioos_def('wmoID', 'identifier', ont)
-            station['serverName'] = self.server_name
-
-            # Some capabilities-level metadata:
-            station['title'] = sosgc.identification.title
-            station['abstract'] = sosgc.identification.abstract
-            station['keywords'] = sosgc.identification.keywords
-            station['begin_service_date'] = begin_service_date
-
-            # Beware that a station can have >1 classifier of the same type
-            # This code does not accommodate that possibility
-            station['platformType'] = ds.platformType
-            station['parentNetwork'] = ds.get_ioos_def('parentNetwork', 'classifier', ont)
-            station['sponsor'] = ds.get_ioos_def('sponsor', 'classifier', ont)
-
-            # store some nested dictionaries in 'station' for appropriate SensorML sources:
-            station['contacts_dct'] = contacts_dct
-            station['documents_dct'] = documents_dct
-
-            if self.sos_type.lower() == 'ndbc' and sosgc_station_offering is not None:
-                station['starting'] = sosgc_station_offering.begin_position
-                station['ending'] = sosgc_station_offering.end_position
-            else:
-                station['starting'] = ds.starting
-                station['ending'] = ds.ending
-
-            if self.sos_type.lower() == 'ndbc' and sosgc_station_offering is not None:
-                station['variable_uris'] = sosgc_station_offering.observed_properties
-                station['variables'] = [var.split('/')[-1] for var in sosgc_station_offering.observed_properties]
-                station['parameter_uris'] = ','.join(station['variable_uris'])
-                station['parameters'] = ','.join(station['variables'])
-            else:
-                station['variable_uris'] = ds.variables
-                station['variables'] = [var.split('/')[-1] for var in ds.variables]
-                station['parameter_uris'] = ','.join(quant_lst)
-                station['parameters'] = ','.join(parameter_lst)
+    def prefer_output_format(self, oFrmts, formats):
+        """ Returns outputFormats 'oFrmts' with the most common of 'formats' (if any) moved to the front, for the
+        current run only
+        """
+        if not formats:
+            return oFrmts
+        fmt = Counter(formats).most_common(1)[0][0]
+        return [fmt] + [oFrmt for oFrmt in oFrmts if oFrmt != fmt]
+
+    def learn_output_format(self, sos_url, formats):
+        """ Records the most common of the outputFormats of the stations whose SensorML was parsed into station
+        records ('formats') as the format to request first for the SOS.  If there are none, the format recorded for the
+        SOS (if any) is forgotten, so every format is tried again
+        """
+        if formats:
+            fmt = Counter(formats).most_common(1)[0][0]
+            if fmt != self.format_memo.get(sos_url):
+                self.logger.debug("DescribeSensor outputFormat for SOS service: %s", fmt)
+            self.format_memo.put(sos_url, fmt)
+        elif self.format_memo.get(sos_url) is not None:
+            self.logger.debug("No valid station SensorML in DescribeSensor outputFormat: %s, forgetting it", self.format_memo.get(sos_url))
+            self.format_memo.forget(sos_url)
+
+    def get_capabilities_url(self, sos_url):
+        """ Returns the GetCapabilities request URL for the SOS endpoint
+        """
+        params = {'service': 'SOS', 'request': 'GetCapabilities', 'acceptVersions': '1.0.0'}
+        # sos_url_params_quoted = quote(sos_url_params,"/=:")
+        # sos_url_params_unquoted = unquote(sos_url_params)
+        return sos_url + '?' + urlencode(params)
 
-            if self.verbose:
-                for var in station['variable_uris']:
-                    self.log.write(u"\nvariable: {var}".format(var=var))
-                    print("variable: {var}".format(var=var))
-
-            # print(sosgc.contents)
-            # for id, offering in sosgc.contents.iteritems():
-            #    print("sosgc.contents: {item}".format(item=id))
-
-            # parse 'responseFormat' vals from SensorML:
-            # response_formats = sosgc.contents[station_urn].response_formats
-            response_formats = []
-            for id, sosgc.content in sosgc.contents.items():
-                if sosgc.content.name == station_urn:
-                    response_formats = sosgc.content.response_formats
-            # response_formats = [ sosgc.content.response_formats for id, sosgc.content in sosgc.contents.items()
-            #                      if sosgc.content.name == station_urn ]
-
-            # match responseFormats from SensorML (response_formats) against those passed in --response_formats parameter to
-            # populate 'download_formats' list, that is then used to generate GetObservation requests for the template:
-            # (default --response_formats values are: 'application/json,application/zip; subtype=x-netcdf' )
-            download_formats = [response_format for response_format in response_formats
-                                if response_format in self.response_formats]
-            station['response_formats'] = response_formats
-            station['download_formats'] = download_formats
+    def get_sos(self, sos_url_params):
+        """ Returns the parsed SOS GetCapabilities document (SosCapabilities), exiting on connection errors
+        """
+        try:
+            with self.metrics.timer('capabilities'):
+                sosgc = load_capabilities(sos_url_params, self.get_capabilities(sos_url_params))
+                self.diff_capabilities(sosgc)
+                return sosgc
+        except RequestException as e:
+            self.exit_connection_error(sos_url_params, e)
+
+    def get_capabilities(self, sos_url_params):
+        """ Returns the GetCapabilities document for the SOS, revalidating a cached copy if one is available
+        """
+        headers = self.capabilities_cache.request_headers(sos_url_params) if self.capabilities_cache is not None else {}
+        response = self.fetcher.get(sos_url_params, headers=headers, metrics=self.metrics)
+        check_status(response.status_code, response.content)
+        return self.resolve_capabilities(sos_url_params, response.status_code, response.headers, response.content)
 
-            if self.verbose:
-                for format in response_formats:
-                    self.log.write(u"\nresponseFormat: {format}".format(format=format))
-                    print("responseFormat: {format}".format(format=format))
-                for format in download_formats:
-                    self.log.write(u"\ndownloadFormats: {format}".format(format=format))
-                    print("downloadFormats: {format}".format(format=format))
-
-            # calculate event_time using self.getobs_req_hours:
-            event_time_formatstr = "{begin:%Y-%m-%dT%H:%M:%S}{utc_code}/{end:%Y-%m-%dT%H:%M:%S}{utc_code}"
-            utc_code = 'Z' if self.sos_type.lower() == 'ndbc' else ''
-            if station['starting'] is not None and station['ending'] is not None:
-                event_time = event_time_formatstr.format(
-                    begin=station['ending'] - timedelta(hours=self.getobs_req_hours), end=station['ending'],
-                    utc_code=utc_code)
-                if self.verbose:
-                    self.log.write(u"\nUsing starting/ending times from SensorML for eventTime")
-                    print("Using starting/ending times from SensorML for eventTime")
-                    self.log.write(u"\nobservationTimeRange: starting: {start}, ending: {end}".format(
-                        start=station['starting'], end=station['ending']))
-                    print("observationTimeRange: starting: {start}, ending: {end}".format(
-                        start=station['starting'], end=station['ending']))
-            else:
-                now = datetime.now(pytz.utc)
-                then = now - timedelta(hours=self.getobs_req_hours)
-                event_time = event_time_formatstr.format(begin=then, end=now, utc_code=utc_code)
-                if self.verbose:
-                    self.log.write(u"\nNo 'observationTimeRange' present in SensorML.  Using present time for eventTime: then: {then:%Y-%m-%dT%H:%M:%S%z}, now: {now:%Y-%m-%dT%H:%M:%S%z}".format(then=then, now=now))
-                    print("No 'observationTimeRange' present in SensorML.  Using present time for eventTime: then: {then:%Y-%m-%dT%H:%M:%S%z}, now: {now:%Y-%m-%dT%H:%M:%S%z}".format(then=then, now=now))
+    def resolve_capabilities(self, sos_url_params, status_code, headers, content):
+        """ Returns the GetCapabilities document for a (conditional) GetCapabilities response
+        """
+        if self.capabilities_cache is None:
+            return content
+        if status_code == 304:
+            self.logger.debug("GetCapabilities document not modified, using cached copy: %s", sos_url_params)
+        return self.capabilities_cache.resolve(sos_url_params, status_code, headers, content)
+
+    def get_station_urns(self, sos):
+        """ Returns the station URNs of all non-network offerings in a GetCapabilities object
+        """
+        return [urn.name for urn in sos.offerings if 'network' not in urn.name.split(':')]
 
-            if self.verbose:
-                self.log.write(u"\neventTime: {time}".format(time=event_time))
-                print("eventTime: {time}".format(time=event_time))
-
-            # create a dict to store parameters for valid example GetObservation requests for station:
-            getobs_req_dct = {}
-            # populate a parameters dictionary for download links for each 'observedProperty' type
-            # and secondly for each 'responseFormat' per observedProperty:
-            getobs_params_base = {'service': 'SOS', 'request': 'GetObservation', 'version': '1.0.0',
-                                  'offering': station_urn, 'eventTime': event_time}
-            for variable in station['variable_uris']:
-                getobs_params = getobs_params_base.copy()
-                getobs_params['observedProperty'] = variable
-                variable = variable.split('/')[-1]
-                for format in download_formats:
-                    getobs_params['responseFormat'] = format
-                    getobs_request_url_encoded = sos_url + '?' + urlencode(getobs_params)
-                    getobs_request_url = unquote(getobs_request_url_encoded)
-                    getobs_req_dct[variable + '-' + format] = {
-                        'variable': variable,
-                        'url': getobs_request_url,
-                        'format_type': self.RESPONSE_FORMAT_TYPE_MAP.get(format, format),
-                        'format_name': self.RESPONSE_FORMAT_NAME_MAP.get(format, format)
-                    }
-                    if self.verbose:
-                        self.log.write(u"\ngetobs_request_url (var: {variable}): {getobs_request_url}".format(variable=variable.split("/")[-1], getobs_request_url=getobs_request_url))
-                        print("getobs_request_url (var: {variable}): {getobs_request_url}".format(variable=variable.split("/")[-1], getobs_request_url=getobs_request_url))
-
-            # ToDo: finish adding the 'getobs_req_dct' to the output template
-            station['getobs_req_dct'] = getobs_req_dct
+    def report_stations(self, sos_url_params, station_urns):
+        """
+        """
+        # write out stations in SOS that will be handled:
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Stations to process for SOS: %s", sos_url_params)
+            for feature in station_urns:
+                self.logger.debug(" - %s", feature)
 
-            station_recs.append(station)
+    def report_sensorml_errors(self, sos_url_params, sml_errors):
+        """
+        """
+        # report on errors returned from metadata_plus_exceptions:
+        if sml_errors:
+            if self.logger.isEnabledFor(logging.DEBUG):
+                for station, msg in iteritems(sml_errors):
+                    self.logger.debug("SOS DescribeSensor error returned for: %s, skipping. Error msg: %s", station, msg)
+        else:
+            self.logger.info("Success, no errors returned from DescribeSensor requests in service: %s", sos_url_params)
 
+    def report_failures(self, sml_errors, failures, describe_sensor_url):
+        """
+        """
         # extra debug for failed stations in verbose mode:
-        if self.verbose:
-            self.log.write(u"\n\n\nSOS DescribeSensor request errors recap.  Failed requests:")
-            print("SOS DescribeSensor request errors recap.  Failed requests:")
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("SOS DescribeSensor request errors recap.  Failed requests:")
             for station_fail, msg in iteritems(sml_errors):
-                self.log.write(u"\n{station} - {msg}.  DescribeSensor URL: {ds}".format(
-                    station=station_fail, msg=msg, ds=describe_sensor_url[station_fail].replace("&amp;", "&")))
-                print("{station} - {msg}.  DescribeSensor URL: {ds}".format(
-                    station=station_fail, msg=msg, ds=describe_sensor_url[station_fail].replace("&amp;", "&")))
+                self.logger.debug("%s - %s.  DescribeSensor URL: %s", station_fail, msg, describe_sensor_url[station_fail].replace("&amp;", "&"))
             if failures:
-                self.log.write(u"\nStations in 'failures' list (should match DescribeSensor errors):")
-                print("Stations in 'failures' list (should match DescribeSensor errors):")
+                self.logger.debug("Stations in 'failures' list (should match DescribeSensor errors):")
                 for station_fail in failures:
-                    self.log.write(u"\n{station}".format(station=station_fail))
-                    print("{station}".format(station=station_fail))
+                    self.logger.debug("%s", station_fail)
 
-        if station_recs:
-            stations_df = pd.DataFrame.from_records(station_recs, columns=station.keys())
-            stations_df.index = stations_df['station_urn']
-            return stations_df
-        else:
-            return None
-
-    def generate_iso(self, df):
+    def exit_connection_error(self, sos_url_params, e):
         """
         """
+        self.logger.error("Error: unable to connect to SOS service: %s due to HTTP connection error.", sos_url_params, extra=FILE_ONLY)
+        self.logger.error("HTTP connection error: %s.", e, extra=FILE_ONLY)
+        sys.exit("\nError: unable to connect to SOS service: {url}. \nUnderlying HTTP connection error: {err}".format(url=sos_url_params, err=str(e)))
 
-        # set up the Jinja2 template:
-        env = Environment(loader=PackageLoader('sensorml2iso', 'templates'), trim_blocks=True, lstrip_blocks=True, autoescape=True)
-        template = env.get_template('sensorml_iso.xml')
-
-        for idx, station in df.iterrows():
-            ctx = {}
-            # populate some general elements for the template:
-            # we can use format filters in the template to format dates...
-            # ctx['metadataDate'] = "{metadata_date:%Y-%m-%d}".format(metadata_date=datetime.today())
-            ctx['metadataDate'] = datetime.now()
+    def generate_iso(self, stations):
+        """ Renders and writes the ISO record of each of 'stations' (station records, consumed lazily so that stations
+        can be streamed in as they are harvested)
+        """
 
-            # debug: get the first station:
-            # station = df.iloc[0]
+        version = template_version(self.template_dir)
+        manifest = Manifest(self.output_directory)
 
-            ctx['identifier'] = station.station_urn
-            ctx['contacts_dct'] = station['contacts_dct']
-            ctx['documents_dct'] = station['documents_dct']
+        # keep the records of stations completed by the interrupted run being resumed (not in the manifest, which is
+        # only saved once a run completes):
+        resumed = 0
+        for station_urn, record in iteritems(self.journal.completed):
+            if record.get('filename') is not None:
+                manifest.update(station_urn, record['fingerprint'], record['filename'], parser.parse(record['metadataDate']))
+                resumed += 1
+            else:
+                manifest.retain(station_urn)
+        self.metrics.count('stations_resumed', len(self.journal.completed))
+
+        # output details of the stations handed to the renderer, in order:
+        outputs = deque()
+        # time spent obtaining 'stations' (harvesting them, when streamed) and writing records, excluded from the
+        # render phase:
+        excluded = [0.0]
+
+        def exclude(seconds):
+            excluded[0] += seconds
+
+        def contexts():
+            # yield the template contexts of the stations to render (plain, picklable values so they can be handed to
+            # rendering worker processes):
+            for station in timed(stations, exclude):
+                output_basename = "{serverName}-{station}.xml".format(serverName=self.server_name, station=station.station_urn.replace(":", "_"))
+                output_filename = os.path.join(self.output_directory, output_basename)
+
+                # skip stations whose rendering inputs are unchanged since the previous run (the existing record keeps
+                # its metadataDate and mtime):
+                station_fingerprint = fingerprint(version, station.fingerprint)
+                if not self.force and manifest.unchanged(station.station_urn, station_fingerprint, output_basename):
+                    manifest.retain(station.station_urn)
+                    self.journal.rendered(station.station_urn)
+                    self.metrics.count('stations_unchanged')
+                    self.logger.debug("Metadata for station: %s unchanged, skipping output file: %s", station.station_urn, output_filename)
+                    continue
 
-            ctx['sos_url'] = station['sos_url']
-            ctx['describesensor_url'] = station['describesensor_url']
+                ctx = self.get_template_context(station)
+                outputs.append((station.station_urn, station_fingerprint, output_basename, output_filename, ctx['metadataDate']))
+                yield ctx
+
+        writer = OutputWriter(self.output_directory, fsync=self.fsync)
+        written = 0
+        render_start = time.time()
+        # the Jinja2 template is compiled once per process (and per worker process if rendering in parallel):
+        for iso_xml in render_all(contexts(), template=self.template, workers=self.render_workers,
+                                  template_dir=self.template_dir, bytecode_cache_dir=self.bytecode_cache_dir):
+            output = outputs.popleft()
+            write_start = time.time()
+            written += self.record_outputs(manifest, writer.write(output[2], iso_xml, output))
+            elapsed = time.time() - write_start
+            self.metrics.add('write', elapsed)
+            exclude(elapsed)
+        self.metrics.add('render', time.time() - render_start - excluded[0])
+        with self.metrics.timer('write'):
+            written += self.record_outputs(manifest, writer.close())
+        self.metrics.count('stations_written', written)
+
+        # report (and optionally prune) records of stations no longer output, other than stations that failed this run:
+        removed = 0
+        for station_urn, output_basename in sorted(manifest.removed().items()):
+            if station_urn in self.failures:
+                continue
+            output_filename = os.path.join(self.output_directory, output_basename)
+            if self.prune:
+                try:
+                    os.remove(output_filename)
+                except OSError:
+                    pass
+                manifest.remove(station_urn)
+                removed += 1
+                self.logger.info("Station: %s no longer output, removed output file: %s", station_urn, os.path.abspath(output_filename))
+            else:
+                self.logger.info("Station: %s no longer output, stale output file: %s", station_urn, os.path.abspath(output_filename))
 
-            ctx['lon'] = station['lon']
-            ctx['lat'] = station['lat']
-            ctx['shortName'] = station.shortName
-            ctx['longName'] = station.longName
-            ctx['wmoID'] = station.wmoID
-            ctx['serverName'] = station.serverName
+        manifest.save()
 
-            ctx['title'] = station.title
-            ctx['abstract'] = station.abstract
-            ctx['keywords'] = station.keywords
-            ctx['beginServiceDate'] = station.begin_service_date
+        self.package_outputs(sorted(manifest.current(kept=self.failures)), changed=written > 0 or removed > 0 or resumed > 0)
 
-            ctx['platformType'] = station.platformType
-            ctx['parentNetwork'] = station.parentNetwork
-            ctx['sponsor'] = station.sponsor
+    def write_metrics(self, success):
+        """ Writes the run's timings and counters to the configured metrics files, and summarizes them in the log
+        """
+        self.metrics.count('stations_failed', len(set(self.failures)))
+        controller = self.fetcher.host_limiter(self.service).controller
+        self.metrics.count('host_concurrency_limit', controller.concurrency)
+        self.logger.debug("Concurrency limit of requests to SOS host: %d (ceiling: %d)", controller.concurrency, controller.ceiling)
+        self.metrics.finish(success)
+        self.logger.info("Run time by phase: %s", ", ".join("{phase}: {seconds:.2f}s".format(phase=phase, seconds=self.metrics.phases[phase]) for phase in PHASES),
+                         extra=None if self.verbose else FILE_ONLY)
+        for path, write in [(self.metrics_file, self.metrics.write_json), (self.prometheus_file, self.metrics.write_prometheus)]:
+            if path is None:
+                continue
+            try:
+                write(path)
+            except (IOError, OSError) as e:
+                self.logger.warning("Warning: Unable to write metrics file: %s.  %s", path, e)
 
-            ctx['starting'] = station.starting
-            ctx['ending'] = station.ending
+    def record_outputs(self, manifest, results):
+        """ Records the ISO records an OutputWriter batch wrote in the manifest, reporting those it failed to write.
+        Returns the number written
+        """
+        written = 0
+        for (station_urn, station_fingerprint, output_basename, output_filename, metadata_date), error in results:
+            if error is None:
+                manifest.update(station_urn, station_fingerprint, output_basename, metadata_date)
+                self.journal.rendered(station_urn, station_fingerprint, output_basename, metadata_date)
+                written += 1
+                self.logger.debug("Metadata for station: %s written to output file: %s", station_urn, output_filename)
+            elif getattr(error, 'errno', None) == errno.EEXIST:
+                self.logger.debug("Warning, output file: %s already exists, and can't be written to, skipping.", output_filename)
+            else:
+                self.journal.rendered(station_urn, error=error)
+                self.logger.warning("Warning: Unable to write output file: %s, skipping.  %s", output_filename, error)
+        return written
 
-            ctx['parameter_uris'] = station.parameter_uris
-            ctx['parameters'] = station.parameter_uris
-            ctx['variables'] = station.variables
-            ctx['response_formats'] = station.response_formats
-            ctx['download_formats'] = station.download_formats
-            ctx['getobs_req_dct'] = station.getobs_req_dct
+    def package_outputs(self, output_basenames, changed=True):
+        """ Packages the ISO records of the current run into an archive and/or WAF index page, if configured (only if
+        the records changed, or the archive or index page is missing)
+        """
+        if self.archive is not None:
+            archive_basename = archive_filename(self.archive)
+            if changed or not os.path.exists(os.path.join(self.output_directory, archive_basename)):
+                try:
+                    path = write_archive(self.output_directory, output_basenames, self.archive)
+                    self.logger.info("ISO records packaged in archive: %s", os.path.abspath(path))
+                except (IOError, OSError) as e:
+                    self.logger.warning("Warning: Unable to write archive of ISO records: %s", e)
+            output_basenames = output_basenames + [archive_basename]
 
-            output_filename = os.path.join(self.output_directory, "{serverName}-{station}.xml".format(
-                serverName=self.server_name, station=station.station_urn.replace(":", "_")))
+        if self.waf_index:
             try:
-                iso_xml = template.render(ctx)
-                output_file = io.open(output_filename, mode='wt', encoding='utf8')
-                output_file.write(iso_xml)
-                output_file.close()
-                if self.verbose:
-                    self.log.write(u"\n\nMetadata for station: {station} written to output file: {out_file}".format(station=station.station_urn, out_file=os.path.abspath(output_filename)))
-                    print("\nMetadata for station: {station} written to output file: {out_file}".format(station=station.station_urn, out_file=os.path.abspath(output_filename)))
-            except OSError as ex:
-                if ex.errno == errno.EEXIST:
-                    if self.verbose:
-                        self.log.write(u"\nWarning, output file: {out_file} already exists, and can't be written to, skipping.".format(out_file=output_filename))
-                        print("Warning, output file: {out_file} already exists, and can't be written to, skipping.".format(out_file=output_filename))
-                else:
-                    self.log.write(u"\Warning: Unable to open output file: {out_file} for writing, skipping.".format(out_file=output_filename))
-                    print("Warning: Unable to open output file: {out_file} for writing, skipping.".format(out_file=output_filename))
-                    continue
+                path = write_waf_index(self.output_directory,
+                                       [basename for basename in output_basenames
+                                        if os.path.exists(os.path.join(self.output_directory, basename))],
+                                       "ISO 19115-2 metadata: {server}".format(server=self.server_name))
+                self.logger.debug("WAF index page written: %s", path)
+            except (IOError, OSError) as e:
+                self.logger.warning("Warning: Unable to write WAF index page: %s", e)
+
+    def get_template_context(self, station):
+        """
+        Returns the ISO template context for a StationRecord.
+        """
+        ctx = {}
+        # populate some general elements for the template:
+        # we can use format filters in the template to format dates...
+        # ctx['metadataDate'] = "{metadata_date:%Y-%m-%d}".format(metadata_date=datetime.today())
+        ctx['metadataDate'] = datetime.now()
+
+        # debug: get the first station:
+        # station = df.iloc[0]
+
+        ctx['identifier'] = station.station_urn
+        ctx['contacts_dct'] = station.contacts_dct
+        ctx['documents_dct'] = station.documents_dct
+
+        ctx['sos_url'] = station.sos_url
+        ctx['describesensor_url'] = station.describesensor_url
+
+        ctx['lon'] = station.lon
+        ctx['lat'] = station.lat
+        ctx['shortName'] = station.shortName
+        ctx['longName'] = station.longName
+        ctx['wmoID'] = station.wmoID
+        ctx['serverName'] = station.serverName
+
+        ctx['title'] = station.title
+        ctx['abstract'] = station.abstract
+        ctx['keywords'] = station.keywords
+        ctx['beginServiceDate'] = station.begin_service_date
+
+        ctx['platformType'] = station.platformType
+        ctx['parentNetwork'] = station.parentNetwork
+        ctx['sponsor'] = station.sponsor
+
+        ctx['starting'] = station.starting
+        ctx['ending'] = station.ending
+
+        ctx['parameter_uris'] = station.parameter_uris
+        ctx['parameters'] = station.parameter_uris
+        ctx['variables'] = station.variables
+        ctx['response_formats'] = station.response_formats
+        ctx['download_formats'] = station.download_formats
+        ctx['getobs_req_dct'] = station.getobs_req_dct
+
+        return ctx
 
     def generate_describe_sensor_url(self, sos, procedure=None, oFrmt=None):
         """
         """
         # generate a DescribeSensor request to include in the ISO output (lifted from OWSlib):
-        try:
-            base_url = next((m.get('url') for m in sos.getOperationByName('DescribeSensor').methods
-                             if m.get('type').lower() == "get"))
-        except StopIteration:
-            base_url = sos.url
-
-        if not base_url.endswith("?"):
-                base_url = base_url + "?"
-        params = {'service': 'SOS', 'version': sos.version, 'request': 'DescribeSensor',
-                  'procedure': procedure, 'outputFormat': oFrmt}
+        base_url, params = describe_sensor_request(sos, procedure, oFrmt)
         return base_url + unquote_plus(urlencode(params))
 
     def create_output_dir(self):
@@ -593,17 +1104,16 @@ class Sensorml2Iso:
             # raise OSError
         except OSError as ex:
             if ex.errno == errno.EEXIST and os.path.isdir(self.output_directory):
-                self.log.write(u"\nWarning: the configured output directory: {output_dir} already exists. Files will be overwritten.".format(output_dir=os.path.abspath(self.output_directory)))
-                print("Warning: the configured output directory: {output_dir} already exists. Files will be overwritten.".format(output_dir=os.path.abspath(self.output_directory)))
+                self.logger.warning("Warning: the configured output directory: %s already exists. Files will be overwritten.", os.path.abspath(self.output_directory))
                 # sys.exit("Error: the configured output directory: {output_dir} already exists.".format(output_dir=os.path.abspath(self.output_directory)))
             else:
-                self.log.write(u"\nError: the configured output directory: {output_dir} was not able to be created.".format(output_dir=os.path.abspath(self.output_directory)))
+                self.logger.error("Error: the configured output directory: %s was not able to be created.", os.path.abspath(self.output_directory), extra=FILE_ONLY)
+                close_logger(self.logger)
                 sys.exit("Error: the configured output directory: {output_dir} was not able to be created.".format(output_dir=os.path.abspath(self.output_directory)))
 
     def print_debug_info(self):
         """
         """
         # just print out some parameter info:
-        if self.verbose:
-            self.log.write(u"sensorml2iso:\n______________\nService: {service}\nStations (--stations): {stations}\nActive Station Days (-d|--active_station_days): {active_station_days}\nGetObs Request Hours (--getobs_req_hours): {getobs_req_hours}\nResponse Formats (--response_formats): {response_formats}\nSOS Type (--sos_type): {sos_type}\nOutput Dir (--output_dir): {output_dir}\n______________\n\n".format(service=self.service, stations=self.stations, active_station_days=self.active_station_days, getobs_req_hours=self.getobs_req_hours, response_formats=self.response_formats, sos_type=self.sos_type, output_dir=os.path.abspath(self.output_directory)))
-            print("sensorml2iso:\n______________\nService: {service}\nStations (--stations): {stations}\nActive Station Days (-d|--active_station_days): {active_station_days}\nGetObs Request Hours (--getobs_req_hours): {getobs_req_hours}\nResponse Formats (--response_formats): {response_formats}\nSOS Type (--sos_type): {sos_type}\nOutput Dir (--output_dir): {output_dir}\n______________\n\n".format(service=self.service, stations=self.stations, active_station_days=self.active_station_days, getobs_req_hours=self.getobs_req_hours, response_formats=self.response_formats, sos_type=self.sos_type, output_dir=os.path.abspath(self.output_directory)))
+        self.logger.debug("sensorml2iso:\n______________\nService: %s\nStations (--stations): %s\nActive Station Days (-d|--active_station_days): %s\nGetObs Request Hours (--getobs_req_hours): %s\nResponse Formats (--response_formats): %s\nSOS Type (--sos_type): %s\nOutput Dir (--output_dir): %s\n______________\n",
+                          self.service, self.stations, self.active_station_days, self.getobs_req_hours, self.response_formats, self.sos_type, os.path.abspath(self.output_directory))
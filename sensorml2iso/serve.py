@@ -0,0 +1,298 @@
+"""
+Long-running scheduler daemon ('sensorml2iso serve'), harvesting each service of a config.json file on the cron
+'schedule' of its entry, in place of a cron job starting a new process per service and run.
+"""
+import argparse
+import hashlib
+import signal
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .batch import add_arguments, check_arguments, create_batch, load_config, service_kwargs
+from .log import close_logger, get_level, get_logger
+
+
+class Schedule:
+    """
+    A cron schedule (the 'schedule' value of a config.json entry): five fields, minute (0-59), hour (0-23), day of
+    month (1-31), month (1-12) and day of week (0-7, 0 and 7 are Sunday), each '*', a value, a range 'a-b' or a
+    comma-separated list of these, with an optional step ('*/15', '0-30/10').  As in cron, a day is scheduled if it
+    matches either day field when both are restricted.  The '@hourly', '@daily', '@weekly', '@monthly' and '@yearly'
+    shorthands are also accepted.  Times are in the local time of the process, as in cron.
+
+    Attributes
+    ----------
+    expression : str
+        The schedule expression.
+    """
+
+    FIELDS = [('minute', 0, 59), ('hour', 0, 23), ('day of month', 1, 31), ('month', 1, 12), ('day of week', 0, 7)]
+
+    ALIASES = {
+        '@hourly': '0 * * * *',
+        '@daily': '0 0 * * *',
+        '@midnight': '0 0 * * *',
+        '@weekly': '0 0 * * 0',
+        '@monthly': '0 0 1 * *',
+        '@yearly': '0 0 1 1 *',
+        '@annually': '0 0 1 1 *'
+    }
+
+    def __init__(self, expression):
+        """
+        Raises ValueError for invalid expressions.
+        """
+        self.expression = expression
+        fields = self.ALIASES.get(expression.strip(), expression).split()
+        if len(fields) != len(self.FIELDS):
+            raise ValueError("schedule '{expression}' must have 5 fields (minute, hour, day of month, month and day of "
+                             "week)".format(expression=expression))
+        values = [self.parse_field(field, name, low, high) for field, (name, low, high) in zip(fields, self.FIELDS)]
+        self.minutes, self.hours = sorted(values[0]), sorted(values[1])
+        self.days, self.months = values[2], values[3]
+        self.weekdays = set(weekday % 7 for weekday in values[4])
+        # days match both day fields if either is '*', or either day field if both are restricted:
+        self.any_day = fields[2].startswith('*') or fields[4].startswith('*')
+        # fail on schedules that never fire (eg. February 30th):
+        self.next(datetime.now())
+
+    def parse_field(self, field, name, low, high):
+        """
+        Returns the set of values of a schedule field.
+        """
+        values = set()
+        try:
+            for part in field.split(','):
+                span, _, step = part.partition('/')
+                if span == '*':
+                    start, end = low, high
+                elif '-' in span:
+                    start, end = [int(value) for value in span.split('-', 1)]
+                else:
+                    start = int(span)
+                    # 'a/n' steps from 'a' to the end of the range:
+                    end = high if step else start
+                step = int(step) if step else 1
+                if not low <= start <= end <= high or step < 1:
+                    raise ValueError()
+                values.update(range(start, end + 1, step))
+        except ValueError:
+            raise ValueError("invalid {name} field '{field}' in schedule '{expression}'".format(
+                name=name, field=field, expression=self.expression))
+        return values
+
+    def matches_day(self, day):
+        """
+        Returns True if 'day' (a date) is scheduled.
+        """
+        if day.month not in self.months:
+            return False
+        # Python weekdays start on Monday, cron's on Sunday:
+        dom, dow = day.day in self.days, (day.weekday() + 1) % 7 in self.weekdays
+        return dom and dow if self.any_day else dom or dow
+
+    def next(self, after):
+        """
+        Returns the first scheduled time (a naive datetime) after 'after'.
+        """
+        earliest = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = datetime(earliest.year, earliest.month, earliest.day)
+        # every schedule that fires at all fires within a leap year cycle:
+        for _ in range(366 * 4 + 1):
+            if self.matches_day(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        scheduled = day.replace(hour=hour, minute=minute)
+                        if scheduled >= earliest:
+                            return scheduled
+            day += timedelta(days=1)
+        raise ValueError("schedule '{expression}' never fires".format(expression=self.expression))
+
+    def interval(self, after, count=10):
+        """
+        Returns the shortest time (seconds) between the next 'count' scheduled times after 'after'.
+        """
+        times = [self.next(after)]
+        for _ in range(count):
+            times.append(self.next(times[-1]))
+        return min((later - earlier).total_seconds() for earlier, later in zip(times, times[1:]))
+
+
+class Server:
+    """
+    Harvests each service of a config.json file on its schedule, in a single long-running process keeping the
+    Batch's state (DescribeSensor worker pool and kept-alive HTTP connections, adaptive host concurrency limits,
+    on-disk caches and compiled ISO template) warm across runs.  A config entry is never harvested twice at once: a run
+    scheduled while the entry's previous run is still in progress is skipped (entries for the same service URL, eg.
+    with other stations or output directories, run independently).  The runs of each service start a
+    fixed offset after their scheduled times, derived from its URL (up to 'splay' seconds, and less than half
+    the interval of its schedule), so services on the same schedule don't all start at once.
+
+    Attributes
+    ----------
+    batch : Batch
+        The services harvested and the state their runs share.
+    splay : float
+        Maximum offset (seconds) of the start of a service's runs from their scheduled times.
+    schedules : list
+        Tuples (config.json entry, Schedule, offset in seconds) of the services.
+    running : dict
+        Threads of the runs in progress, keyed by config entry index.
+    stopping : threading.Event
+        Set once the server is asked to stop (no runs are started after).
+    """
+
+    def __init__(self, batch, splay=900, logger=None):
+        """
+        Raises ValueError if a config.json entry is invalid or has no valid 'schedule'.
+        """
+        self.batch = batch
+        self.splay = splay
+        self.logger = logger if logger is not None else get_logger('sensorml2iso.serve')
+        self.running = {}
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+        now = datetime.now()
+        self.schedules = []
+        for config_entry in batch.config:
+            service = config_entry.get('service')
+            service_kwargs(config_entry)
+            if not config_entry.get('schedule'):
+                raise ValueError("config entry of service: {service} has no 'schedule'".format(service=service))
+            schedule = Schedule(config_entry['schedule'])
+            self.schedules.append((config_entry, schedule, self.offset(service, schedule, now)))
+
+    def offset(self, service, schedule, now):
+        """
+        Returns the offset (seconds) of the start of a service's runs from their scheduled times.
+        """
+        fraction = int(hashlib.sha1(service.encode('utf-8')).hexdigest()[:8], 16) / float(0x100000000)
+        return int(fraction * min(self.splay, schedule.interval(now) / 2))
+
+    def next_run(self, index, after):
+        """
+        Returns the time of the first run of service 'index' after 'after'.
+        """
+        config_entry, schedule, offset = self.schedules[index]
+        return schedule.next(after - timedelta(seconds=offset)) + timedelta(seconds=offset)
+
+    def run(self):
+        """
+        Starts each service's runs at their scheduled times until stop is called, then waits for the runs in
+        progress to complete.
+        """
+        now = datetime.now()
+        due = [self.next_run(index, now) for index in range(len(self.schedules))]
+        for index, (config_entry, schedule, offset) in enumerate(self.schedules):
+            self.logger.info("Scheduled SOS service: %s at '%s' (offset %d s), next run at %s", config_entry['service'], schedule.expression, offset, due[index])
+
+        while not self.stopping.is_set():
+            index = min(range(len(due)), key=lambda i: due[i])
+            wait = (due[index] - datetime.now()).total_seconds()
+            if wait > 0:
+                # wake up regularly, in case the system clock is changed:
+                self.stopping.wait(min(wait, 60))
+                continue
+            self.start(index)
+            # runs missed while the process was suspended are not caught up:
+            due[index] = self.next_run(index, max(due[index], datetime.now()))
+
+        with self.lock:
+            threads = list(self.running.values())
+        if threads:
+            self.logger.info("Waiting for %d harvests in progress to complete", len(threads))
+        for thread in threads:
+            thread.join()
+        self.batch.fetcher.close()
+
+    def start(self, index):
+        """
+        Starts a run of config entry 'index' in a new thread, unless its previous run is still in progress.
+        """
+        service = self.schedules[index][0]['service']
+        with self.lock:
+            if index in self.running:
+                self.logger.warning("Warning: previous harvest of SOS service: %s (config entry %d) still in progress, skipping scheduled run", service, index)
+                return
+            thread = threading.Thread(target=self.harvest, args=(index,),
+                                      name='sensorml2iso-{index}-{service}'.format(index=index, service=service))
+            self.running[index] = thread
+        thread.start()
+
+    def harvest(self, index):
+        """
+        Harvests config entry 'index' (in its run's thread).
+        """
+        config_entry = self.schedules[index][0]
+        service = config_entry['service']
+        start = time.time()
+        self.logger.info("Harvesting SOS service: %s", service)
+        try:
+            error = self.batch.run_service(config_entry)[1]
+            if error is not None:
+                self.logger.error("Error: harvest of SOS service: %s failed after %.1f s.  %s", service, time.time() - start, error)
+            else:
+                self.logger.info("Harvest of SOS service: %s completed in %.1f s", service, time.time() - start)
+        finally:
+            with self.lock:
+                del self.running[index]
+
+    def stop(self, *args):
+        """
+        Stops starting runs (also usable as a signal handler).
+        """
+        if not self.stopping.is_set():
+            self.logger.info("Stopping")
+        self.stopping.set()
+
+
+def main(argv=None):
+    """
+    Command line interface for 'sensorml2iso serve'
+    """
+    parser = argparse.ArgumentParser(
+        prog='sensorml2iso serve',
+        description='Harvest the SOS services listed in a config.json file on the schedule of each entry, in a single long-running process')
+
+    add_arguments(parser)
+
+    parser.add_argument('--splay', type=float, required=False, default=15,
+                        help='Maximum number of minutes the runs of a service start after their scheduled times, so services on the same schedule don\'t all start at once.  Each service has a fixed offset derived from its URL, less than half the interval of its schedule.  Default: 15.')
+
+    parser.add_argument('--log_file', type=str, required=False,
+                        help='Path of a log file to write the scheduler\'s messages to (as well as the console).  Each service\'s harvests log to \'sensorml2iso-<server>-<hash>.log\' (or its \'log_file\').')
+
+    parser.add_argument('--log_level', type=str, required=False, default='info',
+                        help='Minimum level of the scheduler\'s messages logged [debug|info|warning|error].  Default: \'info\'.')
+
+    args = parser.parse_args(argv)
+    check_arguments(args)
+    if args.splay < 0:
+        sys.exit("Error: '--splay' parameter value must not be negative.  Value passed: {param}".format(param=args.splay))
+    if args.log_level.lower() not in ['debug', 'info', 'warning', 'error']:
+        sys.exit("Error: '--log_level' parameter value must be one of 'debug', 'info', 'warning' or 'error'.  Value passed: {param}".format(param=args.log_level))
+
+    try:
+        config = load_config(args.config)
+    except (IOError, OSError, ValueError) as e:
+        sys.exit("Error: unable to read config file: {config}.  {err}".format(config=args.config, err=str(e)))
+    if not config:
+        sys.exit("Error: config file: {config} lists no SOS services.".format(config=args.config))
+
+    logger = get_logger('sensorml2iso.serve', args.log_file, get_level(args.log_level.lower()))
+    try:
+        server = Server(create_batch(config, args), splay=args.splay * 60, logger=logger)
+    except ValueError as e:
+        close_logger(logger)
+        sys.exit("Error: invalid config file: {config}.  {err}".format(config=args.config, err=str(e)))
+
+    # stop on 'docker stop' (SIGTERM) and Ctrl-C, letting the harvests in progress complete:
+    signal.signal(signal.SIGTERM, server.stop)
+    signal.signal(signal.SIGINT, server.stop)
+    try:
+        server.run()
+    finally:
+        close_logger(logger)
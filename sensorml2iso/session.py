@@ -0,0 +1,87 @@
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ChunkedEncodingError, ConnectionError, Timeout
+
+# HTTP status codes of transient server failures, retried with backoff:
+RETRY_STATUS = [429, 502, 503, 504]
+
+# request exceptions of transient network failures (connection errors and timeouts), retried with backoff:
+RETRY_EXCEPTIONS = (ConnectionError, Timeout, ChunkedEncodingError)
+
+# SensorML and GetCapabilities XML compresses well, so compressed responses are always requested:
+ACCEPT_ENCODING = 'gzip, deflate'
+
+
+def create_session(pool_size=4, pool_hosts=10):
+    """
+    Returns a requests Session keeping up to 'pool_size' connections alive to each of up to 'pool_hosts' hosts, and
+    requesting compressed responses.  Retries are left to RetryPolicy, so the session never retries on its own.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+    return session
+
+
+class RetryPolicy:
+    """
+    Retries requests failing with a transient error (RETRY_EXCEPTIONS, or a RETRY_STATUS response) with jittered
+    exponential backoff: the n-th retry waits a random time up to min(max_backoff, backoff * 2**n) seconds ("full
+    jitter"), so concurrent requests to a struggling server spread out rather than retrying in lockstep.  A
+    Retry-After header (seconds) is honored, up to max_backoff.
+
+    Attributes
+    ----------
+    retries : int
+        Maximum number of retries of a request (not retried if 0).
+    backoff : float
+        Base backoff (seconds).
+    max_backoff : float
+        Maximum wait (seconds) before a retry.
+    """
+
+    def __init__(self, retries=3, backoff=0.5, max_backoff=30.0):
+        """
+        """
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt, retry_after=None):
+        """
+        Returns the time (seconds) to wait before retrying after failed attempt number 'attempt' (from 0).
+        """
+        if retry_after is not None:
+            try:
+                return min(self.max_backoff, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def request(self, send, metrics=None):
+        """
+        Calls 'send' (returning a requests Response) until it succeeds or fails with a non-transient error, retrying
+        transient failures.  Returns the last response, or raises the last exception.  Retries are counted in
+        'metrics' if not None.
+        """
+        attempt = 0
+        while True:
+            try:
+                response = send()
+            except RETRY_EXCEPTIONS:
+                if attempt >= self.retries:
+                    raise
+                wait = self.delay(attempt)
+            else:
+                if response.status_code not in RETRY_STATUS or attempt >= self.retries:
+                    return response
+                wait = self.delay(attempt, response.headers.get('Retry-After'))
+            if metrics is not None:
+                metrics.count('http_retries')
+            time.sleep(wait)
+            attempt += 1
@@ -0,0 +1,36 @@
+import sys
+
+import pytest
+
+from sensorml2iso.batch import Batch, entry_name, service_kwargs
+
+SOS_URL = 'http://sos.example.org/sos/pox'
+
+
+def test_run_errors():
+    # errors are reported per config entry, in config order, including entries without a service and entries for the
+    # same service URL:
+    config = [{'sos_type': 'ioos'},
+              {'service': SOS_URL, 'sos_type': 'other', 'output_dir': 'a'},
+              {'service': SOS_URL, 'sos_type': 'other', 'output_dir': 'b'}]
+    errors = Batch(config).run()
+    assert [(index, service) for index, service, error in errors] == [(0, None), (1, SOS_URL), (2, SOS_URL)]
+    assert all(error.startswith('Invalid config entry') for index, service, error in errors)
+
+
+def test_entry_name():
+    name = entry_name({'service': 'http://sos.example.org:8080/sos/pox'})
+    assert name.startswith('sos.example.org_8080-')
+    assert entry_name({'service': 'http://sos.example.org:8080/sos/pox'}) == name
+    # entries on the same server, or for the same service with other output directories, have other names:
+    assert entry_name({'service': 'http://sos.example.org:8080/other/pox'}) != name
+    assert entry_name({'service': 'http://sos.example.org:8080/sos/pox', 'output_dir': 'a'}) != name
+
+
+def test_asyncio_engine_requires_aiohttp(monkeypatch):
+    # without aiohttp, 'engine: asyncio' entries are rejected up front rather than failing at run time:
+    monkeypatch.setitem(sys.modules, 'aiohttp', None)
+    with pytest.raises(ValueError) as e:
+        service_kwargs({'service': SOS_URL, 'engine': 'asyncio'})
+    assert 'aiohttp' in str(e.value)
+    assert service_kwargs({'service': SOS_URL, 'engine': 'threads'})['engine'] == 'threads'
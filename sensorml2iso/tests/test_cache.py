@@ -0,0 +1,27 @@
+from sensorml2iso.cache import OutputFormatMemo
+
+SOS_URL = 'http://sos.example.org/sos/pox'
+IOOS_FORMAT = 'text/xml; subtype="sensorML/1.0.1/profiles/ioos_sos/1.0"'
+NDBC_FORMAT = 'text/xml;subtype="sensorML/1.0.1"'
+
+
+def test_output_format_memo(tmpdir):
+    memo = OutputFormatMemo(str(tmpdir))
+    assert memo.get(SOS_URL) is None
+    assert memo.order(SOS_URL, [IOOS_FORMAT, NDBC_FORMAT]) == [IOOS_FORMAT, NDBC_FORMAT]
+
+    memo.put(SOS_URL, NDBC_FORMAT)
+    assert memo.order(SOS_URL, [IOOS_FORMAT, NDBC_FORMAT]) == [NDBC_FORMAT, IOOS_FORMAT]
+    # persisted across runs:
+    assert OutputFormatMemo(str(tmpdir)).get(SOS_URL) == NDBC_FORMAT
+
+
+def test_output_format_memo_forget(tmpdir):
+    memo = OutputFormatMemo(str(tmpdir))
+    memo.put(SOS_URL, NDBC_FORMAT)
+    memo.forget(SOS_URL)
+    assert memo.get(SOS_URL) is None
+    assert memo.order(SOS_URL, [IOOS_FORMAT, NDBC_FORMAT]) == [IOOS_FORMAT, NDBC_FORMAT]
+    assert OutputFormatMemo(str(tmpdir)).get(SOS_URL) is None
+    # forgetting an unknown service is a no-op:
+    memo.forget('http://other.example.org/sos')
@@ -0,0 +1,154 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+import pytz
+from owslib.ows import ExceptionReport
+
+from sensorml2iso.capabilities import CapabilitiesSnapshot, OfferingIndex, load_capabilities
+
+SOS_URL = 'http://sos.example.org/sos/pox'
+
+
+def iso(days_ago):
+    return (datetime.now(pytz.utc) - timedelta(days=days_ago)).replace(microsecond=0).isoformat()
+
+
+def entry(end, observed_properties=('sea_water_temperature',)):
+    return {
+        'begin': '2010-01-01T00:00:00+00:00',
+        'end': end,
+        'procedures': ['urn:ioos:station:test:st0001'],
+        'observed_properties': list(observed_properties),
+        'response_formats': ['text/xml;subtype="om/1.0.0"']
+    }
+
+
+def previous_snapshot(tmpdir, stations):
+    CapabilitiesSnapshot(str(tmpdir), SOS_URL).save(stations)
+    return CapabilitiesSnapshot(str(tmpdir), SOS_URL)
+
+
+def test_no_previous_snapshot(tmpdir):
+    diff = CapabilitiesSnapshot(str(tmpdir), SOS_URL).diff({'st1': entry('now')})
+    assert diff.previous is None
+    assert diff.added == ['st1']
+    assert diff.is_changed('st1')
+
+
+def test_diff(tmpdir):
+    snapshot = previous_snapshot(tmpdir, {'st1': entry('now'), 'st2': entry('now'), 'st3': entry('now')})
+    assert snapshot.taken <= time.time()
+    diff = snapshot.diff({'st1': entry('now'), 'st2': entry('now', ['air_temperature']), 'st4': entry('now')})
+    assert diff.added == ['st4']
+    assert diff.removed == ['st3']
+    assert diff.changed == {'st2': ['observed_properties']}
+    assert diff.unchanged == set(['st1'])
+    assert not diff.is_changed('st1')
+    assert diff.is_changed('st2')
+    assert diff.to_dict()['unchanged'] == 1
+
+
+def test_active_station_end(tmpdir):
+    # the end of a station active at the previous run moves forward with each observation, which is not a change:
+    snapshot = previous_snapshot(tmpdir, {'st1': entry(iso(1))})
+    assert snapshot.diff({'st1': entry(iso(0))}).unchanged == set(['st1'])
+    # but an end moving back or becoming indeterminate is:
+    assert snapshot.diff({'st1': entry(iso(2))}).changed == {'st1': ['end']}
+    assert snapshot.diff({'st1': entry('now')}).changed == {'st1': ['end']}
+
+
+def test_inactive_station_end(tmpdir):
+    # an inactive station whose end moves forward was reactivated:
+    snapshot = previous_snapshot(tmpdir, {'st1': entry(iso(365))})
+    assert snapshot.diff({'st1': entry(iso(0))}).changed == {'st1': ['end']}
+    assert snapshot.diff({'st1': entry(iso(365))}).unchanged == set(['st1'])
+
+
+GET_CAPABILITIES = b"""<?xml version="1.0" encoding="UTF-8"?>
+<sos:Capabilities xmlns:sos="http://www.opengis.net/sos/1.0" xmlns:ows="http://www.opengis.net/ows/1.1"
+    xmlns:gml="http://www.opengis.net/gml" xmlns:xlink="http://www.w3.org/1999/xlink" version="1.0.0">
+  <ows:ServiceIdentification>
+    <ows:Title>Test SOS</ows:Title>
+    <ows:Abstract>Test stations</ows:Abstract>
+    <ows:Keywords><ows:Keyword>ocean</ows:Keyword><ows:Keyword>buoy</ows:Keyword></ows:Keywords>
+  </ows:ServiceIdentification>
+  <ows:OperationsMetadata>
+    <ows:Operation name="DescribeSensor">
+      <ows:DCP><ows:HTTP><ows:Get xlink:href="http://sos.example.org/sos/kvp?"/></ows:HTTP></ows:DCP>
+    </ows:Operation>
+  </ows:OperationsMetadata>
+  <sos:Contents>
+    <sos:ObservationOfferingList>
+      <sos:ObservationOffering gml:id="network-all">
+        <gml:name>urn:ioos:network:test:all</gml:name>
+        <sos:time><gml:TimePeriod>
+          <gml:beginPosition>2010-01-01T00:00:00Z</gml:beginPosition>
+          <gml:endPosition indeterminatePosition="now"/>
+        </gml:TimePeriod></sos:time>
+        <sos:procedure xlink:href="urn:ioos:network:test:all"/>
+      </sos:ObservationOffering>
+      <sos:ObservationOffering gml:id="station-st0001">
+        <gml:name>urn:ioos:station:test:st0001</gml:name>
+        <sos:time><gml:TimePeriod>
+          <gml:beginPosition>2010-01-01T00:00:00Z</gml:beginPosition>
+          <gml:endPosition indeterminatePosition="now"/>
+        </gml:TimePeriod></sos:time>
+        <sos:procedure xlink:href="urn:ioos:station:test:st0001"/>
+        <sos:observedProperty xlink:href="http://mmisw.org/ont/cf/parameter/sea_water_temperature"/>
+        <sos:observedProperty xlink:href="http://mmisw.org/ont/cf/parameter/air_temperature"/>
+        <sos:responseFormat>text/xml;subtype="om/1.0.0/profiles/ioos_sos/1.0"</sos:responseFormat>
+      </sos:ObservationOffering>
+      <sos:ObservationOffering gml:id="station-st0002">
+        <gml:name>urn:ioos:station:test:st0002</gml:name>
+        <sos:time><gml:TimePeriod>
+          <gml:beginPosition>2010-01-01T00:00:00Z</gml:beginPosition>
+          <gml:endPosition>2019-01-01T00:00:00Z</gml:endPosition>
+        </gml:TimePeriod></sos:time>
+        <sos:procedure xlink:href="urn:ioos:station:test:st0002"/>
+      </sos:ObservationOffering>
+    </sos:ObservationOfferingList>
+  </sos:Contents>
+</sos:Capabilities>"""
+
+
+def test_load_capabilities():
+    sos = load_capabilities(SOS_URL + '?service=SOS&request=GetCapabilities', GET_CAPABILITIES)
+    assert sos.url == SOS_URL
+    assert sos.identification.title == 'Test SOS'
+    assert sos.identification.abstract == 'Test stations'
+    assert sos.identification.keywords == ['ocean', 'buoy']
+    assert sos.getOperationByName('DescribeSensor').methods == [{'type': 'Get', 'url': 'http://sos.example.org/sos/kvp?'}]
+    assert [offering.id for offering in sos.offerings] == ['network-all', 'station-st0001', 'station-st0002']
+
+    offering = sos.contents['station-st0001']
+    assert offering.name == 'urn:ioos:station:test:st0001'
+    assert offering.procedures == ['urn:ioos:station:test:st0001']
+    assert offering.observed_properties == ['http://mmisw.org/ont/cf/parameter/sea_water_temperature',
+                                            'http://mmisw.org/ont/cf/parameter/air_temperature']
+    assert offering.response_formats == ['text/xml;subtype="om/1.0.0/profiles/ioos_sos/1.0"']
+    assert offering.begin_position.year == 2010
+    assert offering.end_indeterminate == 'now'
+    assert sos.contents['station-st0002'].end_position.year == 2019
+    assert sos.contents['station-st0002'].end_indeterminate is None
+
+
+def test_load_capabilities_exception_report():
+    with pytest.raises(ExceptionReport):
+        load_capabilities(SOS_URL, b"""<?xml version="1.0" encoding="UTF-8"?>
+<ows:ExceptionReport xmlns:ows="http://www.opengis.net/ows/1.1" version="1.0.0">
+  <ows:Exception exceptionCode="NoApplicableCode"><ows:ExceptionText>Unavailable</ows:ExceptionText></ows:Exception>
+</ows:ExceptionReport>""")
+
+
+def test_offering_index_is_inactive():
+    offerings = OfferingIndex(load_capabilities(SOS_URL, GET_CAPABILITIES))
+    active_date = datetime(2020, 1, 1, tzinfo=pytz.utc)
+    assert offerings.get('urn:ioos:station:test:st0001').id == 'station-st0001'
+    assert not offerings.is_inactive('urn:ioos:station:test:st0001', active_date)
+    assert offerings.is_inactive('urn:ioos:station:test:st0002', active_date)
+    assert not offerings.is_inactive('urn:ioos:station:test:st0002', datetime(2018, 1, 1, tzinfo=pytz.utc))
+    # NDBC-style offerings are looked up by 'station-<id>':
+    assert offerings.is_inactive('urn:ioos:station:wmo:st0002', active_date, ndbc=True)
+    # stations without an offering (or whose end is not known) are not known to be inactive:
+    assert not offerings.is_inactive('urn:ioos:station:test:st0003', active_date)
@@ -0,0 +1,70 @@
+import pytest
+from owslib.ows import ExceptionReport
+from owslib.util import ServiceException
+from requests.exceptions import HTTPError
+
+from sensorml2iso.cache import SensorMLCache
+from sensorml2iso.fetch import DescribeSensorFetcher, check_response
+
+OWS_EXCEPTION_REPORT = b"""<?xml version="1.0" encoding="UTF-8"?>
+<ows:ExceptionReport xmlns:ows="{namespace}" version="1.1.0">
+  <ows:Exception exceptionCode="InvalidParameterValue" locator="outputFormat">
+    <ows:ExceptionText>Invalid outputFormat</ows:ExceptionText>
+  </ows:Exception>
+</ows:ExceptionReport>"""
+
+SENSORML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<sml:SensorML xmlns:sml="http://www.opengis.net/sensorML/1.0.1" version="1.0.1"/>"""
+
+
+@pytest.mark.parametrize('namespace', ['http://www.opengis.net/ows/1.1', 'http://www.opengis.net/ows'])
+def test_exception_report(namespace):
+    # ExceptionReports are detected from the document, whatever the Content-Type (eg. 'text/xml;charset=UTF-8'):
+    with pytest.raises(ExceptionReport) as e:
+        check_response(200, OWS_EXCEPTION_REPORT.replace(b'{namespace}', namespace.encode('utf-8')))
+    assert e.value.code == 'InvalidParameterValue'
+    assert e.value.msg == 'Invalid outputFormat'
+
+
+def test_empty_exception_report():
+    with pytest.raises(ServiceException):
+        check_response(200, b'<ows:ExceptionReport xmlns:ows="http://www.opengis.net/ows/1.1"/>')
+
+
+def test_service_exception():
+    content = b'<ServiceExceptionReport><ServiceException> Unknown procedure </ServiceException></ServiceExceptionReport>'
+    with pytest.raises(ServiceException) as e:
+        check_response(200, content)
+    assert str(e.value) == 'Unknown procedure'
+
+
+@pytest.mark.parametrize('status_code, exception', [(400, ServiceException), (503, HTTPError)])
+def test_http_error(status_code, exception):
+    with pytest.raises(exception):
+        check_response(status_code, SENSORML)
+
+
+def test_sensorml():
+    assert check_response(200, SENSORML).tag == '{http://www.opengis.net/sensorML/1.0.1}SensorML'
+
+
+class StubSOS:
+    url = 'http://sos.example.org/sos'
+
+
+@pytest.mark.parametrize('content, cached', [
+    (SENSORML, True),
+    (b'<html><body>Service unavailable</body></html>', False)
+])
+def test_only_sensorml_cached(tmpdir, content, cached):
+    fetcher = DescribeSensorFetcher(cache=SensorMLCache(str(tmpdir)))
+    fetcher.resolve(StubSOS(), 'urn:ioos:station:test:1', 'text/xml', 200, {}, content)
+    assert (fetcher.cache.get(StubSOS.url, 'urn:ioos:station:test:1', 'text/xml')[0] is not None) == cached
+
+
+def test_exception_report_not_cached(tmpdir):
+    fetcher = DescribeSensorFetcher(cache=SensorMLCache(str(tmpdir)))
+    content = OWS_EXCEPTION_REPORT.replace(b'{namespace}', b'http://www.opengis.net/ows/1.1')
+    with pytest.raises(ExceptionReport):
+        fetcher.resolve(StubSOS(), 'urn:ioos:station:test:1', 'text/xml', 200, {}, content)
+    assert fetcher.cache.get(StubSOS.url, 'urn:ioos:station:test:1', 'text/xml') == (None, {})
@@ -0,0 +1,71 @@
+from datetime import datetime
+
+from lxml import etree
+
+from sensorml2iso.journal import Journal
+
+SENSORML = b'<sml:SensorML xmlns:sml="http://www.opengis.net/sensorML/1.0.1" version="1.0.1"/>'
+FORMAT = 'text/xml;subtype="sensorML/1.0.1"'
+METADATA_DATE = datetime(2026, 10, 16, 12, 0, 0)
+
+
+def interrupted_run(tmpdir, options='options'):
+    journal = Journal(str(tmpdir), options)
+    journal.open()
+    journal.fetched('st1', FORMAT, etree.fromstring(SENSORML), [])
+    journal.fetched('st2', None, None, ['Invalid outputFormat'])
+    journal.parsed('st1', True)
+    journal.rendered('st1', 'f1', 'st1.xml', METADATA_DATE)
+    journal.fetched('st3', FORMAT, etree.fromstring(SENSORML), [])
+    # killed without closing the journal
+
+
+def test_resume(tmpdir):
+    interrupted_run(tmpdir)
+    journal = Journal(str(tmpdir), 'options', resume=True)
+    assert journal.resumed
+    assert sorted(journal.sensorml) == ['st1', 'st3']
+    sml, fmt = journal.get_sensorml('st3', [FORMAT])
+    assert fmt == FORMAT
+    assert etree.tostring(sml) == SENSORML
+    # SensorML journaled in another outputFormat than those requested is not reused:
+    assert journal.get_sensorml('st3', ['text/xml']) is None
+    assert journal.get_sensorml('st2', [FORMAT]) is None
+    assert sorted(journal.completed) == ['st1']
+    assert journal.completed['st1']['filename'] == 'st1.xml'
+
+
+def test_resume_appends(tmpdir):
+    interrupted_run(tmpdir)
+    journal = Journal(str(tmpdir), 'options', resume=True)
+    journal.open()
+    journal.rendered('st3', 'f3', 'st3.xml', METADATA_DATE)
+    journal.close()
+    assert sorted(Journal(str(tmpdir), 'options', resume=True).completed) == ['st1', 'st3']
+
+
+def test_torn_record(tmpdir):
+    interrupted_run(tmpdir)
+    with open(str(tmpdir.join(Journal.FILENAME)), 'ab') as f:
+        f.write(b'{"station":"st3","stage":"ren')
+    journal = Journal(str(tmpdir), 'options', resume=True)
+    assert journal.resumed
+    assert sorted(journal.completed) == ['st1']
+
+
+def test_not_resumed(tmpdir):
+    interrupted_run(tmpdir)
+    # not asked to resume, or written with other options:
+    assert not Journal(str(tmpdir), 'options').resumed
+    journal = Journal(str(tmpdir), 'other options', resume=True)
+    assert not journal.resumed
+    assert journal.sensorml == {} and journal.completed == {}
+
+
+def test_close_complete(tmpdir):
+    journal = Journal(str(tmpdir), 'options')
+    journal.open()
+    journal.parsed('st1', True)
+    journal.close(complete=True)
+    assert not tmpdir.join(Journal.FILENAME).exists()
+    assert not Journal(str(tmpdir), 'options', resume=True).resumed
@@ -0,0 +1,51 @@
+from datetime import datetime
+
+from sensorml2iso.manifest import Manifest, fingerprint, template_checksum
+
+METADATA_DATE = datetime(2026, 10, 16, 12, 0, 0)
+
+
+def test_fingerprint():
+    assert fingerprint({'a': 1, 'b': [1, 2]}, 'x') == fingerprint({'b': [1, 2], 'a': 1}, 'x')
+    assert fingerprint({'a': 1}, 'x') != fingerprint({'a': 2}, 'x')
+
+
+def test_template_checksum(tmpdir):
+    tmpdir.join('iso.xml').write('{{ station }}')
+    checksum = template_checksum(str(tmpdir))
+    assert template_checksum(str(tmpdir)) == checksum
+    tmpdir.join('iso.xml').write('{{ station }} ')
+    assert template_checksum(str(tmpdir)) != checksum
+
+
+def test_unchanged(tmpdir):
+    manifest = Manifest(str(tmpdir))
+    assert not manifest.unchanged('st1', 'f1', 'st1.xml')
+    tmpdir.join('st1.xml').write('<a/>')
+    manifest.update('st1', 'f1', 'st1.xml', METADATA_DATE)
+    manifest.save()
+
+    manifest = Manifest(str(tmpdir))
+    assert manifest.entries['st1']['metadataDate'] == METADATA_DATE.isoformat()
+    assert manifest.unchanged('st1', 'f1', 'st1.xml')
+    assert not manifest.unchanged('st1', 'f2', 'st1.xml')
+    assert not manifest.unchanged('st1', 'f1', 'other.xml')
+    # a record removed from the output directory is rendered again:
+    tmpdir.join('st1.xml').remove()
+    assert not manifest.unchanged('st1', 'f1', 'st1.xml')
+
+
+def test_removed_and_current(tmpdir):
+    manifest = Manifest(str(tmpdir))
+    for station_urn in ['st1', 'st2', 'st3']:
+        manifest.update(station_urn, 'f', station_urn + '.xml', METADATA_DATE)
+    manifest.save()
+
+    # next run: st1 is unchanged, st2 failed, st3 is no longer output
+    manifest = Manifest(str(tmpdir))
+    manifest.retain('st1')
+    assert manifest.removed() == {'st2': 'st2.xml', 'st3': 'st3.xml'}
+    assert sorted(manifest.current(kept=['st2'])) == ['st1.xml', 'st2.xml']
+    manifest.remove('st3')
+    manifest.save()
+    assert sorted(Manifest(str(tmpdir)).entries) == ['st1', 'st2']
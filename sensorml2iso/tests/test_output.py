@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from sensorml2iso.output import OutputWriter
+
+
+def listing(tmpdir):
+    return sorted(os.listdir(str(tmpdir)))
+
+
+@pytest.mark.parametrize('fsync', ['none', 'always'])
+def test_write_unbatched(tmpdir, fsync):
+    writer = OutputWriter(str(tmpdir), fsync=fsync)
+    assert writer.write('a.xml', u'<a/>', 'a') == [('a', None)]
+    assert listing(tmpdir) == ['a.xml']
+    assert writer.close() == []
+
+
+def test_write_batch(tmpdir):
+    writer = OutputWriter(str(tmpdir), fsync='batch', batch_size=2)
+    assert writer.write('a.xml', u'<a/>', 'a') == []
+    # records are only written (renamed into place) once their batch is complete:
+    assert listing(tmpdir) == []
+    assert writer.write('b.xml', u'<b/>', 'b') == [('a', None), ('b', None)]
+    assert writer.write('c.xml', u'<c/>', 'c') == []
+    assert writer.close() == [('c', None)]
+    assert listing(tmpdir) == ['a.xml', 'b.xml', 'c.xml']
+    assert tmpdir.join('b.xml').read() == '<b/>'
+
+
+def test_write_error(tmpdir):
+    # a record that can't be renamed into place fails alone, leaving no temporary file behind:
+    tmpdir.mkdir('b.xml')
+    writer = OutputWriter(str(tmpdir), fsync='batch', batch_size=3)
+    writer.write('a.xml', u'<a/>', 'a')
+    writer.write('b.xml', u'<b/>', 'b')
+    results = writer.write('c.xml', u'<c/>', 'c')
+    assert [item for item, error in results if error is None] == ['a', 'c']
+    assert listing(tmpdir) == ['a.xml', 'b.xml', 'c.xml']
+
+
+def test_write_batch_fsync_error(tmpdir, monkeypatch):
+    # a record that can't be flushed to disk fails alone, and is never renamed into place:
+    from sensorml2iso import output
+    fsync_file = output.fsync_file
+    calls = []
+
+    def failing_fsync_file(path):
+        calls.append(path)
+        if len(calls) == 2:
+            raise OSError('fsync failed')
+        fsync_file(path)
+
+    monkeypatch.setattr(output, 'fsync_file', failing_fsync_file)
+    writer = OutputWriter(str(tmpdir), fsync='batch', batch_size=3)
+    writer.write('a.xml', u'<a/>', 'a')
+    writer.write('b.xml', u'<b/>', 'b')
+    results = writer.write('c.xml', u'<c/>', 'c')
+    assert [item for item, error in results if error is None] == ['a', 'c']
+    assert listing(tmpdir) == ['a.xml', 'c.xml']
+
+
+def test_write_temp_removed(tmpdir, monkeypatch):
+    # a temporary file already gone when its rename fails doesn't lose the results of the rest of the batch:
+    from sensorml2iso import output
+
+    def failing_replace(src, dst):
+        os.remove(src)
+        raise OSError('rename failed')
+
+    monkeypatch.setattr(output, 'replace', failing_replace)
+    writer = OutputWriter(str(tmpdir), fsync='batch', batch_size=2)
+    writer.write('a.xml', u'<a/>', 'a')
+    results = writer.write('b.xml', u'<b/>', 'b')
+    assert [item for item, error in results] == ['a', 'b']
+    assert all(error is not None for item, error in results)
+    assert listing(tmpdir) == []
@@ -0,0 +1,27 @@
+import threading
+
+from sensorml2iso import render
+
+
+def test_render_all_workers_while_locked(tmpdir):
+    # rendering workers must not inherit locks held by other threads of the harvesting process (eg. another service
+    # of a batch compiling its template):
+    tmpdir.join(render.TEMPLATE_NAME).write(u'<station>{{ name }}</station>')
+    results = []
+
+    def run():
+        contexts = [{'name': 'st{index}'.format(index=index)} for index in range(8)]
+        results.extend(render.render_all(iter(contexts), workers=2, template_dir=str(tmpdir)))
+
+    with render._environments_lock:
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        thread.join(60)
+        assert not thread.is_alive(), "rendering workers deadlocked"
+    assert results == [u'<station>st{index}</station>'.format(index=index) for index in range(8)]
+
+
+def test_render_all_in_process(tmpdir):
+    tmpdir.join(render.TEMPLATE_NAME).write(u'<station>{{ name }}</station>')
+    assert list(render.render_all(iter([{'name': 'a&b'}]), template_dir=str(tmpdir))) == [u'<station>a&amp;b</station>']
@@ -0,0 +1,83 @@
+import logging
+import threading
+from datetime import datetime
+
+import pytest
+
+from sensorml2iso.serve import Schedule, Server
+
+
+def test_every_15_minutes():
+    schedule = Schedule('*/15 * * * *')
+    assert schedule.next(datetime(2026, 10, 17, 10, 7, 30)) == datetime(2026, 10, 17, 10, 15)
+    # the next time is strictly after 'after':
+    assert schedule.next(datetime(2026, 10, 17, 10, 15)) == datetime(2026, 10, 17, 10, 30)
+    assert schedule.next(datetime(2026, 10, 17, 23, 50)) == datetime(2026, 10, 18, 0, 0)
+    assert schedule.interval(datetime(2026, 10, 17, 10, 0)) == 15 * 60
+
+
+def test_aliases():
+    assert Schedule('@daily').next(datetime(2026, 10, 17, 10, 0)) == datetime(2026, 10, 18, 0, 0)
+    assert Schedule('@hourly').next(datetime(2026, 10, 17, 10, 0)) == datetime(2026, 10, 17, 11, 0)
+    assert Schedule('@monthly').next(datetime(2026, 10, 17, 10, 0)) == datetime(2026, 11, 1, 0, 0)
+
+
+def test_ranges_and_lists():
+    schedule = Schedule('0,30 8-17/3 * * *')
+    assert sorted(schedule.hours) == [8, 11, 14, 17]
+    assert schedule.minutes == [0, 30]
+    assert schedule.next(datetime(2026, 10, 17, 17, 30)) == datetime(2026, 10, 18, 8, 0)
+
+
+def test_day_fields():
+    # 2026-10-17 is a Saturday; day of week 0 and 7 are both Sunday:
+    assert Schedule('0 6 * * 0').next(datetime(2026, 10, 17)) == datetime(2026, 10, 18, 6, 0)
+    assert Schedule('0 6 * * 7').next(datetime(2026, 10, 17)) == datetime(2026, 10, 18, 6, 0)
+    # with both day fields restricted, either matches (as in cron):
+    assert Schedule('0 6 20 * 1').next(datetime(2026, 10, 17)) == datetime(2026, 10, 19, 6, 0)
+    assert Schedule('0 6 18 * 5').next(datetime(2026, 10, 17)) == datetime(2026, 10, 18, 6, 0)
+    # February 29th only fires in leap years:
+    assert Schedule('0 0 29 2 *').next(datetime(2026, 10, 17)) == datetime(2028, 2, 29, 0, 0)
+
+
+@pytest.mark.parametrize('expression', ['* * * *', '60 * * * *', '* 24 * * *', '0 0 0 * *', '*/0 * * * *',
+                                        '5-1 * * * *', 'a * * * *', '0 0 30 2 *'])
+def test_invalid(expression):
+    with pytest.raises(ValueError):
+        Schedule(expression)
+
+
+class StubBatch:
+    """
+    Batch whose runs block until released, recording the config entries harvested.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.harvested = []
+        self.release = threading.Event()
+
+    def run_service(self, config_entry):
+        self.harvested.append(config_entry['output_dir'])
+        self.release.wait(30)
+        return config_entry['service'], None
+
+
+def test_server_runs_entries_independently():
+    # entries for the same service URL (eg. other output directories) are distinct, only a config entry's own run in
+    # progress skips its scheduled runs:
+    service = 'http://sos.example.org/sos/pox'
+    batch = StubBatch([{'service': service, 'output_dir': 'a', 'schedule': '@hourly'},
+                       {'service': service, 'output_dir': 'b', 'schedule': '@hourly'}])
+    server = Server(batch, logger=logging.getLogger('test_serve'))
+    server.start(0)
+    server.start(1)
+    server.start(0)
+    with server.lock:
+        threads = list(server.running.values())
+    assert sorted(server.running) == [0, 1]
+    batch.release.set()
+    for thread in threads:
+        thread.join(30)
+    assert sorted(batch.harvested) == ['a', 'b']
+    assert server.running == {}
@@ -0,0 +1,76 @@
+import errno
+import os
+import tempfile
+import time
+from collections import deque
+
+
+def atomic_write(path, data):
+    """
+    Writes 'data' (bytes) to 'path' via a temporary file renamed into place, so readers never see a partial file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)
+        replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def replace(src, dst):
+    """
+    Renames 'src' to 'dst', overwriting 'dst' if it exists (os.replace is not available in Python 2).
+    """
+    try:
+        os.replace(src, dst)
+    except AttributeError:
+        if os.name == 'nt' and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+def makedirs(path):
+    """
+    Creates directory 'path' (and parents) if it does not already exist.
+    """
+    try:
+        os.makedirs(path)
+    except OSError as ex:
+        if ex.errno != errno.EEXIST or not os.path.isdir(path):
+            raise
+
+
+def imap_bounded(pool, func, items, window):
+    """
+    Lazily applies 'func' to each of 'items' on 'pool' (a process or thread pool), yielding the results in the order of
+    'items'.  At most 'window' items are submitted ahead of the consumer, so memory use does not grow with the number
+    of items (unlike Pool.imap, which submits every item up front).
+    """
+    pending = deque()
+    for item in items:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def timed(iterable, record):
+    """
+    Yields the items of 'iterable', calling 'record' with the time (seconds) spent producing each item (and the time
+    spent finding it exhausted).
+    """
+    iterator = iter(iterable)
+    while True:
+        start = time.time()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            record(time.time() - start)
+            return
+        record(time.time() - start)
+        yield item
@@ -43,5 +43,10 @@ kwargs = {
 
 kwargs['install_requires'] = reqs
 
+# the 'asyncio' harvesting engine ('--engine asyncio') requires aiohttp, only available on Python 3.5+:
+kwargs['extras_require'] = {
+    'asyncio': ['aiohttp; python_version >= "3.5"']
+}
+
 
 setup(**kwargs)